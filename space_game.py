@@ -1,12 +1,32 @@
 import pygame
+import numpy as np
 import math
 import random
 import sys
 import json
 import os
+import argparse
+import array
+import copy
+import bisect
+import time
+import queue
+import threading
+import struct
+import zlib
+import weakref
+from collections import OrderedDict, deque
 
-# Инициализация Pygame
-pygame.init()
+# Инициализация Pygame - не при импорте, а при первом обращении к экрану или шрифтам,
+# чтобы модуль можно было загрузить без окна (бенчмарки, сравнение кадров)
+def init_pygame(headless=False):
+    if pygame.get_init():
+        return
+    if headless:
+        # Без окна: SDL рисует в память, годится для машины без дисплея
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pygame.init()
 
 # Константы
 SCREEN_WIDTH = 800
@@ -28,8 +48,1806 @@ DARK_GRAY = (64, 64, 64)
 PINK = (255, 192, 203)
 BROWN = (139, 69, 19)
 
+# Уровни, где игрок выводится запеченным спрайтом
+BAKED_PLAYER_LEVELS = ("racing", "puzzle", "tower_defense", "stealth", "fighting", "strategy")
+
+# Внешний вид охранников: размер, цвет формы, цвет оружия
+GUARD_STYLES = {
+    "patrol": (25, (100, 100, 150), (80, 80, 80)),   # Синяя форма
+    "office": (28, (80, 80, 120), (60, 60, 60)),     # Темно-синяя форма
+    "elite": (32, (120, 80, 80), (40, 40, 40)),      # Красная элитная форма
+    "sniper": (30, (60, 60, 60), (30, 30, 30)),      # Черная форма снайпера
+}
+
+# Половина размера спрайтов охранников и юнитов (с запасом на оружие)
+GUARD_SPRITE_RADIUS = 48
+UNIT_SPRITE_RADIUS = 24
+
+# Сколько меню ждет событий (мс), прежде чем проверить состояние еще раз
+MENU_IDLE_TIMEOUT = 500
+
 # Файл для сохранения прогресса
 SAVE_FILE = "game_progress.json"
+# Быстрое сохранение уровня (F5 - сохранить, F9 - загрузить)
+QUICKSAVE_FILE = "quicksave.dat"
+
+# Уровни без анимированного фона, где можно обновлять только изменившиеся области
+DIRTY_RECT_LEVELS = ("puzzle", "racing", "rhythm", "tower_defense", "strategy")
+
+# Частота симуляции: вся игровая логика рассчитана на 60 тиков в секунду
+TICK_RATE = 60
+# Сколько тиков можно догнать за один кадр (дальше игра замедляется, а не зависает)
+MAX_TICKS_PER_FRAME = 5
+# Перемещение больше этого за тик считается телепортом и не сглаживается
+TELEPORT_DISTANCE = 100
+
+# Списки объектов, положение которых сглаживается между тиками
+INTERPOLATED_LISTS = ("bots",)
+# Хранилища сущностей (EntityStore, ProjectileSystem), которые тоже сглаживаются
+ENTITY_STORES = ("racing_obstacles", "rhythm_notes", "missiles", "zombies", "enemies", "guards",
+                 "units", "enemy_units", "projectiles")
+
+# Уровни качества декоративной отрисовки
+QUALITY_LOW = 0
+QUALITY_MEDIUM = 1
+QUALITY_HIGH = 2
+QUALITY_NAMES = ("НИЗКОЕ", "СРЕДНЕЕ", "ВЫСОКОЕ")
+QUALITY_OPTIONS = {"low": QUALITY_LOW, "medium": QUALITY_MEDIUM, "high": QUALITY_HIGH}
+
+# Доля декоративных элементов, которая рисуется на каждом уровне качества (низкое, среднее, высокое)
+DECORATION_DENSITY = {
+    "stars": (0.25, 0.5, 1.0),          # Звезды в шутере и платформере
+    "star_twinkle": (0.0, 0.0, 1.0),    # Блики и мерцающие звезды
+    "ash": (0.0, 0.5, 1.0),             # Пыль и пепел в выживании
+    "flicker": (0.0, 1.0, 1.0),         # Мерцающие окна и огонь в машинах
+    "city_windows": (0.0, 0.5, 1.0),    # Огни города в стелсе
+}
+
+# Сколько кадров усредняется перед решением о смене качества
+QUALITY_WINDOW = 30
+# Качество понижается, если кадр дольше этой доли бюджета, и повышается, если короче
+QUALITY_DOWNGRADE_LOAD = 0.9
+QUALITY_UPGRADE_LOAD = 0.5
+
+class GameSettings:
+    # Настройки запуска (заполняются из командной строки)
+    def __init__(self):
+        self.dirty_rects = False
+        # Если изменилась большая доля экрана, дешевле обновить его целиком
+        self.dirty_rect_threshold = 0.5
+        # Частота отрисовки не связана с частотой симуляции (0 - без ограничения)
+        self.render_fps = FPS
+        self.tick_rate = TICK_RATE
+        self.interpolate = True
+        # "auto" - качество подбирается по времени кадра
+        self.quality = "auto"
+        # Размер окна. Уровни построены в координатах SCREEN_WIDTH x SCREEN_HEIGHT,
+        # а готовый холст растягивается до окна
+        self.window_width = SCREEN_WIDTH
+        self.window_height = SCREEN_HEIGHT
+        # Внутреннее разрешение относительно SCREEN_WIDTH x SCREEN_HEIGHT: при 0.5
+        # холст 400x300 - рисуется вчетверо меньше пикселей, окно остается прежним
+        self.render_scale = 1.0
+        # "integer" - целый масштаб без сглаживания (быстро), "smooth" - сглаженный на все окно
+        self.scale_mode = "integer"
+        # Без окна: кадры рисуются в память и никуда не выводятся
+        self.headless = False
+        # Запись кадров для QA: каталог для PNG или файл/пайп для сырых кадров
+        self.record = None
+        self.record_format = "png"
+        # Зерно случайных чисел уровней (None - новое при каждом запуске)
+        self.seed = None
+
+    def apply_args(self, args):
+        self.dirty_rects = args.dirty_rects
+        self.render_fps = args.fps
+        self.interpolate = not args.no_interpolation
+        self.quality = args.quality
+        self.window_width = int(SCREEN_WIDTH * args.window_scale)
+        self.window_height = int(SCREEN_HEIGHT * args.window_scale)
+        self.render_scale = args.render_scale
+        self.scale_mode = args.scale_mode
+        self.headless = args.headless
+        self.record = args.record
+        self.record_format = args.record_format
+        self.seed = args.seed
+
+    def get_window_size(self):
+        return (self.window_width, self.window_height)
+
+    def get_canvas_size(self):
+        return (max(1, round(SCREEN_WIDTH * self.render_scale)), max(1, round(SCREEN_HEIGHT * self.render_scale)))
+
+settings = GameSettings()
+
+# Именованные потоки случайных чисел уровня: появление объектов, решения
+# противников и декоративные мелочи
+RANDOM_STREAMS = ("spawn", "ai", "cosmetic")
+
+class RandomStreams:
+    # Отдельный генератор на каждую подсистему, чтобы лишний вызов в одной
+    # (например, в декоре) не сдвигал последовательность другой.
+    # Одно зерно и уровень - всегда одна и та же история появления объектов
+    def __init__(self, seed, level):
+        self.seed = seed
+        for name in RANDOM_STREAMS:
+            setattr(self, name, random.Random(f"{seed}:{level}:{name}"))
+
+class QualityGovernor:
+    # Следит за временем кадра и отключает или прореживает декоративную
+    # отрисовку (звезды, пепел, огни окон), пока кадр не уложится в бюджет
+    def __init__(self, window=QUALITY_WINDOW):
+        self.tier = QUALITY_HIGH
+        self.fixed = False
+        self.frame_times = deque(maxlen=window)
+        self.downgrades = 0
+        self.upgrades = 0
+
+    def configure(self, quality):
+        self.frame_times.clear()
+        self.fixed = quality != "auto"
+        self.tier = QUALITY_OPTIONS.get(quality, QUALITY_HIGH)
+
+    def get_budget(self):
+        # Без ограничения FPS держим хотя бы стандартные 60 кадров
+        render_fps = settings.render_fps if settings.render_fps > 0 else FPS
+        return 1000.0 / render_fps
+
+    def record(self, frame_ms):
+        if self.fixed:
+            return
+        self.frame_times.append(frame_ms)
+        if len(self.frame_times) < self.frame_times.maxlen:
+            return
+        
+        # Между порогами понижения и повышения качество не меняется,
+        # а после смены набираем новое окно - так уровень не "дребезжит"
+        load = self.get_average() / self.get_budget()
+        if load > QUALITY_DOWNGRADE_LOAD and self.tier > QUALITY_LOW:
+            self.tier -= 1
+            self.downgrades += 1
+            self.frame_times.clear()
+        elif load < QUALITY_UPGRADE_LOAD and self.tier < QUALITY_HIGH:
+            self.tier += 1
+            self.upgrades += 1
+            self.frame_times.clear()
+
+    def get_average(self):
+        if not self.frame_times:
+            return 0.0
+        return sum(self.frame_times) / len(self.frame_times)
+
+    def get_density(self, tag):
+        return DECORATION_DENSITY[tag][self.tier]
+
+    def count(self, tag, total):
+        # Сколько элементов из total рисовать на текущем уровне качества
+        return int(total * self.get_density(tag))
+
+    def keep(self, tag, index):
+        # Равномерное прореживание: оставляем примерно долю density элементов
+        density = self.get_density(tag)
+        if density >= 1.0:
+            return True
+        return (index * 37) % 100 < density * 100
+
+    def get_name(self):
+        return QUALITY_NAMES[self.tier]
+
+    def get_stats(self):
+        return {
+            "tier": self.tier,
+            "name": self.get_name(),
+            "fixed": self.fixed,
+            "average_frame_ms": self.get_average(),
+            "budget_ms": self.get_budget(),
+            "downgrades": self.downgrades,
+            "upgrades": self.upgrades,
+        }
+
+quality = QualityGovernor()
+
+# Цвет-ключ для прозрачных слоев (не используется в отрисовке сцен)
+LAYER_COLORKEY = (255, 0, 255)
+
+class SurfaceFactory:
+    # Создает поверхности сразу в формате экрана: blit между поверхностями
+    # одного формата идет быстрым путем, без перевода каждого пикселя.
+    # Виды: "opaque" - непрозрачная, "colorkey" - с цветом-ключом,
+    # "alpha" - с попиксельной прозрачностью
+    def __init__(self):
+        self.overlays = {}
+        self.panels = {}
+        self.scaled = weakref.WeakKeyDictionary()
+
+    def create(self, size, kind="opaque", colorkey=LAYER_COLORKEY):
+        if kind == "alpha":
+            surface = pygame.Surface(size, pygame.SRCALPHA)
+        else:
+            surface = pygame.Surface(size)
+        surface = self.convert(surface, kind)
+        if kind == "colorkey":
+            surface.set_colorkey(colorkey)
+        return surface
+
+    def create_canvas(self, size, kind="opaque", colorkey=LAYER_COLORKEY):
+        # Поверхность, в которую рисуют в логических координатах (слои, фон меню):
+        # при пониженном внутреннем разрешении она сразу создается в его масштабе
+        scale = settings.render_scale
+        if scale == 1:
+            return self.create(size, kind, colorkey)
+        scaled_size = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+        return ScaledCanvas(self.create(scaled_size, kind, colorkey), scale)
+
+    def get_scaled(self, source, scale):
+        # Копия поверхности в масштабе уменьшенного холста. Спрайты и надписи
+        # берутся из кэшей и после создания не меняются - масштабируются один раз
+        scaled = self.scaled.get(source)
+        if scaled is None:
+            width, height = source.get_size()
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            colorkey = source.get_colorkey()
+            if colorkey is None and source.get_bytesize() == 4:
+                scaled = pygame.transform.smoothscale(source, size)
+            else:
+                # Сглаживание смешало бы цвет-ключ с соседними пикселями
+                scaled = pygame.transform.scale(source, size)
+                scaled.set_colorkey(colorkey)
+            self.scaled[source] = scaled
+        # Общая прозрачность меняется на лету (вспышка тревоги)
+        alpha = source.get_alpha()
+        if scaled.get_alpha() != alpha:
+            scaled.set_alpha(alpha)
+        return scaled
+
+    def convert(self, surface, kind="opaque"):
+        # В формат экрана можно перевести только после создания окна
+        if pygame.display.get_surface() is None:
+            return surface
+        if kind == "alpha":
+            return surface.convert_alpha()
+        return surface.convert()
+
+    def get_overlay(self, color, alpha, size=None):
+        # Полупрозрачная заливка всего экрана (вспышка тревоги и т.п.):
+        # одна поверхность на цвет, меняется только общая прозрачность
+        size = size or (SCREEN_WIDTH, SCREEN_HEIGHT)
+        key = (size, tuple(color))
+        overlay = self.overlays.get(key)
+        if overlay is None:
+            overlay = self.create(size)
+            overlay.fill(color)
+            self.overlays[key] = overlay
+        overlay.set_alpha(alpha)
+        return overlay
+
+    def get_panel(self, size, color, alpha):
+        # Полупрозрачный прямоугольник (фон панелей интерфейса)
+        key = (tuple(size), tuple(color), alpha)
+        panel = self.panels.get(key)
+        if panel is None:
+            panel = self.create(size)
+            panel.fill(color)
+            panel.set_alpha(alpha)
+            self.panels[key] = panel
+        return panel
+
+    def clear(self):
+        self.overlays.clear()
+        self.panels.clear()
+        self.scaled.clear()
+
+surfaces = SurfaceFactory()
+
+def scale_rect(rect, scale):
+    # Прямоугольник из логических координат в координаты уменьшенного холста.
+    # Края округляются по отдельности, чтобы соседние прямоугольники не расходились
+    rect = pygame.Rect(rect)
+    left, top = round(rect.x * scale), round(rect.y * scale)
+    width = round(rect.right * scale) - left
+    height = round(rect.bottom * scale) - top
+    return pygame.Rect(left, top, max(width, 1 if rect.width > 0 else 0), max(height, 1 if rect.height > 0 else 0))
+
+def cover_rect(rect, scale):
+    # Прямоугольник, целиком покрывающий rect после перевода в масштаб scale
+    left, top = math.floor(rect.x * scale), math.floor(rect.y * scale)
+    return pygame.Rect(left, top, math.ceil(rect.right * scale) - left, math.ceil(rect.bottom * scale) - top)
+
+def scale_length(length, scale):
+    # Радиус или толщина линии: 0 и меньше сохраняют смысл (заливка, ничего не рисовать)
+    if length <= 0:
+        return length
+    return max(1, round(length * scale))
+
+class ScaledCanvas:
+    # Холст с пониженным внутренним разрешением (--render-scale). Уровни рисуют
+    # в логических координатах SCREEN_WIDTH x SCREEN_HEIGHT, а холст переводит
+    # координаты, размеры и выводимые поверхности в свой масштаб. Возвращаемые
+    # области - снова в логических координатах (для DirtyRectRenderer)
+    def __init__(self, surface, scale):
+        self.surface = surface
+        self.scale = scale
+        self.size = (round(surface.get_width() / scale), round(surface.get_height() / scale))
+
+    def get_size(self):
+        return self.size
+
+    def get_width(self):
+        return self.size[0]
+
+    def get_height(self):
+        return self.size[1]
+
+    def get_rect(self):
+        return pygame.Rect((0, 0), self.size)
+
+    def get_bytesize(self):
+        return self.surface.get_bytesize()
+
+    def to_surface(self, pos):
+        return (round(pos[0] * self.scale), round(pos[1] * self.scale))
+
+    def to_logical(self, rect):
+        return cover_rect(rect, 1 / self.scale)
+
+    def get_source(self, source):
+        if isinstance(source, ScaledCanvas):
+            return source.surface
+        return surfaces.get_scaled(source, self.scale)
+
+    def fill(self, color, rect=None, special_flags=0):
+        if rect is not None:
+            rect = scale_rect(rect, self.scale)
+        return self.to_logical(self.surface.fill(color, rect, special_flags))
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        if area is not None:
+            area = scale_rect(area, self.scale)
+        rect = self.surface.blit(self.get_source(source), self.to_surface(dest), area, special_flags)
+        return self.to_logical(rect)
+
+    def blits(self, blit_sequence, doreturn=True):
+        rects = self.surface.blits([(self.get_source(source), self.to_surface(dest))
+                                    for source, dest in blit_sequence], doreturn)
+        if doreturn:
+            return [self.to_logical(rect) for rect in rects]
+        return None
+
+class CanvasDraw:
+    # pygame.draw для всех поверхностей игры: обычные передаются как есть,
+    # а на ScaledCanvas координаты, радиусы и толщины переводятся в его масштаб
+    def rect(self, surface, color, rect, width=0):
+        if type(surface) is not ScaledCanvas:
+            return pygame.draw.rect(surface, color, rect, width)
+        scale = surface.scale
+        return surface.to_logical(pygame.draw.rect(surface.surface, color, scale_rect(rect, scale),
+                                                   scale_length(width, scale)))
+
+    def circle(self, surface, color, center, radius, width=0):
+        if type(surface) is not ScaledCanvas:
+            return pygame.draw.circle(surface, color, center, radius, width)
+        scale = surface.scale
+        return surface.to_logical(pygame.draw.circle(surface.surface, color, surface.to_surface(center),
+                                                     scale_length(radius, scale), scale_length(width, scale)))
+
+    def ellipse(self, surface, color, rect, width=0):
+        if type(surface) is not ScaledCanvas:
+            return pygame.draw.ellipse(surface, color, rect, width)
+        scale = surface.scale
+        return surface.to_logical(pygame.draw.ellipse(surface.surface, color, scale_rect(rect, scale),
+                                                      scale_length(width, scale)))
+
+    def line(self, surface, color, start_pos, end_pos, width=1):
+        if type(surface) is not ScaledCanvas:
+            return pygame.draw.line(surface, color, start_pos, end_pos, width)
+        return surface.to_logical(pygame.draw.line(surface.surface, color, surface.to_surface(start_pos),
+                                                   surface.to_surface(end_pos), scale_length(width, surface.scale)))
+
+    def lines(self, surface, color, closed, points, width=1):
+        if type(surface) is not ScaledCanvas:
+            return pygame.draw.lines(surface, color, closed, points, width)
+        return surface.to_logical(pygame.draw.lines(surface.surface, color, closed,
+                                                    [surface.to_surface(point) for point in points],
+                                                    scale_length(width, surface.scale)))
+
+    def polygon(self, surface, color, points, width=0):
+        if type(surface) is not ScaledCanvas:
+            return pygame.draw.polygon(surface, color, points, width)
+        return surface.to_logical(pygame.draw.polygon(surface.surface, color,
+                                                      [surface.to_surface(point) for point in points],
+                                                      scale_length(width, surface.scale)))
+
+# Все draw_* рисуют через эту обертку, а не прямо через pygame.draw
+draw = CanvasDraw()
+
+class RenderLayer:
+    def __init__(self, name, kind, draw_fn, key_fn=None, size=None, offset_fn=None, transparent=False):
+        self.name = name
+        self.kind = kind  # "static", "cached" или "dynamic"
+        self.draw_fn = draw_fn
+        self.key_fn = key_fn
+        self.size = size
+        self.offset_fn = offset_fn
+        self.transparent = transparent
+        self.surface = None
+        self.key = None
+
+    def render(self):
+        # Перерисовываем содержимое слоя в его собственную поверхность
+        if self.surface is None:
+            self.surface = surfaces.create_canvas(self.size, "colorkey" if self.transparent else "opaque")
+        if self.transparent:
+            self.surface.fill(LAYER_COLORKEY)
+        if self.kind == "cached":
+            self.draw_fn(self.surface, self.key)
+        else:
+            self.draw_fn(self.surface)
+
+class LayerCompositor:
+    # Собирает кадр из слоев: статичные и медленно меняющиеся слои рисуются
+    # один раз в кэшированные поверхности, динамические - каждый кадр
+    def __init__(self, size):
+        self.size = size
+        self.layers = []
+
+    def add_static(self, name, draw_fn, size=None, offset_fn=None, transparent=False):
+        # Рисуется один раз за уровень
+        layer = RenderLayer(name, "static", draw_fn, size=size or self.size,
+                            offset_fn=offset_fn, transparent=transparent)
+        self.layers.append(layer)
+        return layer
+
+    def add_cached(self, name, draw_fn, key_fn, transparent=False):
+        # Перерисовывается только когда меняется ключ (параметр сцены)
+        layer = RenderLayer(name, "cached", draw_fn, key_fn=key_fn, size=self.size,
+                            transparent=transparent)
+        self.layers.append(layer)
+        return layer
+
+    def add_dynamic(self, name, draw_fn):
+        # Рисуется прямо на экран каждый кадр
+        layer = RenderLayer(name, "dynamic", draw_fn)
+        self.layers.append(layer)
+        return layer
+
+    def get_layer(self, name):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        return None
+
+    def invalidate(self, name=None):
+        # Сбрасываем кэш слоя (или всех слоев) - он будет перерисован
+        for layer in self.layers:
+            if name is None or layer.name == name:
+                layer.key = None
+                layer.surface = None
+
+    def covers_screen(self):
+        # Первый непрозрачный кэшированный слой размером с экран заменяет заливку фона
+        if not self.layers:
+            return False
+        first = self.layers[0]
+        return (first.kind != "dynamic" and not first.transparent and
+                first.offset_fn is None and first.size == self.size)
+
+    def render(self, target):
+        if not self.covers_screen():
+            target.fill(BLACK)
+
+        for layer in self.layers:
+            if layer.kind == "dynamic":
+                layer.draw_fn(target)
+                continue
+
+            if layer.kind == "cached":
+                key = layer.key_fn()
+                if layer.surface is None or key != layer.key:
+                    layer.key = key
+                    layer.render()
+            elif layer.surface is None:
+                layer.render()
+
+            offset = layer.offset_fn() if layer.offset_fn else (0, 0)
+            target.blit(layer.surface, offset)
+
+class Display:
+    # Окно игры и холст, в который рисуют все draw_*. Если размер окна
+    # совпадает с холстом, холст - это сама поверхность окна и масштабирования нет.
+    # size - логический размер (в нем построены уровни), canvas_size - настоящий
+    # размер холста с учетом внутреннего разрешения
+    def __init__(self):
+        self.size = (SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.canvas_size = self.size
+        self.render_scale = 1
+        self.window = None
+        self.canvas = None
+        # Куда рисуют уровни: сам холст или ScaledCanvas поверх него
+        self.target = None
+        self.scaled = False
+        self.headless = False
+        self.scale_mode = "integer"
+        self.factor = 1
+        self.dest_rect = pygame.Rect((0, 0), self.size)
+
+    def open(self, window_size=None, scale_mode=None):
+        init_pygame(settings.headless)
+        if settings.headless:
+            return self.open_headless()
+
+        window_size = tuple(window_size or settings.get_window_size())
+        self.scale_mode = scale_mode or settings.scale_mode
+        self.headless = False
+        self.setup_render_scale()
+        self.window = pygame.display.set_mode(window_size, pygame.DOUBLEBUF)
+        self.scaled = window_size != self.canvas_size
+        if self.scaled:
+            self.canvas = pygame.Surface(self.canvas_size).convert()
+            self.dest_rect = self.get_dest_rect(window_size)
+            # Поля вокруг картинки, если пропорции окна другие
+            self.window.fill(BLACK)
+        else:
+            self.canvas = self.window
+            self.factor = 1
+            self.dest_rect = self.window.get_rect()
+        return self.wrap_canvas()
+
+    def open_headless(self):
+        # Режим окна dummy-драйвера нужен только для convert(); рисуем в обычную
+        # поверхность в памяти, которую можно сохранить или сравнить попиксельно
+        self.setup_render_scale()
+        self.window = pygame.display.set_mode(self.size)
+        self.canvas = pygame.Surface(self.canvas_size).convert()
+        self.headless = True
+        self.scaled = False
+        self.factor = 1
+        self.dest_rect = self.canvas.get_rect()
+        return self.wrap_canvas()
+
+    def setup_render_scale(self):
+        self.render_scale = settings.render_scale
+        self.canvas_size = settings.get_canvas_size()
+
+    def wrap_canvas(self):
+        # При пониженном разрешении уровни рисуют через ScaledCanvas в логических координатах
+        if self.render_scale == 1:
+            self.target = self.canvas
+        else:
+            self.target = ScaledCanvas(self.canvas, self.render_scale)
+        return self.target
+
+    def get_dest_rect(self, window_size):
+        # Куда в окне выводится холст: по центру, с сохранением пропорций
+        width, height = window_size
+        factor = min(width / self.canvas_size[0], height / self.canvas_size[1])
+        if self.scale_mode == "integer" and factor >= 1:
+            factor = int(factor)
+        self.factor = factor
+        dest = pygame.Rect(0, 0, int(self.canvas_size[0] * factor), int(self.canvas_size[1] * factor))
+        dest.center = (width // 2, height // 2)
+        return dest
+
+    def get_canvas(self):
+        if self.canvas is None:
+            self.open()
+        return self.target
+
+    def to_canvas(self, pos):
+        # Координаты окна (мышь) -> логические координаты холста
+        if not self.scaled and self.render_scale == 1:
+            return pos
+        x = (pos[0] - self.dest_rect.x) * self.size[0] // self.dest_rect.width
+        y = (pos[1] - self.dest_rect.y) * self.size[1] // self.dest_rect.height
+        return (max(0, min(self.size[0] - 1, x)), max(0, min(self.size[1] - 1, y)))
+
+    def get_mouse_pos(self):
+        return self.to_canvas(pygame.mouse.get_pos())
+
+    def present(self, rects=None):
+        # rects=None - выводим весь кадр
+        if self.headless:
+            return
+        if rects is not None and self.render_scale != 1:
+            # Области отмечены в логических координатах; запас в пиксель - на округление
+            bounds = self.canvas.get_rect()
+            rects = [bounds.clip(cover_rect(rect, self.render_scale).inflate(2, 2)) for rect in rects]
+        if not self.scaled:
+            if rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+            return
+
+        if rects is None or self.factor != int(self.factor):
+            # Сглаженный или дробный масштаб - растягиваем холст целиком
+            target = self.window.subsurface(self.dest_rect)
+            if self.scale_mode == "smooth":
+                pygame.transform.smoothscale(self.canvas, self.dest_rect.size, target)
+            else:
+                pygame.transform.scale(self.canvas, self.dest_rect.size, target)
+            pygame.display.flip()
+            return
+
+        # Целый масштаб: растягиваем и выводим только изменившиеся области
+        window_rects = []
+        for rect in rects:
+            dest = pygame.Rect(self.dest_rect.x + rect.x * self.factor, self.dest_rect.y + rect.y * self.factor,
+                               rect.width * self.factor, rect.height * self.factor)
+            pygame.transform.scale(self.canvas.subsurface(rect), dest.size, self.window.subsurface(dest))
+            window_rects.append(dest)
+        pygame.display.update(window_rects)
+
+display = Display()
+
+# События, которые игра обрабатывает; остальные SDL отбрасывает сам, не кладя в очередь
+HANDLED_EVENTS = (pygame.QUIT, pygame.VIDEOEXPOSE, pygame.KEYDOWN, pygame.KEYUP,
+                  pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+# Все клавиши pygame - по ним снимок собирает множество нажатых
+KEY_CODES = tuple(sorted({getattr(pygame, name) for name in dir(pygame) if name.startswith("K_")}))
+
+class InputEvent:
+    # Нажатие или отпускание клавиши/кнопки мыши со временем прихода (мс)
+    __slots__ = ("type", "key", "button", "pos", "time")
+
+    def __init__(self, event_type, key=None, button=None, pos=None, time=0):
+        self.type = event_type
+        self.key = key
+        self.button = button
+        self.pos = pos
+        self.time = time
+
+class InputSnapshot:
+    # Ввод на один тик симуляции: нажатые клавиши, кнопки и положение мыши (в координатах
+    # холста) и события, пришедшие с прошлого тика. После создания не меняется.
+    # snapshot[pygame.K_...] работает как pygame.key.get_pressed()[...]
+    __slots__ = ("keys", "mouse_buttons", "mouse_pos", "events", "time")
+
+    def __init__(self, keys=(), mouse_buttons=(False, False, False), mouse_pos=(0, 0), events=(), time=0):
+        set_field = object.__setattr__
+        set_field(self, "keys", frozenset(keys))
+        set_field(self, "mouse_buttons", tuple(mouse_buttons))
+        set_field(self, "mouse_pos", tuple(mouse_pos))
+        set_field(self, "events", tuple(events))
+        set_field(self, "time", time)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("InputSnapshot не изменяется")
+
+    def __deepcopy__(self, memo):
+        # Неизменяемый снимок копировать незачем
+        return self
+
+    def __getitem__(self, key):
+        return key in self.keys
+
+    def get_events(self, event_type):
+        return [event for event in self.events if event.type == event_type]
+
+    def is_down(self, key):
+        # Клавиша зажата или была нажата за тик (короткое нажатие между опросами)
+        return key in self.keys or any(event.type == pygame.KEYDOWN and event.key == key
+                                       for event in self.events)
+
+class InputManager:
+    # Единственное место, где опрашиваются клавиатура и мышь: run() забирает
+    # события через pump(), update() раз в тик берет снимок через sample()
+    def __init__(self):
+        self.queue = deque()
+
+    def setup(self):
+        # Вызывается после создания окна
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(HANDLED_EVENTS)
+
+    def record(self, events):
+        # Запоминает события ввода с временем прихода для ближайшего снимка
+        now = pygame.time.get_ticks()
+        for event in events:
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                self.queue.append(InputEvent(event.type, key=event.key, time=now))
+            elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                self.queue.append(InputEvent(event.type, button=event.button,
+                                             pos=display.to_canvas(event.pos), time=now))
+        return events
+
+    def pump(self):
+        return self.record(pygame.event.get())
+
+    def sample(self):
+        pressed = pygame.key.get_pressed()
+        events = tuple(self.queue)
+        self.queue.clear()
+        return InputSnapshot([key for key in KEY_CODES if pressed[key]], pygame.mouse.get_pressed()[:3],
+                             display.get_mouse_pos(), events, pygame.time.get_ticks())
+
+input_state = InputManager()
+
+def png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+def encode_png(surface, level=3):
+    # pygame.image.save держит GIL все время сжатия и тормозит игру,
+    # а zlib.compress его отпускает - поэтому PNG для записи собираем сами
+    width, height = surface.get_size()
+    pixels = pygame.image.tostring(surface, "RGB")
+    stride = width * 3
+    # Каждая строка начинается с байта фильтра (0 - без фильтра)
+    raw = b"".join(b"\x00" + pixels[y:y + stride] for y in range(0, len(pixels), stride))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)  # 8 бит, RGB
+    return (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header) +
+            png_chunk(b"IDAT", zlib.compress(raw, level)) + png_chunk(b"IEND", b""))
+
+class FrameRecorder:
+    # Запись игрового процесса. Главный поток только копирует готовый кадр
+    # (через буфер поверхности, без промежуточных объектов) в один из заранее
+    # выделенных буферов кольца, а кодирует кадры отдельный поток. Если он не
+    # успевает и свободных буферов нет, кадр пропускается, а не тормозит игру
+    def __init__(self, slots=8):
+        self.slots = slots
+        self.active = False
+        self.buffers = []
+        self.free = queue.Queue()
+        self.ready = queue.Queue()
+        self.thread = None
+        self.output = None
+        self.format = "png"
+        self.frame = None
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+
+    def start(self, surface, output, output_format="png"):
+        self.stop()
+        self.output = output
+        self.format = output_format
+        # Поверхность того же формата - в нее поток записи разворачивает кадры
+        self.frame = pygame.Surface(surface.get_size(), 0, surface.get_bitsize(), surface.get_masks())
+        frame_bytes = surface.get_pitch() * surface.get_height()
+        self.buffers = [bytearray(frame_bytes) for _ in range(self.slots)]
+        self.free = queue.Queue()
+        self.ready = queue.Queue()
+        for slot in range(self.slots):
+            self.free.put(slot)
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+
+        if output_format == "png":
+            os.makedirs(output, exist_ok=True)
+            stream = None
+        else:
+            # Сырые кадры: формат пикселей как у экрана, без заголовков (для ffmpeg -f rawvideo)
+            stream = sys.stdout.buffer if output == "-" else open(output, "wb")
+        self.thread = threading.Thread(target=self.encode_loop, args=(stream,), daemon=True)
+        self.thread.start()
+        self.active = True
+
+    def capture(self, surface):
+        if not self.active:
+            return
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            # Кодировщик отстает - теряем кадр, но не ждем
+            self.dropped += 1
+            return
+        # get_view("0") - сырые байты пикселей; пока view жив, поверхность заблокирована
+        view = surface.get_view("0")
+        self.buffers[slot][:] = view
+        del view
+        self.ready.put((slot, self.captured))
+        self.captured += 1
+
+    def encode_loop(self, stream):
+        while True:
+            item = self.ready.get()
+            if item is None:
+                break
+            slot, index = item
+            if stream is not None:
+                stream.write(self.buffers[slot])
+            else:
+                pixels = memoryview(self.frame.get_view("0"))
+                pixels[:] = self.buffers[slot]
+                pixels.release()
+                with open(os.path.join(self.output, f"frame_{index:06d}.png"), "wb") as png_file:
+                    png_file.write(encode_png(self.frame))
+            self.written += 1
+            self.free.put(slot)
+        if stream is not None and stream is not sys.stdout.buffer:
+            stream.close()
+        elif stream is not None:
+            stream.flush()
+
+    def stop(self):
+        # Дописываем кадры из очереди и останавливаем поток
+        if not self.active:
+            return
+        self.active = False
+        self.ready.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def get_stats(self):
+        return {
+            "captured": self.captured,
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+recorder = FrameRecorder()
+
+class DirtyRectRenderer:
+    # Выводит на дисплей только изменившиеся области экрана.
+    # Уровень отмечает (mark) все, что может меняться от кадра к кадру:
+    # прямоугольник и состояние. Если пара (прямоугольник, состояние) была
+    # и в прошлом кадре - область не изменилась. state=None - меняется всегда.
+    def __init__(self, size, enabled=False, threshold=0.5):
+        self.screen_rect = pygame.Rect((0, 0), size)
+        self.enabled = enabled
+        self.threshold = threshold
+        self.current = set()
+        self.previous = set()
+        self.full_redraw = True
+        self.full_flips = 0
+        self.partial_updates = 0
+
+    def mark(self, rect, state=None):
+        if not self.enabled or rect is None:
+            return rect
+        if state is None:
+            state = object()  # Уникальное состояние - область обновляется каждый кадр
+        self.current.add((tuple(rect), state))
+        return rect
+
+    def mark_boxes(self, left, top, width, height, state=None):
+        # Отметка многих прямоугольников сразу (столбцы NumPy); state - общее для всех
+        if not self.enabled:
+            return
+        if state is None:
+            state = object()
+        boxes = zip(left.tolist(), top.tolist(), width.tolist(), height.tolist())
+        self.current.update((box, state) for box in boxes)
+
+    def blit(self, target, source, dest):
+        # Вывод поверхности с отметкой: состояние - сама поверхность (спрайт или текст из кэша)
+        return self.mark(target.blit(source, dest), source)
+
+    def invalidate(self):
+        # Следующий кадр будет выведен целиком
+        self.full_redraw = True
+
+    def get_dirty_rects(self):
+        rects = []
+        for rect, state in self.current ^ self.previous:
+            rect = self.screen_rect.clip(pygame.Rect(rect))
+            if rect.width > 0 and rect.height > 0:
+                rects.append(rect)
+        return rects
+
+    def present(self):
+        if not self.enabled:
+            display.present()
+            return
+
+        rects = [] if self.full_redraw else self.get_dirty_rects()
+        self.previous = self.current
+        self.current = set()
+
+        area = sum(rect.width * rect.height for rect in rects)
+        if self.full_redraw or area > self.screen_rect.width * self.screen_rect.height * self.threshold:
+            self.full_redraw = False
+            self.full_flips += 1
+            display.present()
+        elif rects:
+            self.partial_updates += 1
+            display.present(rects)
+
+class TextCache:
+    # Кэш отрисованного текста: font.render() дорогой, а большинство надписей
+    # (подсказки, счет, названия этажей) не меняются от кадра к кадру
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.wrapped = {}
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color, background=None):
+        key = (font, text, antialias, tuple(color), background and tuple(background))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        if background is None:
+            surface = surfaces.convert(font.render(text, antialias, color), "alpha")
+        else:
+            surface = surfaces.convert(font.render(text, antialias, color, background))
+        self.surfaces[key] = surface
+        # Вытесняем давно не использованные надписи
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def wrap(self, text, max_chars):
+        # Разбивает длинную строку на строки не длиннее max_chars символов
+        key = (text, max_chars)
+        lines = self.wrapped.get(key)
+        if lines is None:
+            if len(text) <= max_chars:
+                lines = [text]
+            else:
+                lines = []
+                line = ""
+                for word in text.split(' '):
+                    if len(line + word) > max_chars:
+                        lines.append(line)
+                        line = word + " "
+                    else:
+                        line += word + " "
+                if line:
+                    lines.append(line)
+            self.wrapped[key] = lines
+        return lines
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.surfaces),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        self.surfaces.clear()
+        self.wrapped.clear()
+
+# Общий кэш текста для всей игры
+text_cache = TextCache()
+
+class FontManager:
+    # Каждый шрифт (гарнитура, размер) загружается один раз за процесс
+    # и раздается всем, кому он нужен
+    def __init__(self):
+        self.fonts = {}
+
+    def get(self, size, face=None):
+        key = (face, size)
+        font = self.fonts.get(key)
+        if font is None:
+            init_pygame(settings.headless)
+            font = pygame.font.Font(face, size)
+            self.fonts[key] = font
+        return font
+
+    def preload(self, sizes, face=None):
+        for size in sizes:
+            self.get(size, face)
+
+# Размеры шрифтов, которые используются в игре
+FONT_SIZES = (24, 32, 36, 48)
+
+fonts = FontManager()
+
+class SpriteCache:
+    # Запекает процедурно нарисованные объекты в поверхности: каждый вариант
+    # (тип, уровень, кадр анимации...) рисуется примитивами один раз,
+    # а дальше выводится одним blit
+    def __init__(self):
+        self.sprites = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, size, anchor, draw_fn):
+        # draw_fn(surface, x, y) рисует объект с началом координат в точке anchor
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            return sprite
+
+        self.misses += 1
+        surface = surfaces.create(size, "alpha")
+        draw_fn(surface, anchor[0], anchor[1])
+        sprite = (surface, anchor)
+        self.sprites[key] = sprite
+        return sprite
+
+    def blit(self, target, sprite, x, y):
+        # Выводит спрайт так, чтобы его точка привязки оказалась в (x, y)
+        surface, anchor = sprite
+        return target.blit(surface, (x - anchor[0], y - anchor[1]))
+
+    def clear(self):
+        self.sprites.clear()
+
+# Общий кэш запеченных спрайтов
+sprites = SpriteCache()
+
+# Половина размера поверхности, на которой снимается штамп частицы
+STAMP_MARGIN = 5
+
+class ParticleField:
+    # Фоновые частицы (звезды, пыль, пепел): положения, размеры и фазы мерцания
+    # хранятся в массивах NumPy, мерцание и падение считаются одной векторной
+    # операцией, а пиксели пишутся прямо в поверхность через surfarray
+    def __init__(self, x, y, radius, brightness=None, period=None, speed=None):
+        self.index = np.arange(len(x))
+        self.x = np.asarray(x, dtype=np.int32)
+        self.y = np.asarray(y, dtype=np.int32)
+        self.radius = np.asarray(radius, dtype=np.int32)
+        self.brightness = None if brightness is None else np.asarray(brightness, dtype=np.int32)
+        self.period = None if period is None else np.asarray(period, dtype=np.int32)
+        self.speed = None if speed is None else np.asarray(speed, dtype=np.float64)
+        self.stamps = []
+        self.table = None
+
+    @staticmethod
+    def can_draw(surface):
+        # surfarray.pixels2d работает только с 32-битными поверхностями
+        return surface.get_bytesize() == 4
+
+    def get_stamp(self, radius, cross):
+        # Смещения пикселей круга (и крестика-блика) - берем у pygame.draw,
+        # чтобы частица выглядела так же, как нарисованная примитивом
+        center = STAMP_MARGIN
+        shape = pygame.Surface((center * 2 + 1, center * 2 + 1))
+        pygame.draw.circle(shape, WHITE, (center, center), radius)
+        if cross:
+            pygame.draw.line(shape, WHITE, (center - 4, center), (center + 4, center), 1)
+            pygame.draw.line(shape, WHITE, (center, center - 4), (center, center + 4), 1)
+        dx, dy = np.nonzero(pygame.surfarray.array2d(shape))
+        return dx - center, dy - center
+
+    def get_stamp_table(self, kinds_count):
+        # Таблица штампов для всех видов частиц (вид = радиус * 2 + блик). Короткие
+        # штампы дополнены повтором первого пикселя, чтобы все частицы рисовались
+        # одним индексированием без группировки по видам
+        if len(self.stamps) < kinds_count:
+            stamps = [self.get_stamp(kind // 2, kind % 2 == 1) for kind in range(kinds_count)]
+            stamp_size = max(max(len(dx) for dx, dy in stamps), 1)
+            table_dx = np.zeros((kinds_count, stamp_size), dtype=np.int32)
+            table_dy = np.zeros((kinds_count, stamp_size), dtype=np.int32)
+            for kind, (dx, dy) in enumerate(stamps):
+                if len(dx):
+                    table_dx[kind] = np.resize(dx, stamp_size)
+                    table_dy[kind] = np.resize(dy, stamp_size)
+            self.stamps = stamps
+            self.table = (table_dx, table_dy)
+        return self.table
+
+    def draw(self, surface, x, y, radius, red, green, blue, cross=None):
+        # Все аргументы - массивы по частицам; cross - у каких частиц рисовать блик.
+        # Следующие частицы ложатся поверх предыдущих (частицы у края - поверх всех)
+        if len(x) == 0:
+            return
+        if isinstance(surface, ScaledCanvas):
+            # Уменьшенный холст: частицы ставятся сразу в его координатах
+            scale = surface.scale
+            x = np.round(np.asarray(x) * scale)
+            y = np.round(np.asarray(y) * scale)
+            radius = np.round(np.asarray(radius) * scale).astype(np.int32)
+            surface = surface.surface
+        width, height = surface.get_size()
+        pitch = surface.get_pitch() // 4
+        shifts = surface.get_shifts()
+        losses = surface.get_losses()
+        colors = (((np.asarray(red, dtype=np.uint32) >> losses[0]) << shifts[0]) |
+                  ((np.asarray(green, dtype=np.uint32) >> losses[1]) << shifts[1]) |
+                  ((np.asarray(blue, dtype=np.uint32) >> losses[2]) << shifts[2]) |
+                  np.uint32(surface.get_masks()[3]))
+        kinds = radius * 2 if cross is None else radius * 2 + cross
+        table_dx, table_dy = self.get_stamp_table(int(kinds.max()) + 1)
+        x = np.asarray(x, dtype=np.int32)
+        y = np.asarray(y, dtype=np.int32)
+        # Частицам у края экрана нужна проверка границ для каждого пикселя,
+        # остальные рисуются сразу целыми штампами
+        edge = (x < STAMP_MARGIN) | (x >= width - STAMP_MARGIN) | (y < STAMP_MARGIN) | (y >= height - STAMP_MARGIN)
+        inner = ~edge
+
+        pixels = np.frombuffer(surface.get_buffer(), dtype=np.uint32)
+        offsets = table_dy * pitch + table_dx
+        inner_kinds = kinds[inner]
+        pixels[((y[inner] * pitch + x[inner])[:, None] + offsets[inner_kinds]).ravel()] = \
+            np.repeat(colors[inner], offsets.shape[1])
+        if edge.any():
+            px = x[edge, None] + table_dx[kinds[edge]]
+            py = y[edge, None] + table_dy[kinds[edge]]
+            inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+            pixels[(py * pitch + px)[inside]] = np.broadcast_to(colors[edge, None], px.shape)[inside]
+        # Пока массив жив, поверхность заблокирована
+        del pixels
+
+class SpriteBatch:
+    # Собирает пары (спрайт, позиция) для множества одинаковых объектов
+    # (пули, ракеты, ноты) и выводит их одним вызовом Surface.blits()
+    def __init__(self):
+        self.items = []
+
+    def add(self, sprite, x, y):
+        surface, anchor = sprite
+        self.items.append((surface, (int(x) - anchor[0], int(y) - anchor[1])))
+
+    def add_many(self, sprite, xs, ys):
+        # Один спрайт во многих точках (координаты - массивы NumPy)
+        surface, anchor = sprite
+        xs = (xs.astype(np.int64) - anchor[0]).tolist()
+        ys = (ys.astype(np.int64) - anchor[1]).tolist()
+        self.items.extend([(surface, position) for position in zip(xs, ys)])
+
+    def add_variants(self, variants, get_sprite, xs, ys):
+        # variants - столбцы признаков спрайта (тип, ширина полосы здоровья...),
+        # get_sprite(*признаки) дает спрайт; одинаковые варианты идут одним add_many
+        keys, group = np.unique(np.stack(variants).astype(np.int64), axis=1, return_inverse=True)
+        group = group.reshape(-1)
+        for i, key in enumerate(keys.T.tolist()):
+            same = group == i
+            self.add_many(get_sprite(*key), xs[same], ys[same])
+
+    def draw(self, target):
+        if self.items:
+            target.blits(self.items, doreturn=False)
+            self.items.clear()
+
+def get_position(entity):
+    # Объекты бывают классами и словарями с ключами "x"/"y"
+    if isinstance(entity, dict):
+        return entity["x"], entity["y"]
+    return entity.x, entity.y
+
+def set_position(entity, x, y):
+    if isinstance(entity, dict):
+        entity["x"] = x
+        entity["y"] = y
+    else:
+        entity.x = x
+        entity.y = y
+
+def get_bounds(entity):
+    # Прямоугольник объекта (x, y, ширина, высота); у словарей размер может отсутствовать
+    x, y = get_position(entity)
+    if isinstance(entity, dict):
+        return x, y, entity.get("width", 0), entity.get("height", 0)
+    return x, y, getattr(entity, "width", 0), getattr(entity, "height", 0)
+
+class BoundsIndex:
+    # Индекс неподвижных объектов по вертикали: объекты отсортированы по верхнему
+    # краю, и видимая полоса находится бисекцией, а не перебором всего уровня
+    def __init__(self, entities, bounds_fn=get_bounds):
+        items = sorted(((bounds_fn(entity), entity) for entity in entities), key=lambda item: item[0][1])
+        self.tops = [bounds[1] for bounds, entity in items]
+        self.bottoms = [bounds[1] + bounds[3] for bounds, entity in items]
+        self.entities = [entity for bounds, entity in items]
+        # Самый высокий объект - насколько выше полосы может начинаться видимый объект
+        self.max_height = max((bounds[3] for bounds, entity in items), default=0)
+
+    def query(self, top, bottom):
+        start = bisect.bisect_left(self.tops, top - self.max_height)
+        end = bisect.bisect_right(self.tops, bottom)
+        return [self.entities[i] for i in range(start, end) if self.bottoms[i] >= top]
+
+class Viewport:
+    # Видимая часть мира. Все draw_* спрашивают у нее, какие объекты рисовать,
+    # чтобы уровень стоил столько, сколько видно на экране
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.camera_x = 0
+        self.camera_y = 0
+        self.culled = 0
+
+    def is_visible(self, x, y, width=0, height=0, margin=0):
+        # margin - запас на то, что рисуется вокруг объекта (следы, полосы здоровья)
+        x -= self.camera_x
+        y -= self.camera_y
+        return (x + width + margin >= 0 and x - margin <= self.width and
+                y + height + margin >= 0 and y - margin <= self.height)
+
+    def visible_mask(self, left, top, width, height, margin=0):
+        # То же для массивов NumPy: маска видимых прямоугольников
+        x = left - self.camera_x
+        y = top - self.camera_y
+        return ((x + width + margin >= 0) & (x - margin <= self.width) &
+                (y + height + margin >= 0) & (y - margin <= self.height))
+
+    def visible(self, entities, margin=0):
+        result = []
+        for entity in entities:
+            x, y, width, height = get_bounds(entity)
+            if self.is_visible(x, y, width, height, margin):
+                result.append(entity)
+            else:
+                self.culled += 1
+        return result
+
+    def query(self, index, margin=0):
+        # Видимые объекты из индекса (точная проверка по горизонтали и вертикали)
+        candidates = index.query(self.camera_y - margin, self.camera_y + self.height + margin)
+        return self.visible(candidates, margin)
+
+    def visible_rows(self, store, margin=0):
+        # То же для хранилища сущностей: видимые строки (массив номеров)
+        rows = store.rows()
+        visible = self.visible_mask(*store.get_bounds(rows), margin)
+        self.culled += len(rows) - int(visible.sum())
+        return rows[visible]
+
+# Размер клетки сетки столкновений - порядка размера типичного объекта
+SPATIAL_CELL_SIZE = 64
+
+class SpatialHash:
+    # Грубая фаза столкновений: равномерная сетка, каждый объект записан во все
+    # клетки, которые задевает его прямоугольник. Запрос смотрит только клетки
+    # вокруг области, а не все объекты группы. Результаты идут в порядке вставки,
+    # поэтому замена перебора списка на запрос к сетке не меняет исход
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.cells = {}
+        self.entries = []
+
+    def __deepcopy__(self, memo):
+        # Номера в клетках - просто числа: списки копируются срезом, а не
+        # поэлементно через deepcopy
+        grid = SpatialHash(self.cell_size)
+        memo[id(self)] = grid
+        grid.cells = {cell: indices[:] for cell, indices in self.cells.items()}
+        grid.entries = [(copy.deepcopy(item, memo), pygame.Rect(rect)) for item, rect in self.entries]
+        return grid
+
+    def get_cells(self, rect):
+        size = self.cell_size
+        for cell_x in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cell_y in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield cell_x, cell_y
+
+    def insert(self, item, rect):
+        rect = pygame.Rect(rect)
+        index = len(self.entries)
+        self.entries.append((item, rect))
+        for cell in self.get_cells(rect):
+            self.cells.setdefault(cell, []).append(index)
+
+    def rebuild(self, entries):
+        # entries - пары (объект, прямоугольник); сетки подвижных групп
+        # пересобираются так каждый тик
+        self.clear()
+        for item, rect in entries:
+            self.insert(item, rect)
+
+    def candidates(self, rect):
+        # Номера записей из клеток, которые задевает rect
+        cells = self.cells
+        found = set()
+        for cell in self.get_cells(rect):
+            found.update(cells.get(cell, ()))
+        return sorted(found)
+
+    def nearby(self, rect):
+        # Только грубая фаза: объекты рядом с rect, точную проверку делает вызывающий
+        rect = pygame.Rect(rect)
+        return [self.entries[i][0] for i in self.candidates(rect)]
+
+    def query(self, rect):
+        # Объекты, чьи прямоугольники пересекаются с rect (как colliderect)
+        rect = pygame.Rect(rect)
+        result = []
+        for i in self.candidates(rect):
+            item, item_rect = self.entries[i]
+            if item_rect.colliderect(rect):
+                result.append(item)
+        return result
+
+    def pairs(self, entries):
+        # Все пересечения группы entries - пар (ключ, прямоугольник) - с объектами
+        # сетки: список (ключ, объект) в порядке entries, затем в порядке вставки
+        result = []
+        for key, rect in entries:
+            for item in self.query(rect):
+                result.append((key, item))
+        return result
+
+# Неподвижные препятствия уровней: их сетки строятся один раз при загрузке
+STATIC_COLLISION_GROUPS = {
+    "platformer": ("platforms", "spikes"),
+    "puzzle": ("puzzle_blocks",),
+    "stealth": ("obstacles",),
+    "survival": ("barricades",),
+}
+# Подвижные группы: их сетки пересобираются в update_* каждый тик
+DYNAMIC_COLLISION_GROUPS = {
+    "shooter": ("bullets",),
+    "survival": ("bullets",),
+    "tower_defense": ("boss_bullets",),
+}
+
+# Флаги сущностей в хранилище
+ENTITY_HIT = 1
+ENTITY_SELECTED = 2  # Выделен игроком
+ENTITY_ORDERED = 4  # Идет в точку приказа
+# Начальная емкость столбцов хранилища (дальше растет удвоением)
+ENTITY_CAPACITY = 16
+
+class EntityStore:
+    # Сущности одного вида, разложенные по столбцам NumPy: общие компоненты (положение,
+    # скорость, здоровье, таймер, тип, флаги) и компоненты вида из record.COMPONENTS.
+    # Сущность - номер строки; он не меняется, пока сущность жива, а поколение строки
+    # отличает новую сущность от убитой на том же месте. Системы (движение, отсечение,
+    # сглаживание, попадания) считаются маской живых строк над целыми столбцами.
+    # record - класс записи (EntityRecord), через которую с сущностью работает логика
+    COLUMNS = (("x", np.float64), ("y", np.float64), ("vx", np.float64), ("vy", np.float64),
+               ("health", np.float64), ("timer", np.float64), ("kind", np.int32), ("flags", np.int32),
+               ("generation", np.uint32), ("serial", np.int64))
+
+    def __init__(self, record, capacity=ENTITY_CAPACITY):
+        self.record = record
+        self.kind_names = [kind[0] for kind in record.KINDS]
+        # Хитбокс каждого типа относительно (x, y): смещение и размер
+        self.hitboxes = np.array([kind[1:] for kind in record.KINDS], dtype=np.float64).reshape(-1, 4)
+        self.columns = self.COLUMNS + record.COMPONENTS
+        for name, dtype in self.columns:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.alive = np.zeros(capacity, dtype=bool)
+        # Запись строки; у убитой остается до повторного занятия строки, но alive ее уже не признает
+        self.records = [None] * capacity
+        # Строки дальше size еще ни разу не занимались
+        self.size = 0
+        self.count = 0
+        self.free = []
+        # Сквозной номер появления: перебор идет в порядке появления, как у списка
+        self.next_serial = 0
+        self.saved = None
+
+    def __getstate__(self):
+        # Класс записи сохраняется по имени, а список столбцов (с типами NumPy)
+        # собирается заново - снимок уровня не хранит классы
+        state = dict(self.__dict__)
+        state["record"] = self.record.__name__
+        del state["columns"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.record = globals()[state["record"]]
+        self.columns = self.COLUMNS + self.record.COMPONENTS
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, record):
+        return (isinstance(record, EntityRecord) and record.store is self and
+                self.records[record.row] is record and bool(self.alive[record.row]))
+
+    def __iter__(self):
+        # Перебирать можно прямо во время удаления и добавления: убитые по ходу
+        # пропускаются, а появившиеся в текущий перебор не попадают
+        records, alive = self.records, self.alive
+        for record in [records[row] for row in self.rows().tolist()]:
+            if records[record.row] is record and alive[record.row]:
+                yield record
+
+    def __getitem__(self, index):
+        # Доступ по номеру (срезы) - по живым записям в порядке появления
+        return [self.records[row] for row in self.rows().tolist()][index]
+
+    def get_kind(self, name):
+        return self.kind_names.index(name)
+
+    def grow(self):
+        # Удваиваем емкость: перевыделение раз в log(n) появлений, а не на каждое
+        capacity = len(self.alive)
+        for name, dtype in self.columns:
+            column = getattr(self, name)
+            grown = np.zeros(capacity * 2, dtype=dtype)
+            grown[:capacity] = column
+            setattr(self, name, grown)
+        alive = np.zeros(capacity * 2, dtype=bool)
+        alive[:capacity] = self.alive
+        self.alive = alive
+        self.records.extend([None] * capacity)
+
+    def create(self, kind, x, y, vx=0.0, vy=0.0, health=0.0, timer=0.0, **components):
+        # components - значения компонентов вида; остальные нулевые
+        if isinstance(kind, str):
+            kind = self.get_kind(kind)
+        if self.free:
+            row = self.free.pop()
+            generation = self.generation[row] + 1
+        else:
+            if self.size == len(self.alive):
+                self.grow()
+            row = self.size
+            self.size += 1
+            generation = 0
+        for name, dtype in self.record.COMPONENTS:
+            getattr(self, name)[row] = 0
+        for name, value in (("x", x), ("y", y), ("vx", vx), ("vy", vy), ("health", health), ("timer", timer),
+                            ("kind", kind), ("flags", 0), ("generation", generation),
+                            ("serial", self.next_serial)):
+            getattr(self, name)[row] = value
+        for name, value in components.items():
+            getattr(self, name)[row] = value
+        self.next_serial += 1
+        self.alive[row] = True
+        self.count += 1
+        record = self.record(self, row)
+        self.records[row] = record
+        return record
+
+    def destroy(self, row):
+        if not self.alive[row]:
+            return
+        self.alive[row] = False
+        # Мертвая строка не двигается - движение считается по всему столбцу
+        self.vx[row] = 0.0
+        self.vy[row] = 0.0
+        self.free.append(row)
+        self.count -= 1
+
+    def destroy_rows(self, rows):
+        # Удаление набора строк (массив номеров) одной операцией над столбцами
+        rows = rows[self.alive[rows]]
+        self.alive[rows] = False
+        self.vx[rows] = 0.0
+        self.vy[rows] = 0.0
+        self.free.extend(rows.tolist())
+        self.count -= len(rows)
+
+    def remove(self, record):
+        if record not in self:
+            raise ValueError("EntityStore.remove(x): x not in store")
+        self.destroy(record.row)
+
+    def clear(self):
+        self.alive[:] = False
+        self.records = [None] * len(self.alive)
+        self.size = 0
+        self.count = 0
+        self.free = []
+        self.saved = None
+
+    def rows(self):
+        # Живые строки (массив номеров) в порядке появления
+        rows = np.flatnonzero(self.alive[:self.size])
+        return rows[np.argsort(self.serial[rows])]
+
+    def get_kinds(self, rows, name):
+        # Маска строк данного типа
+        return self.kind[rows] == self.get_kind(name)
+
+    def get_bounds(self, rows):
+        # Хитбоксы строк как у pygame.Rect: координаты отбрасывают дробную часть
+        boxes = self.hitboxes[self.kind[rows]]
+        left = np.trunc(self.x[rows] + boxes[:, 0])
+        top = np.trunc(self.y[rows] + boxes[:, 1])
+        return left, top, boxes[:, 2], boxes[:, 3]
+
+    def get_rect(self, row):
+        left, top, width, height = self.hitboxes[self.kind[row]]
+        return pygame.Rect(self.x[row] + left, self.y[row] + top, width, height)
+
+    def boxes(self, rows):
+        # Хитбоксы парами (номер строки, прямоугольник) - для SpatialHash
+        left, top, width, height = self.get_bounds(rows)
+        return list(zip(rows.tolist(), zip(left.tolist(), top.tolist(), width.tolist(), height.tolist())))
+
+    def hits(self, rect, rows):
+        # Строки, чьи хитбоксы задевают прямоугольник (как colliderect)
+        rect = pygame.Rect(rect)
+        left, top, width, height = self.get_bounds(rows)
+        return rows[(left < rect.right) & (rect.left < left + width) &
+                    (top < rect.bottom) & (rect.top < top + height) & (width > 0) & (height > 0)]
+
+    def distances(self, x, y, rows):
+        return np.sqrt((self.x[rows] - x) ** 2 + (self.y[rows] - y) ** 2)
+
+    def nearest(self, x, y):
+        # Ближайшая живая запись и расстояние до нее (при равенстве - появившаяся раньше)
+        rows = self.rows()
+        if not len(rows):
+            return None, math.inf
+        distances = self.distances(x, y, rows)
+        nearest = int(np.argmin(distances))
+        return self.records[rows[nearest]], float(distances[nearest])
+
+    def move_toward(self, rows, target_x, target_y, speed):
+        # Шаг строк к своим целям (массивы координат) со скоростью speed
+        dx = target_x - self.x[rows]
+        dy = target_y - self.y[rows]
+        distance = np.sqrt(dx * dx + dy * dy)
+        self.x[rows] += dx / distance * speed
+        self.y[rows] += dy / distance * speed
+
+    def move(self):
+        # Система движения: положение += скорость для всех строк сразу
+        n = self.size
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+
+    def save_positions(self):
+        n = self.size
+        self.saved = (self.x[:n].copy(), self.y[:n].copy(), self.generation[:n].copy(), self.alive[:n].copy())
+
+    def interpolate(self, alpha):
+        # Ставит сущности между сохраненным и текущим положением, возвращает
+        # настоящие положения для restore()
+        if self.saved is None:
+            return None
+        saved_x, saved_y, saved_generation, saved_alive = self.saved
+        n = min(len(saved_x), self.size)
+        current_x, current_y = self.x[:n].copy(), self.y[:n].copy()
+        step_x = current_x - saved_x[:n]
+        step_y = current_y - saved_y[:n]
+        # Сущности, появившиеся на этом тике, и телепорты не сглаживаются
+        smooth = (self.alive[:n] & saved_alive[:n] & (self.generation[:n] == saved_generation[:n]) &
+                  (np.abs(step_x) <= TELEPORT_DISTANCE) & (np.abs(step_y) <= TELEPORT_DISTANCE))
+        self.x[:n] = np.where(smooth, saved_x[:n] + step_x * alpha, current_x)
+        self.y[:n] = np.where(smooth, saved_y[:n] + step_y * alpha, current_y)
+        return current_x, current_y
+
+    def restore(self, moved):
+        if moved is not None:
+            current_x, current_y = moved
+            self.x[:len(current_x)] = current_x
+            self.y[:len(current_y)] = current_y
+
+def nearest_points(x, y, target_x, target_y):
+    # Для каждой точки (x, y) - номер ближайшей цели и расстояние до нее
+    # (при равенстве - цель с меньшим номером); целей должна быть хотя бы одна
+    distances = np.sqrt((x[:, None] - target_x[None, :]) ** 2 + (y[:, None] - target_y[None, :]) ** 2)
+    nearest = np.argmin(distances, axis=1)
+    return nearest, distances[np.arange(len(x)), nearest]
+
+def component(name):
+    # Поле записи - ячейка столбца хранилища
+    def get(record):
+        return getattr(record.store, name)[record.row]
+
+    def set(record, value):
+        getattr(record.store, name)[record.row] = value
+
+    return property(get, set)
+
+class EntityRecord:
+    # Запись - ссылка на строку EntityStore: поля читаются и пишутся прямо в столбцы.
+    # Подклассы задают KINDS - типы (имя и хитбокс относительно (x, y): смещение и
+    # размер) и COMPONENTS - свои столбцы
+    __slots__ = ("store", "row")
+    KINDS = ()
+    COMPONENTS = ()
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, dtype in cls.COMPONENTS:
+            setattr(cls, name, component(name))
+
+    x = component("x")
+    y = component("y")
+    vx = component("vx")
+    vy = component("vy")
+    health = component("health")
+    timer = component("timer")
+    flags = component("flags")
+
+    @property
+    def kind_name(self):
+        return self.store.kind_names[self.store.kind[self.row]]
+
+    def get_rect(self):
+        return self.store.get_rect(self.row)
+
+class RacingObstacle(EntityRecord):
+    __slots__ = ()
+    KINDS = (("obstacle", 0, 0, 30, 30),)
+
+class RhythmNote(EntityRecord):
+    __slots__ = ()
+    KINDS = (("left", 0, 0, 30, 20), ("right", 0, 0, 30, 20), ("up", 0, 0, 30, 20), ("down", 0, 0, 30, 20))
+
+RHYTHM_NOTE_COLORS = {"left": RED, "right": BLUE, "up": GREEN, "down": YELLOW}
+
+# Типы снарядов: имя и хитбокс относительно точки (x, y) - смещение и размер
+PROJECTILE_TYPES = (
+    ("bullet", 0, 0, 4, 10),  # Пуля игрока, (x, y) - левый верхний угол
+    ("normal", -4, -4, 8, 8), ("spread", -4, -4, 8, 8), ("circle", -4, -4, 8, 8),  # Босс
+    ("laser", -6, -6, 12, 12), ("rocket", -6, -6, 12, 12),  # Босс tower defense
+    ("fire", -6, -6, 12, 12), ("acid", -6, -6, 12, 12),
+    ("basic", -3, -3, 6, 6), ("rapid", -3, -3, 6, 6),  # Башни
+    ("heavy", -3, -3, 6, 6), ("freeze", -3, -3, 6, 6),
+)
+# Начальная емкость массивов снарядов (дальше растет удвоением)
+PROJECTILE_CAPACITY = 64
+
+class ProjectileSystem:
+    # Все снаряды уровня (пули игрока, босса, башен) в массивах NumPy: x, y, скорость,
+    # урон, тип и владелец. Живые снаряды лежат подряд в начале массивов, поэтому
+    # движение, вылет за экран и попадания считаются одной операцией над срезом.
+    # Владелец - номер объекта, выпустившего снаряд (add_owner)
+    COLUMNS = (("x", np.float64), ("y", np.float64), ("dx", np.float64), ("dy", np.float64),
+               ("damage", np.int32), ("type", np.int32), ("owner", np.int32), ("serial", np.int64))
+
+    def __init__(self, capacity=PROJECTILE_CAPACITY):
+        self.type_names = [name for name, left, top, width, height in PROJECTILE_TYPES]
+        self.hitboxes = np.array([box[1:] for box in PROJECTILE_TYPES], dtype=np.float64)
+        self.owners = []
+        self.count = 0
+        # Сквозной номер снаряда - по нему сглаживание узнает снаряд после удалений
+        self.next_serial = 0
+        self.saved = None
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.count
+
+    def add_owner(self, owner):
+        # Номер владельца; один объект получает один номер
+        for index, known in enumerate(self.owners):
+            if known is owner:
+                return index
+        self.owners.append(owner)
+        return len(self.owners) - 1
+
+    def grow(self):
+        # Удваиваем емкость: перевыделение раз в log(n) выстрелов, а не на каждый
+        for name, dtype in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(len(column) * 2, dtype=dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    def spawn(self, type_name, owner, x, y, dx, dy, damage=0):
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.dx[i] = dx
+        self.dy[i] = dy
+        self.damage[i] = damage
+        self.type[i] = self.type_names.index(type_name)
+        self.owner[i] = owner
+        self.serial[i] = self.next_serial
+        self.next_serial += 1
+        self.count += 1
+
+    def integrate(self, owner=None):
+        # Шаг снарядов владельца (по умолчанию всех) на их скорость
+        n = self.count
+        if owner is None:
+            self.x[:n] += self.dx[:n]
+            self.y[:n] += self.dy[:n]
+            return
+        mask = self.owned_mask(owner)
+        self.x[:n][mask] += self.dx[:n][mask]
+        self.y[:n][mask] += self.dy[:n][mask]
+
+    def remove_mask(self, mask):
+        # Удаляет отмеченные снаряды, сохраняя порядок остальных
+        if not mask.any():
+            return
+        keep = ~mask
+        n = int(keep.sum())
+        for name, dtype in self.COLUMNS:
+            column = getattr(self, name)
+            column[:n] = column[:self.count][keep]
+        self.count = n
+
+    def remove(self, indices):
+        if len(indices):
+            mask = np.zeros(self.count, dtype=bool)
+            mask[indices] = True
+            self.remove_mask(mask)
+
+    def owned_mask(self, owner):
+        # owner - номер, список номеров или None (все снаряды)
+        n = self.count
+        if owner is None:
+            return np.ones(n, dtype=bool)
+        if isinstance(owner, int):
+            return self.owner[:n] == owner
+        return np.isin(self.owner[:n], owner)
+
+    def cull(self, owner=None, left=-math.inf, top=-math.inf, right=math.inf, bottom=math.inf):
+        # Удаляет снаряды владельца, вылетевшие за границы
+        n = self.count
+        x, y = self.x[:n], self.y[:n]
+        outside = (x < left) | (x > right) | (y < top) | (y > bottom)
+        self.remove_mask(outside & self.owned_mask(owner))
+
+    def remove_owner(self, owner):
+        self.remove_mask(self.owned_mask(owner))
+
+    def get_hitboxes(self):
+        # Хитбоксы как у pygame.Rect: координаты отбрасывают дробную часть
+        n = self.count
+        boxes = self.hitboxes[self.type[:n]]
+        left = np.trunc(self.x[:n] + boxes[:, 0])
+        top = np.trunc(self.y[:n] + boxes[:, 1])
+        return left, top, boxes[:, 2], boxes[:, 3]
+
+    def hits(self, rect, owner=None):
+        # Номера снарядов владельца, задевающих прямоугольник (как colliderect)
+        rect = pygame.Rect(rect)
+        left, top, width, height = self.get_hitboxes()
+        mask = ((left < rect.right) & (rect.left < left + width) &
+                (top < rect.bottom) & (rect.top < top + height))
+        return np.flatnonzero(mask & self.owned_mask(owner))
+
+    def first_hit(self, rect, owner=None):
+        indices = self.hits(rect, owner)
+        return int(indices[0]) if len(indices) else -1
+
+    def boxes(self, owner=None):
+        # Хитбоксы снарядов владельца парами (номер, прямоугольник) - для SpatialHash
+        left, top, width, height = self.get_hitboxes()
+        rows = np.flatnonzero(self.owned_mask(owner))
+        return list(zip(rows.tolist(), zip(left[rows].tolist(), top[rows].tolist(),
+                                           width[rows].tolist(), height[rows].tolist())))
+
+    def rows(self, owner=None, viewport=None, margin=0):
+        # Номера снарядов владельца (только видимые, если передана область)
+        mask = self.owned_mask(owner)
+        if viewport is not None:
+            visible = viewport.visible_mask(*self.get_hitboxes(), margin)
+            viewport.culled += int((mask & ~visible).sum())
+            mask &= visible
+        return np.flatnonzero(mask).tolist()
+
+    def get_type_name(self, i):
+        return self.type_names[self.type[i]]
+
+    def get_rect(self, i):
+        left, top, width, height = self.hitboxes[self.type[i]]
+        return pygame.Rect(self.x[i] + left, self.y[i] + top, width, height)
+
+    def draw(self, batch, sprite_fn, owner=None, viewport=None, margin=0):
+        # sprite_fn(имя типа) - запеченный спрайт снаряда
+        x, y, types, names = self.x, self.y, self.type, self.type_names
+        for i in self.rows(owner, viewport, margin):
+            batch.add(sprite_fn(names[types[i]]), x[i], y[i])
+
+    def save_positions(self):
+        n = self.count
+        self.saved = (self.serial[:n].copy(), self.x[:n].copy(), self.y[:n].copy())
+
+    def interpolate(self, alpha):
+        # Ставит снаряды между сохраненным и текущим положением, возвращает
+        # настоящие положения для restore()
+        if self.saved is None or not self.count:
+            return None
+        saved_serial, saved_x, saved_y = self.saved
+        n = self.count
+        current_x, current_y = self.x[:n].copy(), self.y[:n].copy()
+        # Снаряды, существовавшие на прошлом тике
+        common, now, before = np.intersect1d(self.serial[:n], saved_serial,
+                                             assume_unique=True, return_indices=True)
+        step_x = current_x[now] - saved_x[before]
+        step_y = current_y[now] - saved_y[before]
+        smooth = (np.abs(step_x) <= TELEPORT_DISTANCE) & (np.abs(step_y) <= TELEPORT_DISTANCE)
+        now, before = now[smooth], before[smooth]
+        self.x[now] = saved_x[before] + step_x[smooth] * alpha
+        self.y[now] = saved_y[before] + step_y[smooth] * alpha
+        return current_x, current_y
+
+    def restore(self, moved):
+        if moved is not None:
+            current_x, current_y = moved
+            self.x[:len(current_x)] = current_x
+            self.y[:len(current_y)] = current_y
 
 class GameProgress:
     def __init__(self):
@@ -60,6 +1878,299 @@ class GameProgress:
     def is_level_unlocked(self, level):
         return level in self.unlocked_levels
 
+# Заголовок снимка уровня: сигнатура, версия формата, порядок байт машины, уровень,
+# CRC32 данных после заголовка
+SNAPSHOT_MAGIC = b"SGSV"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct("<4sHcBI")
+
+class SnapshotWriter:
+    # Двоичная запись состояния уровня. Каждое значение - байт-тег и данные
+    # (struct, little-endian). Изменяемые объекты пишутся один раз, повторные
+    # ссылки - по номеру, поэтому общие объекты (игрок в списке владельцев
+    # снарядов, цели ракет) и циклы сохраняются как есть. Строки тоже пишутся
+    # один раз. Массивы array и NumPy (столбцы EntityStore, ProjectileSystem)
+    # идут одним куском байт. Из классов сохраняются только классы этого модуля
+    def __init__(self):
+        self.out = bytearray()
+        self.memo = {}
+        self.strings = {}
+        # Держим записанные объекты, чтобы их id() не достались новым
+        self.keep = []
+
+    def write_int(self, value):
+        self.out += struct.pack("<I", value)
+
+    def write_str(self, value):
+        index = self.strings.get(value)
+        if index is not None:
+            self.out += b"q" + struct.pack("<I", index)
+            return
+        self.strings[value] = len(self.strings)
+        data = value.encode("utf-8")
+        self.out += b"s" + struct.pack("<I", len(data)) + data
+
+    def write(self, value):
+        out = self.out
+        if value is None:
+            out += b"N"
+        elif value is True:
+            out += b"T"
+        elif value is False:
+            out += b"F"
+        elif isinstance(value, int):
+            if -2 ** 63 <= value < 2 ** 63:
+                out += b"i" + struct.pack("<q", value)
+            else:
+                out += b"I"
+                self.write_str(str(value))
+        elif isinstance(value, float):
+            out += b"d" + struct.pack("<d", value)
+        elif isinstance(value, str):
+            self.write_str(value)
+        elif isinstance(value, bytes):
+            out += b"b" + struct.pack("<I", len(value)) + value
+        elif isinstance(value, tuple):
+            out += b"t" + struct.pack("<I", len(value))
+            for item in value:
+                self.write(item)
+        elif isinstance(value, np.generic):
+            self.write(value.item())
+        else:
+            self.write_object(value)
+
+    def write_object(self, value):
+        out = self.out
+        index = self.memo.get(id(value))
+        if index is not None:
+            out += b"r" + struct.pack("<I", index)
+            return
+        self.memo[id(value)] = len(self.memo)
+        self.keep.append(value)
+        cls = type(value)
+        if cls is list:
+            out += b"l" + struct.pack("<I", len(value))
+            for item in value:
+                self.write(item)
+        elif cls is dict:
+            out += b"D" + struct.pack("<I", len(value))
+            for key, item in value.items():
+                self.write(key)
+                self.write(item)
+        elif cls is set or cls is frozenset:
+            out += (b"S" if cls is set else b"Z") + struct.pack("<I", len(value))
+            for item in value:
+                self.write(item)
+        elif cls is bytearray:
+            out += b"B" + struct.pack("<I", len(value)) + value
+        elif cls is array.array:
+            data = value.tobytes()
+            out += b"a" + value.typecode.encode("ascii") + struct.pack("<I", len(data)) + data
+        elif cls is np.ndarray:
+            data = np.ascontiguousarray(value).tobytes()
+            out += b"n"
+            self.write_str(value.dtype.str)
+            out += struct.pack("<B", value.ndim) + struct.pack(f"<{value.ndim}I", *value.shape)
+            out += struct.pack("<I", len(data)) + data
+        elif cls is pygame.Rect:
+            out += b"R" + struct.pack("<4i", *value)
+        elif cls is random.Random:
+            # Состояние вихря Мерсенна - 625 чисел по 32 бита, пишем их подряд
+            version, internal, gauss_next = value.getstate()
+            out += b"G"
+            self.write(version)
+            self.write_int(len(internal))
+            out += struct.pack(f"<{len(internal)}I", *internal)
+            self.write(gauss_next)
+        elif cls.__module__ == __name__:
+            out += b"O"
+            self.write_str(cls.__name__)
+            if "__setstate__" in vars(cls):
+                # Класс сам решает, что сохранять (EntityStore)
+                out += b"1"
+                self.write(value.__getstate__())
+                return
+            out += b"0"
+            fields = dict(getattr(value, "__dict__", {}))
+            for klass in cls.__mro__:
+                for name in vars(klass).get("__slots__", ()):
+                    if hasattr(value, name):
+                        fields[name] = getattr(value, name)
+            self.write_int(len(fields))
+            for name, item in fields.items():
+                self.write_str(name)
+                self.write(item)
+        else:
+            raise TypeError(f"Снимок уровня не умеет сохранять {cls.__name__}")
+
+class SnapshotReader:
+    # Чтение того, что записал SnapshotWriter
+    def __init__(self, data, byteorder):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.memo = []
+        self.strings = []
+        # Массивы array записаны в порядке байт сохранившей машины
+        self.swap = byteorder != sys.byteorder[0]
+
+    def read_bytes(self, size):
+        if size > len(self.data) - self.pos:
+            raise ValueError("Поврежденный снимок: данные обрываются")
+        start = self.pos
+        self.pos += size
+        return self.data[start:self.pos]
+
+    def read_int(self):
+        value, = struct.unpack_from("<I", self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def read_count(self, item_size=1):
+        # Число элементов; каждый занимает хотя бы item_size байт, так что
+        # испорченный счетчик не заставит выделять память под миллиарды элементов
+        count = self.read_int()
+        if count * item_size > len(self.data) - self.pos:
+            raise ValueError("Поврежденный снимок: счетчик больше остатка данных")
+        return count
+
+    def read(self):
+        tag = self.data[self.pos:self.pos + 1].tobytes()
+        self.pos += 1
+        if tag == b"N":
+            return None
+        if tag == b"T":
+            return True
+        if tag == b"F":
+            return False
+        if tag == b"i":
+            value, = struct.unpack_from("<q", self.data, self.pos)
+            self.pos += 8
+            return value
+        if tag == b"d":
+            value, = struct.unpack_from("<d", self.data, self.pos)
+            self.pos += 8
+            return value
+        if tag == b"s":
+            value = self.read_bytes(self.read_count()).tobytes().decode("utf-8")
+            self.strings.append(value)
+            return value
+        if tag == b"q":
+            return self.strings[self.read_int()]
+        if tag == b"I":
+            return int(self.read())
+        if tag == b"b":
+            return self.read_bytes(self.read_count()).tobytes()
+        if tag == b"t":
+            return tuple(self.read() for _ in range(self.read_count()))
+        if tag == b"r":
+            return self.memo[self.read_int()]
+        return self.read_object(tag)
+
+    def read_object(self, tag):
+        memo = self.memo
+        if tag == b"l":
+            value = []
+            memo.append(value)
+            value.extend(self.read() for _ in range(self.read_count()))
+        elif tag == b"D":
+            value = {}
+            memo.append(value)
+            for _ in range(self.read_count(2)):
+                key = self.read()
+                value[key] = self.read()
+        elif tag == b"S" or tag == b"Z":
+            # Множества не бывают частью цикла - собираем их целиком
+            index = len(memo)
+            memo.append(None)
+            items = [self.read() for _ in range(self.read_count())]
+            value = set(items) if tag == b"S" else frozenset(items)
+            memo[index] = value
+        elif tag == b"B":
+            value = bytearray(self.read_bytes(self.read_count()))
+            memo.append(value)
+        elif tag == b"a":
+            typecode = self.read_bytes(1).tobytes().decode("ascii")
+            value = array.array(typecode)
+            value.frombytes(self.read_bytes(self.read_count()))
+            if self.swap:
+                value.byteswap()
+            memo.append(value)
+        elif tag == b"n":
+            dtype = np.dtype(self.read())
+            ndim, = struct.unpack_from("<B", self.data, self.pos)
+            self.pos += 1
+            shape = struct.unpack_from(f"<{ndim}I", self.data, self.pos)
+            self.pos += 4 * ndim
+            value = np.frombuffer(self.read_bytes(self.read_count()), dtype=dtype).reshape(shape).copy()
+            memo.append(value)
+        elif tag == b"R":
+            value = pygame.Rect(struct.unpack_from("<4i", self.data, self.pos))
+            self.pos += 16
+            memo.append(value)
+        elif tag == b"G":
+            value = random.Random()
+            memo.append(value)
+            version = self.read()
+            count = self.read_count(4)
+            internal = struct.unpack_from(f"<{count}I", self.data, self.pos)
+            self.pos += 4 * count
+            value.setstate((version, internal, self.read()))
+        elif tag == b"O":
+            name = self.read()
+            cls = globals().get(name)
+            if not isinstance(cls, type) or cls.__module__ != __name__:
+                raise ValueError(f"Неизвестный класс в снимке: {name}")
+            value = cls.__new__(cls)
+            memo.append(value)
+            if self.read_bytes(1).tobytes() == b"1":
+                value.__setstate__(self.read())
+            else:
+                for _ in range(self.read_count(2)):
+                    field = self.read()
+                    if not isinstance(field, str):
+                        raise ValueError(f"Поврежденный снимок: поле {field!r} в {name}")
+                    # object.__setattr__ - и для неизменяемых классов (InputSnapshot)
+                    object.__setattr__(value, field, self.read())
+        else:
+            raise ValueError(f"Поврежденный снимок: тег {tag!r}")
+        return value
+
+def encode_snapshot(level, state):
+    writer = SnapshotWriter()
+    writer.write(state)
+    payload = bytes(writer.out)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder[0].encode("ascii"),
+                                  level, zlib.crc32(payload) & 0xffffffff)
+    return header + payload
+
+def decode_snapshot(data):
+    # Возвращает (уровень, состояние); ValueError - чужой или поврежденный файл
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise ValueError("Слишком короткий снимок")
+    magic, version, byteorder, level, checksum = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Это не снимок уровня")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Версия снимка {version} не поддерживается (нужна {SNAPSHOT_VERSION})")
+    payload = data[SNAPSHOT_HEADER.size:]
+    if zlib.crc32(payload) & 0xffffffff != checksum:
+        raise ValueError("Поврежденный снимок: не сходится контрольная сумма")
+    # Контрольная сумма не спасает от файла, собранного вручную: любая ошибка
+    # разбора (в том числе из конструкторов и __setstate__) - это ValueError,
+    # его и ловит быстрая загрузка
+    reader = SnapshotReader(payload, byteorder.decode("ascii", "replace"))
+    try:
+        state = reader.read()
+        if reader.pos != len(payload):
+            raise ValueError("Поврежденный снимок: лишние данные в конце")
+        if not isinstance(state, dict):
+            raise ValueError("Поврежденный снимок: состояние уровня не словарь")
+    except ValueError:
+        raise
+    except Exception as error:
+        raise ValueError(f"Поврежденный снимок: {error!r}") from error
+    return level, state
+
 class Player:
     def __init__(self, x, y, level_type="shooter"):
         self.x = x
@@ -93,8 +2204,10 @@ class Player:
             self.moves = 0
             self.target_moves = 50
         
-    def update(self, level_type="shooter"):
-        keys = pygame.key.get_pressed()
+    def update(self, level_type="shooter", keys=None):
+        # keys - снимок ввода тика (InputSnapshot)
+        if keys is None:
+            keys = InputSnapshot()
         
         if level_type == "shooter":
             # Обычное управление для шутера
@@ -180,7 +2293,7 @@ class Player:
         
         # Обновление поворота к мыши для survival
         if level_type == "survival":
-            mouse_x, mouse_y = pygame.mouse.get_pos()
+            mouse_x, mouse_y = keys.mouse_pos
             dx = mouse_x - (self.x + self.width//2)
             dy = mouse_y - (self.y + self.height//2)
             self.rotation_angle = math.atan2(dy, dx)
@@ -196,17 +2309,22 @@ class Player:
     def can_shoot(self):
         return self.shoot_cooldown <= 0
     
-    def shoot(self, level_type="shooter"):
+    def shoot(self, projectiles, level_type="shooter"):
+        # Возвращает True, если пуля выпущена
         if self.can_shoot():
             self.shoot_cooldown = 15
+            owner = projectiles.add_owner(self)
             if level_type == "survival":
                 # Для survival стреляем в направлении мыши
                 center_x = self.x + self.width//2
                 center_y = self.y + self.height//2
-                return PlayerBullet(center_x - 2, center_y - 5, speed=8, angle=self.rotation_angle)
+                projectiles.spawn("bullet", owner, center_x - 2, center_y - 5,
+                                  math.cos(self.rotation_angle) * 8, math.sin(self.rotation_angle) * 8)
             else:
-                return PlayerBullet(self.x + self.width//2 - 2, self.y)
-        return None
+                # Обычная пуля вверх
+                projectiles.spawn("bullet", owner, self.x + self.width//2 - 2, self.y, 0, -8)
+            return True
+        return False
     
     def activate_shield(self, duration=300):
         self.shield_active = True
@@ -218,84 +2336,133 @@ class Player:
             return True
         return False
     
+    def draw_ship(self, surface, x, y, flame_offset):
+        # ПРОДВИНУТЫЙ КОСМИЧЕСКИЙ КОРАБЛЬ
+        center_x = x + self.width//2
+        
+        # Основной корпус корабля - серебристый
+        main_body = [
+            (center_x, y),  # Нос
+            (center_x - 8, y + 8),  # Левое крыло
+            (center_x - 12, y + self.height - 8),
+            (center_x - 6, y + self.height),  # Левый хвост
+            (center_x + 6, y + self.height),  # Правый хвост  
+            (center_x + 12, y + self.height - 8),
+            (center_x + 8, y + 8),  # Правое крыло
+        ]
+        draw.polygon(surface, (180, 180, 200), main_body)
+        draw.polygon(surface, (220, 220, 240), main_body, 2)
+        
+        # Кабина пилота - тёмно-синее стекло
+        cockpit = [
+            (center_x, y + 2),
+            (center_x - 4, y + 8),
+            (center_x - 3, y + 12),
+            (center_x + 3, y + 12),
+            (center_x + 4, y + 8),
+        ]
+        draw.polygon(surface, (20, 40, 80), cockpit)
+        draw.polygon(surface, (60, 100, 160), cockpit, 1)
+        
+        # Двигатели - светящиеся сопла
+        # Левый двигатель
+        draw.circle(surface, (100, 100, 120), (center_x - 8, y + self.height - 3), 4)
+        draw.circle(surface, (255, 100, 0), (center_x - 8, y + self.height - 3), 2)
+        # Правый двигатель  
+        draw.circle(surface, (100, 100, 120), (center_x + 8, y + self.height - 3), 4)
+        draw.circle(surface, (255, 100, 0), (center_x + 8, y + self.height - 3), 2)
+        
+        # Центральный двигатель
+        draw.circle(surface, (120, 120, 140), (center_x, y + self.height - 2), 3)
+        draw.circle(surface, (255, 150, 50), (center_x, y + self.height - 2), 1)
+        
+        # Пламя из двигателей (кадр анимации)
+        flame_colors = [(255, 200, 0), (255, 100, 0), (255, 50, 0), (200, 0, 0)]
+        
+        for i in range(4):
+            flame_y = y + self.height + i * 2 + flame_offset
+            flame_alpha = 255 - i * 60
+            if flame_alpha > 0:
+                # Левое пламя
+                draw.circle(surface, flame_colors[i], 
+                                 (center_x - 8, flame_y), max(1, 3 - i))
+                # Правое пламя
+                draw.circle(surface, flame_colors[i], 
+                                 (center_x + 8, flame_y), max(1, 3 - i))
+                # Центральное пламя
+                draw.circle(surface, flame_colors[i], 
+                                 (center_x, flame_y - 1), max(1, 2 - i//2))
+        
+        # Детали корабля
+        # Боковые лазеры
+        draw.rect(surface, (150, 150, 170), (center_x - 10, y + 6, 2, 8))
+        draw.rect(surface, (150, 150, 170), (center_x + 8, y + 6, 2, 8))
+        
+        # Антенны/сенсоры
+        draw.circle(surface, (0, 255, 0), (center_x - 5, y + 5), 1)  # Левый сенсор
+        draw.circle(surface, (255, 0, 0), (center_x + 5, y + 5), 1)  # Правый сенсор
+        
+        # Центральная полоса
+        draw.line(surface, (100, 255, 100), 
+                       (center_x, y + 3), (center_x, y + self.height - 8), 2)
+
+    def draw_shape(self, surface, x, y, level_type):
+        # Простые фигуры игрока, которые не меняются во время уровня
+        if level_type == "racing":
+            # Гоночная машина
+            draw.rect(surface, RED, (x, y, self.width, self.height))
+            draw.rect(surface, BLACK, (x + 5, y - 5, 5, 5))  # Колесо
+            draw.rect(surface, BLACK, (x + 20, y - 5, 5, 5))  # Колесо
+        elif level_type == "puzzle":
+            # Кубик для головоломки
+            draw.rect(surface, PURPLE, (x, y, self.width, self.height))
+            draw.rect(surface, WHITE, (x + 2, y + 2, self.width - 4, self.height - 4), 2)
+        elif level_type == "tower_defense":
+            # Башня - большая и заметная
+            draw.rect(surface, GREEN, (x, y, self.width, self.height))
+            draw.rect(surface, DARK_GRAY, (x + 5, y - 10, self.width - 10, 10))  # Пушка
+            draw.circle(surface, YELLOW, (x + self.width//2, y + self.height//2), 5)  # Центр
+        elif level_type == "stealth":
+            # Шпион - синий с белыми глазами
+            draw.rect(surface, BLUE, (x, y, self.width, self.height))
+            draw.circle(surface, WHITE, (x + 8, y + 5), 3)  # Левый глаз
+            draw.circle(surface, WHITE, (x + 22, y + 5), 3)  # Правый глаз
+            draw.rect(surface, BLACK, (x + 10, y + 15, 10, 3))  # Рот
+        elif level_type == "fighting":
+            # Боец - красный с желтыми перчатками
+            draw.rect(surface, RED, (x, y, self.width, self.height))
+            draw.circle(surface, WHITE, (x + 8, y + 5), 3)  # Левый глаз
+            draw.circle(surface, WHITE, (x + 22, y + 5), 3)  # Правый глаз
+            draw.rect(surface, YELLOW, (x - 5, y + 10, 8, 8))  # Левая перчатка
+            draw.rect(surface, YELLOW, (x + self.width - 3, y + 10, 8, 8))  # Правая перчатка
+        elif level_type == "strategy":
+            # Командир - зеленый с золотыми знаками отличия
+            draw.rect(surface, GREEN, (x, y, self.width, self.height))
+            draw.circle(surface, WHITE, (x + 8, y + 5), 3)  # Левый глаз
+            draw.circle(surface, WHITE, (x + 22, y + 5), 3)  # Правый глаз
+            draw.rect(surface, YELLOW, (x + 5, y + 2, 20, 3))  # Погоны
+            draw.circle(surface, YELLOW, (x + 15, y + 12), 4)  # Медаль
+    
+    def get_sprite(self, level_type, flame_offset=0):
+        if level_type == "shooter" or level_type == "final_mix":
+            # Корабль запечен отдельно для каждого кадра пламени
+            return sprites.get(("ship", flame_offset), (self.width, self.height + 16), (0, 0),
+                               lambda surface, x, y: self.draw_ship(surface, x, y, flame_offset))
+        return sprites.get(("player", level_type), (self.width + 10, self.height + 15), (5, 10),
+                           lambda surface, x, y: self.draw_shape(surface, x, y, level_type))
+    
     def draw(self, screen, level_type="shooter"):
         # Рисуем щит если активен
         if self.shield_active:
-            pygame.draw.circle(screen, CYAN, 
+            draw.circle(screen, CYAN, 
                              (self.x + self.width//2, self.y + self.height//2), 
                              self.width, 2)
         
         if level_type == "shooter" or level_type == "final_mix":
-            # ПРОДВИНУТЫЙ КОСМИЧЕСКИЙ КОРАБЛЬ
-            center_x = self.x + self.width//2
-            center_y = self.y + self.height//2
-            
-            # Основной корпус корабля - серебристый
-            main_body = [
-                (center_x, self.y),  # Нос
-                (center_x - 8, self.y + 8),  # Левое крыло
-                (center_x - 12, self.y + self.height - 8),
-                (center_x - 6, self.y + self.height),  # Левый хвост
-                (center_x + 6, self.y + self.height),  # Правый хвост  
-                (center_x + 12, self.y + self.height - 8),
-                (center_x + 8, self.y + 8),  # Правое крыло
-            ]
-            pygame.draw.polygon(screen, (180, 180, 200), main_body)
-            pygame.draw.polygon(screen, (220, 220, 240), main_body, 2)
-            
-            # Кабина пилота - тёмно-синее стекло
-            cockpit = [
-                (center_x, self.y + 2),
-                (center_x - 4, self.y + 8),
-                (center_x - 3, self.y + 12),
-                (center_x + 3, self.y + 12),
-                (center_x + 4, self.y + 8),
-            ]
-            pygame.draw.polygon(screen, (20, 40, 80), cockpit)
-            pygame.draw.polygon(screen, (60, 100, 160), cockpit, 1)
-            
-            # Двигатели - светящиеся сопла
-            # Левый двигатель
-            pygame.draw.circle(screen, (100, 100, 120), (center_x - 8, self.y + self.height - 3), 4)
-            pygame.draw.circle(screen, (255, 100, 0), (center_x - 8, self.y + self.height - 3), 2)
-            # Правый двигатель  
-            pygame.draw.circle(screen, (100, 100, 120), (center_x + 8, self.y + self.height - 3), 4)
-            pygame.draw.circle(screen, (255, 100, 0), (center_x + 8, self.y + self.height - 3), 2)
-            
-            # Центральный двигатель
-            pygame.draw.circle(screen, (120, 120, 140), (center_x, self.y + self.height - 2), 3)
-            pygame.draw.circle(screen, (255, 150, 50), (center_x, self.y + self.height - 2), 1)
-            
-            # Пламя из двигателей (анимированное)
             flame_offset = (pygame.time.get_ticks() // 50) % 4
-            flame_colors = [(255, 200, 0), (255, 100, 0), (255, 50, 0), (200, 0, 0)]
-            
-            for i in range(4):
-                flame_y = self.y + self.height + i * 2 + flame_offset
-                flame_alpha = 255 - i * 60
-                if flame_alpha > 0:
-                    # Левое пламя
-                    pygame.draw.circle(screen, flame_colors[i], 
-                                     (center_x - 8, flame_y), max(1, 3 - i))
-                    # Правое пламя
-                    pygame.draw.circle(screen, flame_colors[i], 
-                                     (center_x + 8, flame_y), max(1, 3 - i))
-                    # Центральное пламя
-                    pygame.draw.circle(screen, flame_colors[i], 
-                                     (center_x, flame_y - 1), max(1, 2 - i//2))
-            
-            # Детали корабля
-            # Боковые лазеры
-            pygame.draw.rect(screen, (150, 150, 170), (center_x - 10, self.y + 6, 2, 8))
-            pygame.draw.rect(screen, (150, 150, 170), (center_x + 8, self.y + 6, 2, 8))
-            
-            # Антенны/сенсоры
-            pygame.draw.circle(screen, (0, 255, 0), (center_x - 5, self.y + 5), 1)  # Левый сенсор
-            pygame.draw.circle(screen, (255, 0, 0), (center_x + 5, self.y + 5), 1)  # Правый сенсор
-            
-            # Центральная полоса
-            pygame.draw.line(screen, (100, 255, 100), 
-                           (center_x, self.y + 3), (center_x, self.y + self.height - 8), 2)
+            return sprites.blit(screen, self.get_sprite(level_type, flame_offset), self.x, self.y)
+        elif level_type in BAKED_PLAYER_LEVELS:
+            return sprites.blit(screen, self.get_sprite(level_type), self.x, self.y)
         elif level_type == "platformer":
             # Персонаж платформера с индикацией зарядки
             player_color = BLUE
@@ -304,9 +2471,9 @@ class Player:
                 charge_intensity = self.jump_charge / self.max_jump_charge
                 player_color = (int(255 * charge_intensity), int(100 + 155 * charge_intensity), 255)
             
-            pygame.draw.rect(screen, player_color, (self.x, self.y, self.width, self.height))
-            pygame.draw.circle(screen, WHITE, (self.x + 10, self.y + 5), 3)  # Глаз
-            pygame.draw.circle(screen, WHITE, (self.x + 20, self.y + 5), 3)  # Глаз
+            draw.rect(screen, player_color, (self.x, self.y, self.width, self.height))
+            draw.circle(screen, WHITE, (self.x + 10, self.y + 5), 3)  # Глаз
+            draw.circle(screen, WHITE, (self.x + 20, self.y + 5), 3)  # Глаз
             
             # Индикатор зарядки прыжка
             if hasattr(self, 'is_charging_jump') and self.is_charging_jump:
@@ -316,64 +2483,30 @@ class Player:
                 bar_y = self.y - 15
                 
                 # Фон полоски
-                pygame.draw.rect(screen, GRAY, (bar_x, bar_y, bar_width, bar_height))
+                draw.rect(screen, GRAY, (bar_x, bar_y, bar_width, bar_height))
                 
                 # Заполнение по заряду
                 charge_ratio = self.jump_charge / self.max_jump_charge
                 fill_width = int(bar_width * charge_ratio)
                 fill_color = (255, int(255 * (1 - charge_ratio)), 0)  # От красного к желтому
-                pygame.draw.rect(screen, fill_color, (bar_x, bar_y, fill_width, bar_height))
-                
-                # Рамка
-                pygame.draw.rect(screen, WHITE, (bar_x, bar_y, bar_width, bar_height), 1)
-        elif level_type == "racing":
-            # Гоночная машина
-            pygame.draw.rect(screen, RED, (self.x, self.y, self.width, self.height))
-            pygame.draw.rect(screen, BLACK, (self.x + 5, self.y - 5, 5, 5))  # Колесо
-            pygame.draw.rect(screen, BLACK, (self.x + 20, self.y - 5, 5, 5))  # Колесо
-        elif level_type == "puzzle":
-            # Кубик для головоломки
-            pygame.draw.rect(screen, PURPLE, (self.x, self.y, self.width, self.height))
-            pygame.draw.rect(screen, WHITE, (self.x + 2, self.y + 2, self.width - 4, self.height - 4), 2)
-        elif level_type == "tower_defense":
-            # Башня - большая и заметная
-            pygame.draw.rect(screen, GREEN, (self.x, self.y, self.width, self.height))
-            pygame.draw.rect(screen, DARK_GRAY, (self.x + 5, self.y - 10, self.width - 10, 10))  # Пушка
-            pygame.draw.circle(screen, YELLOW, (self.x + self.width//2, self.y + self.height//2), 5)  # Центр
-        elif level_type == "stealth":
-            # Шпион - синий с белыми глазами
-            pygame.draw.rect(screen, BLUE, (self.x, self.y, self.width, self.height))
-            pygame.draw.circle(screen, WHITE, (self.x + 8, self.y + 5), 3)  # Левый глаз
-            pygame.draw.circle(screen, WHITE, (self.x + 22, self.y + 5), 3)  # Правый глаз
-            pygame.draw.rect(screen, BLACK, (self.x + 10, self.y + 15, 10, 3))  # Рот
-        elif level_type == "fighting":
-            # Боец - красный с желтыми перчатками
-            pygame.draw.rect(screen, RED, (self.x, self.y, self.width, self.height))
-            pygame.draw.circle(screen, WHITE, (self.x + 8, self.y + 5), 3)  # Левый глаз
-            pygame.draw.circle(screen, WHITE, (self.x + 22, self.y + 5), 3)  # Правый глаз
-            pygame.draw.rect(screen, YELLOW, (self.x - 5, self.y + 10, 8, 8))  # Левая перчатка
-            pygame.draw.rect(screen, YELLOW, (self.x + self.width - 3, self.y + 10, 8, 8))  # Правая перчатка
-        elif level_type == "strategy":
-            # Командир - зеленый с золотыми знаками отличия
-            pygame.draw.rect(screen, GREEN, (self.x, self.y, self.width, self.height))
-            pygame.draw.circle(screen, WHITE, (self.x + 8, self.y + 5), 3)  # Левый глаз
-            pygame.draw.circle(screen, WHITE, (self.x + 22, self.y + 5), 3)  # Правый глаз
-            pygame.draw.rect(screen, YELLOW, (self.x + 5, self.y + 2, 20, 3))  # Погоны
-            pygame.draw.circle(screen, YELLOW, (self.x + 15, self.y + 12), 4)  # Медаль
+                draw.rect(screen, fill_color, (bar_x, bar_y, fill_width, bar_height))
+                
+                # Рамка
+                draw.rect(screen, WHITE, (bar_x, bar_y, bar_width, bar_height), 1)
         elif level_type == "survival":
             # Выживший с поворотом к мыши
             center_x = self.x + self.width//2
             center_y = self.y + self.height//2
             
             # Основное тело - зеленый прямоугольник
-            pygame.draw.rect(screen, GREEN, (self.x, self.y, self.width, self.height))
-            pygame.draw.rect(screen, DARK_GRAY, (self.x + 2, self.y + 2, self.width - 4, self.height - 4), 2)
+            draw.rect(screen, GREEN, (self.x, self.y, self.width, self.height))
+            draw.rect(screen, DARK_GRAY, (self.x + 2, self.y + 2, self.width - 4, self.height - 4), 2)
             
             # Глаза
-            pygame.draw.circle(screen, WHITE, (self.x + 8, self.y + 6), 3)
-            pygame.draw.circle(screen, WHITE, (self.x + 22, self.y + 6), 3)
-            pygame.draw.circle(screen, BLACK, (self.x + 8, self.y + 6), 1)  # Зрачки
-            pygame.draw.circle(screen, BLACK, (self.x + 22, self.y + 6), 1)
+            draw.circle(screen, WHITE, (self.x + 8, self.y + 6), 3)
+            draw.circle(screen, WHITE, (self.x + 22, self.y + 6), 3)
+            draw.circle(screen, BLACK, (self.x + 8, self.y + 6), 1)  # Зрачки
+            draw.circle(screen, BLACK, (self.x + 22, self.y + 6), 1)
             
             # Оружие (направлено в сторону мыши)
             weapon_length = 25
@@ -381,82 +2514,63 @@ class Player:
             weapon_end_y = center_y + math.sin(self.rotation_angle) * weapon_length
             
             # Ствол оружия
-            pygame.draw.line(screen, BLACK, (center_x, center_y), (weapon_end_x, weapon_end_y), 4)
-            pygame.draw.line(screen, GRAY, (center_x, center_y), (weapon_end_x, weapon_end_y), 2)
+            draw.line(screen, BLACK, (center_x, center_y), (weapon_end_x, weapon_end_y), 4)
+            draw.line(screen, GRAY, (center_x, center_y), (weapon_end_x, weapon_end_y), 2)
             
             # Рукоятка
             grip_offset = 8
             grip_x = center_x - math.cos(self.rotation_angle) * grip_offset
             grip_y = center_y - math.sin(self.rotation_angle) * grip_offset
-            pygame.draw.circle(screen, BROWN, (int(grip_x), int(grip_y)), 4)
+            draw.circle(screen, BROWN, (int(grip_x), int(grip_y)), 4)
             
             # Дуло оружия
-            pygame.draw.circle(screen, BLACK, (int(weapon_end_x), int(weapon_end_y)), 3)
-            pygame.draw.circle(screen, DARK_GRAY, (int(weapon_end_x), int(weapon_end_y)), 2)
+            draw.circle(screen, BLACK, (int(weapon_end_x), int(weapon_end_y)), 3)
+            draw.circle(screen, DARK_GRAY, (int(weapon_end_x), int(weapon_end_y)), 2)
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
 
-class Missile:
-    def __init__(self, x, y, target, speed=2):
-        self.x = x
-        self.y = y
-        self.target = target
-        self.speed = speed
-        self.width = 8
-        self.height = 15
-        
-    def update(self):
-        # Самонаведение на игрока
-        dx = self.target.x + self.target.width//2 - self.x
-        dy = self.target.y + self.target.height//2 - self.y
-        distance = math.sqrt(dx*dx + dy*dy)
-        
-        if distance > 0:
-            self.x += (dx / distance) * self.speed
-            self.y += (dy / distance) * self.speed
-    
-    def draw(self, screen):
-        pygame.draw.rect(screen, RED, (self.x, self.y, self.width, self.height))
-        pygame.draw.circle(screen, ORANGE, (int(self.x + self.width//2), int(self.y + self.height)), 3)
-    
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
+# Размер ракеты
+MISSILE_WIDTH = 8
+MISSILE_HEIGHT = 15
 
-class PlayerBullet:
-    def __init__(self, x, y, speed=8, angle=None):
-        self.x = x
-        self.y = y
-        self.width = 4
-        self.height = 10
-        self.speed = speed
-        self.angle = angle
-        if angle is not None:
-            # Направленная пуля (для survival)
-            self.dx = math.cos(angle) * speed
-            self.dy = math.sin(angle) * speed
-        else:
-            # Обычная пуля вверх
-            self.dx = 0
-            self.dy = -speed
-        
-    def update(self):
-        if self.angle is not None:
-            # Направленная пуля
-            self.x += self.dx
-            self.y += self.dy
-        else:
-            # Обычная пуля вверх
-            self.y -= self.speed
+def draw_missile_shape(surface, x, y, trail):
+    draw.rect(surface, RED, (x, y, MISSILE_WIDTH, MISSILE_HEIGHT))
+    draw.circle(surface, ORANGE, (x + MISSILE_WIDTH//2, y + MISSILE_HEIGHT), 3)
     
-    def draw(self, screen):
-        pygame.draw.rect(screen, YELLOW, (self.x, self.y, self.width, self.height))
+    if trail:
+        # Плазменный след
+        for i in range(8):
+            trail_size = max(1, 4 - i//2)
+            trail_color = (255, 100 + i*10, 50)
+            draw.circle(surface, trail_color, (x - i * 2, y + MISSILE_HEIGHT + i), trail_size)
+
+def get_missile_sprite(trail=False):
+    return sprites.get(("missile", trail), (32, 32), (20, 4),
+                       lambda surface, x, y: draw_missile_shape(surface, x, y, trail))
+
+class Missile(EntityRecord):
+    # Самонаводящаяся ракета; наводится на игрока в update_shooter/update_final_mix
+    __slots__ = ()
+    KINDS = (("missile", 0, 0, MISSILE_WIDTH, MISSILE_HEIGHT),)
+    COMPONENTS = (("speed", np.float64),)
+
+def draw_player_bullet_shape(surface, x, y, glow):
+    draw.rect(surface, YELLOW, (x, y, 4, 10))
     
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
+    if glow:
+        # Энергетическое свечение
+        for i in range(3):
+            glow_color = (0, 255 - i*50, 255)
+            glow_radius = 8 - i * 2
+            draw.circle(surface, glow_color, (x + 2, y + 5), glow_radius)
+
+def get_player_bullet_sprite(glow=False):
+    return sprites.get(("player_bullet", glow), (24, 28), (10, 8),
+                       lambda surface, x, y: draw_player_bullet_shape(surface, x, y, glow))
 
 class Boss:
-    def __init__(self, x, y):
+    def __init__(self, x, y, projectiles):
         self.x = x
         self.y = y
         self.width = 120
@@ -469,7 +2583,9 @@ class Boss:
         self.attack_timer = 0
         self.phase = 1  # Фазы босса: 1, 2, 3
         self.special_attack_timer = 0
-        self.boss_bullets = []
+        # Пули босса живут в общей системе снарядов уровня
+        self.projectiles = projectiles
+        self.owner = projectiles.add_owner(self)
         
     def update(self, player):
         # Движение босса
@@ -507,13 +2623,8 @@ class Boss:
             distance = math.sqrt(dx*dx + dy*dy)
             if distance > 0:
                 bullet_speed = 3 + self.phase
-                self.boss_bullets.append({
-                    "x": self.x + self.width//2,
-                    "y": self.y + self.height,
-                    "dx": (dx / distance) * bullet_speed,
-                    "dy": (dy / distance) * bullet_speed,
-                    "type": "normal"
-                })
+                self.projectiles.spawn("normal", self.owner, self.x + self.width//2, self.y + self.height,
+                                       (dx / distance) * bullet_speed, (dy / distance) * bullet_speed)
             self.attack_timer = 0
         
         # Специальные атаки
@@ -522,70 +2633,56 @@ class Boss:
                 # Фаза 2: Веерная стрельба
                 for angle in range(-45, 46, 15):
                     rad = math.radians(angle)
-                    self.boss_bullets.append({
-                        "x": self.x + self.width//2,
-                        "y": self.y + self.height,
-                        "dx": math.sin(rad) * 4,
-                        "dy": math.cos(rad) * 4,
-                        "type": "spread"
-                    })
+                    self.projectiles.spawn("spread", self.owner, self.x + self.width//2, self.y + self.height,
+                                           math.sin(rad) * 4, math.cos(rad) * 4)
             elif self.phase == 3:
                 # Фаза 3: Круговая атака + веерная
                 for angle in range(0, 360, 30):
                     rad = math.radians(angle)
-                    self.boss_bullets.append({
-                        "x": self.x + self.width//2,
-                        "y": self.y + self.height//2,
-                        "dx": math.cos(rad) * 3,
-                        "dy": math.sin(rad) * 3,
-                        "type": "circle"
-                    })
+                    self.projectiles.spawn("circle", self.owner, self.x + self.width//2, self.y + self.height//2,
+                                           math.cos(rad) * 3, math.sin(rad) * 3)
                 # Плюс веерная атака
                 for angle in range(-60, 61, 10):
                     rad = math.radians(angle)
-                    self.boss_bullets.append({
-                        "x": self.x + self.width//2,
-                        "y": self.y + self.height,
-                        "dx": math.sin(rad) * 5,
-                        "dy": math.cos(rad) * 5,
-                        "type": "spread"
-                    })
+                    self.projectiles.spawn("spread", self.owner, self.x + self.width//2, self.y + self.height,
+                                           math.sin(rad) * 5, math.cos(rad) * 5)
             self.special_attack_timer = 0
-        
-        # Обновление пуль босса
-        for bullet in self.boss_bullets[:]:
-            bullet["x"] += bullet["dx"]
-            bullet["y"] += bullet["dy"]
-            
-            # Удаляем пули за границами экрана
-            if (bullet["x"] < -10 or bullet["x"] > SCREEN_WIDTH + 10 or
-                bullet["y"] < -10 or bullet["y"] > SCREEN_HEIGHT + 10):
-                self.boss_bullets.remove(bullet)
+    
+    def cull_bullets(self):
+        # Удаляем пули за границами экрана
+        self.projectiles.cull(self.owner, -10, -10, SCREEN_WIDTH + 10, SCREEN_HEIGHT + 10)
     
     def take_damage(self, damage):
         self.health -= damage
         return self.health <= 0
     
-    def draw(self, screen):
+    def draw_shape(self, surface, x, y):
         # Основное тело босса - большой красный корабль
-        pygame.draw.rect(screen, RED, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, DARK_GRAY, (self.x + 10, self.y + 10, self.width - 20, self.height - 20), 3)
+        draw.rect(surface, RED, (x, y, self.width, self.height))
+        draw.rect(surface, DARK_GRAY, (x + 10, y + 10, self.width - 20, self.height - 20), 3)
         
         # Детали босса
         # Пушки
-        pygame.draw.rect(screen, BLACK, (self.x + 20, self.y + self.height, 15, 20))
-        pygame.draw.rect(screen, BLACK, (self.x + self.width - 35, self.y + self.height, 15, 20))
-        pygame.draw.rect(screen, BLACK, (self.x + self.width//2 - 10, self.y + self.height, 20, 25))
+        draw.rect(surface, BLACK, (x + 20, y + self.height, 15, 20))
+        draw.rect(surface, BLACK, (x + self.width - 35, y + self.height, 15, 20))
+        draw.rect(surface, BLACK, (x + self.width//2 - 10, y + self.height, 20, 25))
         
         # Глаза/огни
-        pygame.draw.circle(screen, YELLOW, (self.x + 30, self.y + 20), 8)
-        pygame.draw.circle(screen, YELLOW, (self.x + self.width - 30, self.y + 20), 8)
-        pygame.draw.circle(screen, RED, (self.x + 30, self.y + 20), 4)
-        pygame.draw.circle(screen, RED, (self.x + self.width - 30, self.y + 20), 4)
+        draw.circle(surface, YELLOW, (x + 30, y + 20), 8)
+        draw.circle(surface, YELLOW, (x + self.width - 30, y + 20), 8)
+        draw.circle(surface, RED, (x + 30, y + 20), 4)
+        draw.circle(surface, RED, (x + self.width - 30, y + 20), 4)
         
         # Центральное ядро
-        pygame.draw.circle(screen, ORANGE, (self.x + self.width//2, self.y + self.height//2), 15)
-        pygame.draw.circle(screen, YELLOW, (self.x + self.width//2, self.y + self.height//2), 8)
+        draw.circle(surface, ORANGE, (x + self.width//2, y + self.height//2), 15)
+        draw.circle(surface, YELLOW, (x + self.width//2, y + self.height//2), 8)
+    
+    def get_sprite(self):
+        return sprites.get(("boss",), (self.width, self.height + 25), (0, 0), self.draw_shape)
+    
+    def draw(self, screen, batch):
+        # Корпус босса запечен в спрайт
+        sprites.blit(screen, self.get_sprite(), self.x, self.y)
         
         # Полоса здоровья босса
         bar_width = 200
@@ -594,32 +2691,34 @@ class Boss:
         bar_y = 20
         
         # Фон полосы
-        pygame.draw.rect(screen, DARK_GRAY, (bar_x, bar_y, bar_width, bar_height))
+        draw.rect(screen, DARK_GRAY, (bar_x, bar_y, bar_width, bar_height))
         
         # Здоровье
         health_width = int((self.health / self.max_health) * bar_width)
         health_color = GREEN if self.health > self.max_health * 0.5 else (YELLOW if self.health > self.max_health * 0.25 else RED)
-        pygame.draw.rect(screen, health_color, (bar_x, bar_y, health_width, bar_height))
+        draw.rect(screen, health_color, (bar_x, bar_y, health_width, bar_height))
         
         # Рамка
-        pygame.draw.rect(screen, WHITE, (bar_x, bar_y, bar_width, bar_height), 2)
+        draw.rect(screen, WHITE, (bar_x, bar_y, bar_width, bar_height), 2)
         
         # Текст босса
-        font = pygame.font.Font(None, 24)
-        boss_text = font.render(f"БОСС - ФАЗА {self.phase}", True, WHITE)
+        boss_text = text_cache.render(fonts.get(24), f"БОСС - ФАЗА {self.phase}", True, WHITE)
         screen.blit(boss_text, (bar_x, bar_y - 25))
         
-        # Пули босса
-        for bullet in self.boss_bullets:
-            color = RED if bullet["type"] == "normal" else (ORANGE if bullet["type"] == "spread" else PURPLE)
-            pygame.draw.circle(screen, color, (int(bullet["x"]), int(bullet["y"])), 4)
-            pygame.draw.circle(screen, WHITE, (int(bullet["x"]), int(bullet["y"])), 2)
+        # Пули босса - в общий пакет слоя, его выводит уровень
+        self.projectiles.draw(batch, self.get_bullet_sprite, self.owner)
+    
+    def draw_bullet_shape(self, surface, x, y, bullet_type):
+        color = RED if bullet_type == "normal" else (ORANGE if bullet_type == "spread" else PURPLE)
+        draw.circle(surface, color, (x, y), 4)
+        draw.circle(surface, WHITE, (x, y), 2)
+    
+    def get_bullet_sprite(self, bullet_type):
+        return sprites.get(("boss_bullet", bullet_type), (9, 9), (4, 4),
+                           lambda surface, x, y: self.draw_bullet_shape(surface, x, y, bullet_type))
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
-    
-    def get_bullet_rects(self):
-        return [pygame.Rect(bullet["x"] - 4, bullet["y"] - 4, 8, 8) for bullet in self.boss_bullets]
 
 class Platform:
     def __init__(self, x, y, width, height, is_wall=False):
@@ -632,32 +2731,14 @@ class Platform:
     def draw(self, screen):
         if self.is_wall:
             # Стены для wall jump - темно-серые с текстурой
-            pygame.draw.rect(screen, DARK_GRAY, (self.x, self.y, self.width, self.height))
+            draw.rect(screen, DARK_GRAY, (self.x, self.y, self.width, self.height))
             # Добавляем текстуру стены
             for i in range(0, self.height, 20):
-                pygame.draw.line(screen, GRAY, (self.x, self.y + i), (self.x + self.width, self.y + i), 1)
-            pygame.draw.rect(screen, WHITE, (self.x, self.y, self.width, self.height), 2)
+                draw.line(screen, GRAY, (self.x, self.y + i), (self.x + self.width, self.y + i), 1)
+            draw.rect(screen, WHITE, (self.x, self.y, self.width, self.height), 2)
         else:
             # Обычные платформы - коричневые
-            pygame.draw.rect(screen, BROWN, (self.x, self.y, self.width, self.height))
-    
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-class RacingObstacle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.width = 30
-        self.height = 30
-        self.speed = 5
-    
-    def update(self):
-        self.y += self.speed
-    
-    def draw(self, screen):
-        pygame.draw.rect(screen, GRAY, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, WHITE, (self.x + 5, self.y + 5, self.width - 10, self.height - 10))
+            draw.rect(screen, BROWN, (self.x, self.y, self.width, self.height))
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
@@ -673,33 +2754,11 @@ class PuzzleBlock:
     
     def draw(self, screen):
         if self.block_type == "wall":
-            pygame.draw.rect(screen, GRAY, (self.x, self.y, self.width, self.height))
+            draw.rect(screen, GRAY, (self.x, self.y, self.width, self.height))
         elif self.block_type == "goal":
-            pygame.draw.rect(screen, GREEN, (self.x, self.y, self.width, self.height))
+            draw.rect(screen, GREEN, (self.x, self.y, self.width, self.height))
         elif self.block_type == "key" and not self.collected:
-            pygame.draw.rect(screen, YELLOW, (self.x, self.y, self.width, self.height))
-    
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
-
-class RhythmNote:
-    def __init__(self, x, y, note_type):
-        self.x = x
-        self.y = y
-        self.width = 30
-        self.height = 20
-        self.speed = 3
-        self.note_type = note_type  # "left", "right", "up", "down"
-        self.hit = False
-    
-    def update(self):
-        self.y += self.speed
-    
-    def draw(self, screen):
-        colors = {"left": RED, "right": BLUE, "up": GREEN, "down": YELLOW}
-        color = colors.get(self.note_type, WHITE)
-        pygame.draw.rect(screen, color, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, WHITE, (self.x + 2, self.y + 2, self.width - 4, self.height - 4), 2)
+            draw.rect(screen, YELLOW, (self.x, self.y, self.width, self.height))
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
@@ -718,8 +2777,8 @@ class Spike:
             (self.x, self.y + self.height),    # Левый угол
             (self.x + self.width, self.y + self.height)  # Правый угол
         ]
-        pygame.draw.polygon(screen, RED, points)
-        pygame.draw.polygon(screen, DARK_GRAY, points, 2)
+        draw.polygon(screen, RED, points)
+        draw.polygon(screen, DARK_GRAY, points, 2)
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
@@ -762,121 +2821,89 @@ class Saw:
         radius = self.width // 2
         
         # Основной круг пилы
-        pygame.draw.circle(screen, GRAY, (center_x, center_y), radius)
+        draw.circle(screen, GRAY, (center_x, center_y), radius)
         
         # Зубцы пилы
         for i in range(8):
             angle = (self.rotation + i * 45) * math.pi / 180
             end_x = center_x + int((radius + 5) * math.cos(angle))
             end_y = center_y + int((radius + 5) * math.sin(angle))
-            pygame.draw.line(screen, DARK_GRAY, (center_x, center_y), (end_x, end_y), 3)
+            draw.line(screen, DARK_GRAY, (center_x, center_y), (end_x, end_y), 3)
         
         # Центр пилы
-        pygame.draw.circle(screen, BLACK, (center_x, center_y), 3)
+        draw.circle(screen, BLACK, (center_x, center_y), 3)
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
 
-class Zombie:
-    def __init__(self, x, y, zombie_type="basic"):
-        self.x = x
-        self.y = y
-        self.width = 25
-        self.height = 25
-        self.zombie_type = zombie_type
-        self.speed = 0.8
-        self.health = 30
-        self.max_health = 30
-        self.damage = 10
-        self.attack_cooldown = 0
-        
-        # Разные типы зомби
-        if zombie_type == "fast":
-            self.speed = 1.5
-            self.health = 20
-            self.max_health = 20
-            self.damage = 8
-            self.color = YELLOW
-        elif zombie_type == "tank":
-            self.speed = 0.4
-            self.health = 80
-            self.max_health = 80
-            self.damage = 20
-            self.color = PURPLE
-        elif zombie_type == "runner":
-            self.speed = 2.0
-            self.health = 15
-            self.max_health = 15
-            self.damage = 5
-            self.color = GREEN
-        else:  # basic
-            self.color = RED
-    
-    def update(self, player):
-        # Движение к игроку
-        dx = player.x - self.x
-        dy = player.y - self.y
-        distance = max(1, math.sqrt(dx*dx + dy*dy))
-        
-        # Нормализуем направление и применяем скорость
-        self.x += (dx / distance) * self.speed
-        self.y += (dy / distance) * self.speed
-        
-        # Кулдаун атаки
-        if self.attack_cooldown > 0:
-            self.attack_cooldown -= 1
-    
-    def can_attack(self, player):
-        distance = math.sqrt((self.x - player.x)**2 + (self.y - player.y)**2)
-        return distance < 30 and self.attack_cooldown <= 0
+# Типы зомби: скорость, здоровье, урон, цвет
+ZOMBIE_TYPES = {
+    "basic": (0.8, 30, 10, RED),
+    "fast": (1.5, 20, 8, YELLOW),
+    "tank": (0.4, 80, 20, PURPLE),
+    "runner": (2.0, 15, 5, GREEN),
+}
+ZOMBIE_SIZE = 25
+
+def draw_zombie_shape(surface, x, y, zombie_type, health_width):
+    size = ZOMBIE_SIZE
+    # Тело зомби
+    draw.rect(surface, ZOMBIE_TYPES[zombie_type][3], (x, y, size, size))
+    draw.rect(surface, DARK_GRAY, (x + 2, y + 2, size - 4, size - 4), 2)
     
-    def attack(self, player):
-        if self.can_attack(player):
-            player.take_damage(self.damage)
-            self.attack_cooldown = 60  # 1 секунда кулдаун
-            return True
-        return False
+    # Глаза зомби
+    draw.circle(surface, RED, (x + 8, y + 8), 3)
+    draw.circle(surface, RED, (x + 17, y + 8), 3)
     
-    def take_damage(self, damage):
-        self.health -= damage
-        return self.health <= 0
+    # Рот зомби
+    draw.rect(surface, BLACK, (x + 8, y + 15, 9, 3))
     
-    def draw(self, screen):
-        # Тело зомби
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, DARK_GRAY, (self.x + 2, self.y + 2, self.width - 4, self.height - 4), 2)
-        
-        # Глаза зомби
-        pygame.draw.circle(screen, RED, (int(self.x + 8), int(self.y + 8)), 3)
-        pygame.draw.circle(screen, RED, (int(self.x + 17), int(self.y + 8)), 3)
-        
-        # Рот зомби
-        pygame.draw.rect(screen, BLACK, (self.x + 8, self.y + 15, 9, 3))
-        
-        # Полоса здоровья
-        if self.health < self.max_health:
-            health_width = int((self.health / self.max_health) * self.width)
-            pygame.draw.rect(screen, RED, (self.x, self.y - 8, self.width, 4))
-            pygame.draw.rect(screen, GREEN, (self.x, self.y - 8, health_width, 4))
-        
-        # Детали разных типов зомби
-        if self.zombie_type == "tank":
-            # Броня
-            pygame.draw.rect(screen, GRAY, (self.x + 5, self.y + 5, 15, 15), 2)
-        elif self.zombie_type == "fast":
-            # Когти
-            pygame.draw.line(screen, BLACK, (self.x, self.y + 12), (self.x - 5, self.y + 8), 2)
-            pygame.draw.line(screen, BLACK, (self.x + self.width, self.y + 12), (self.x + self.width + 5, self.y + 8), 2)
-        elif self.zombie_type == "runner":
-            # Следы движения
-            pygame.draw.circle(screen, (0, 255, 0, 100), (int(self.x - 5), int(self.y + 12)), 3)
-            pygame.draw.circle(screen, (0, 255, 0, 50), (int(self.x - 10), int(self.y + 12)), 2)
+    # Полоса здоровья
+    if health_width is not None:
+        draw.rect(surface, RED, (x, y - 8, size, 4))
+        draw.rect(surface, GREEN, (x, y - 8, health_width, 4))
     
-    def get_rect(self):
-        return pygame.Rect(self.x, self.y, self.width, self.height)
+    # Детали разных типов зомби
+    if zombie_type == "tank":
+        # Броня
+        draw.rect(surface, GRAY, (x + 5, y + 5, 15, 15), 2)
+    elif zombie_type == "fast":
+        # Когти
+        draw.line(surface, BLACK, (x, y + 12), (x - 5, y + 8), 2)
+        draw.line(surface, BLACK, (x + size, y + 12), (x + size + 5, y + 8), 2)
+    elif zombie_type == "runner":
+        # Следы движения
+        draw.circle(surface, (0, 255, 0, 100), (x - 5, y + 12), 3)
+        draw.circle(surface, (0, 255, 0, 50), (x - 10, y + 12), 2)
+
+def get_zombie_sprite(zombie_type, health_width=None):
+    # Спрайт запекается для каждого типа и ширины полосы здоровья
+    # (None - здоровье полное, полоса не рисуется)
+    return sprites.get(("zombie", zombie_type, health_width),
+                       (ZOMBIE_SIZE + 30, ZOMBIE_SIZE + 20), (15, 10),
+                       lambda surface, x, y: draw_zombie_shape(surface, x, y, zombie_type, health_width))
+
+def draw_zombie_trail_shape(surface, x, y):
+    # Кровавые следы позади зомби
+    for i in range(3):
+        draw.circle(surface, (60, 10, 10), (x - (i + 1) * 8, y + 10 + i * 2), 3 - i)
+
+def get_zombie_trail_sprite():
+    return sprites.get("zombie_trail", (30, 20), (28, 0), draw_zombie_trail_shape)
+
+class Zombie(EntityRecord):
+    # Зомби выживания; движение и атаки считаются по всем зомби сразу в update_survival
+    __slots__ = ()
+    KINDS = tuple((zombie_type, 0, 0, ZOMBIE_SIZE, ZOMBIE_SIZE) for zombie_type in ZOMBIE_TYPES)
+    COMPONENTS = (("speed", np.float64), ("max_health", np.float64), ("damage", np.int32),
+                  ("attack_cooldown", np.int32))
+    zombie_type = EntityRecord.kind_name
+
 
 class TowerDefenseBoss:
-    def __init__(self, x, y):
+    def __init__(self, x, y, projectiles, rng):
+        # rng - потоки случайных чисел уровня (RandomStreams)
+        self.rng = rng
         self.x = x
         self.y = y
         self.width = 80
@@ -888,8 +2915,8 @@ class TowerDefenseBoss:
         self.attack_timer = 0
         self.special_attack_timer = 0
         self.minion_spawn_timer = 0
-        self.boss_bullets = []
-        self.minions = []
+        self.projectiles = projectiles
+        self.owner = projectiles.add_owner(self)
         self.phase = 1
         self.rage_mode = False
         self.shield_active = False
@@ -897,6 +2924,7 @@ class TowerDefenseBoss:
         self.teleport_timer = 0
         
     def update(self, towers, enemies):
+        # enemies - хранилище врагов уровня, миньоны появляются прямо в нем
         # Определяем фазу босса
         health_percent = self.health / self.max_health
         if health_percent > 0.75:
@@ -925,7 +2953,7 @@ class TowerDefenseBoss:
         if self.phase >= 3:
             self.teleport_timer += 1
             if self.teleport_timer >= 300:  # Каждые 5 секунд
-                self.x = random.randint(100, SCREEN_WIDTH - self.width - 100)
+                self.x = self.rng.ai.randint(100, SCREEN_WIDTH - self.width - 100)
                 self.teleport_timer = 0
         
         # Основные атаки - МЕДЛЕННЕЕ
@@ -934,33 +2962,21 @@ class TowerDefenseBoss:
         
         if self.attack_timer >= attack_rate:
             # Лазерные лучи к башням - РЕЖЕ
-            if towers and random.random() < 0.3:  # Уменьшено с 70% до 30%
-                target_tower = random.choice(towers)
+            if towers and self.rng.ai.random() < 0.3:  # Уменьшено с 70% до 30%
+                target_tower = self.rng.ai.choice(towers)
                 dx = target_tower.x - (self.x + self.width//2)
                 dy = target_tower.y - (self.y + self.height)
                 distance = math.sqrt(dx*dx + dy*dy)
                 if distance > 0:
                     speed = 4 + self.phase
-                    self.boss_bullets.append({
-                        "x": self.x + self.width//2,
-                        "y": self.y + self.height,
-                        "dx": (dx / distance) * speed,
-                        "dy": (dy / distance) * speed,
-                        "type": "laser",
-                        "damage": 25  # Уменьшено в 2 раза
-                    })
+                    self.projectiles.spawn("laser", self.owner, self.x + self.width//2, self.y + self.height,
+                                           (dx / distance) * speed, (dy / distance) * speed, 25)  # Уменьшено в 2 раза
             
             # Случайные ракеты - МЕНЬШЕ
             for _ in range(max(1, self.phase // 2)):  # В 2 раза меньше ракет
-                angle = random.uniform(0, 2 * math.pi)
-                self.boss_bullets.append({
-                    "x": self.x + self.width//2,
-                    "y": self.y + self.height//2,
-                    "dx": math.cos(angle) * 2,
-                    "dy": math.sin(angle) * 2,
-                    "type": "rocket",
-                    "damage": 15  # Уменьшено в 2 раза
-                })
+                angle = self.rng.ai.uniform(0, 2 * math.pi)
+                self.projectiles.spawn("rocket", self.owner, self.x + self.width//2, self.y + self.height//2,
+                                       math.cos(angle) * 2, math.sin(angle) * 2, 15)  # Уменьшено в 2 раза
             
             self.attack_timer = 0
         
@@ -971,41 +2987,23 @@ class TowerDefenseBoss:
                 # Огненная волна - МЕНЬШЕ
                 for i in range(6):  # В 2 раза меньше снарядов
                     angle = (i * 30) * math.pi / 180
-                    self.boss_bullets.append({
-                        "x": self.x + self.width//2,
-                        "y": self.y + self.height//2,
-                        "dx": math.cos(angle) * 3,
-                        "dy": math.sin(angle) * 3,
-                        "type": "fire",
-                        "damage": 20  # Уменьшено в 2 раза
-                    })
+                    self.projectiles.spawn("fire", self.owner, self.x + self.width//2, self.y + self.height//2,
+                                           math.cos(angle) * 3, math.sin(angle) * 3, 20)  # Уменьшено в 2 раза
             elif self.phase == 3:
                 # Кислотные бомбы - МЕНЬШЕ
                 for _ in range(4):  # В 2 раза меньше бомб
-                    x = random.randint(50, SCREEN_WIDTH - 50)
-                    y = random.randint(50, SCREEN_HEIGHT - 50)
-                    self.boss_bullets.append({
-                        "x": self.x + self.width//2,
-                        "y": self.y + self.height//2,
-                        "dx": (x - (self.x + self.width//2)) / 30,
-                        "dy": (y - (self.y + self.height//2)) / 30,
-                        "type": "acid",
-                        "damage": 30  # Уменьшено в 2 раза
-                    })
+                    x = self.rng.ai.randint(50, SCREEN_WIDTH - 50)
+                    y = self.rng.ai.randint(50, SCREEN_HEIGHT - 50)
+                    self.projectiles.spawn("acid", self.owner, self.x + self.width//2, self.y + self.height//2,
+                                           (x - (self.x + self.width//2)) / 30, (y - (self.y + self.height//2)) / 30, 30)  # Уменьшено в 2 раза
             elif self.phase == 4:
                 # Хаос - все виды атак, НО МЕНЬШЕ
                 for attack_type in ["laser", "rocket", "fire", "acid"]:
                     for _ in range(1):  # В 3 раза меньше снарядов
-                        angle = random.uniform(0, 2 * math.pi)
-                        speed = random.uniform(2, 5)
-                        self.boss_bullets.append({
-                            "x": self.x + self.width//2,
-                            "y": self.y + self.height//2,
-                            "dx": math.cos(angle) * speed,
-                            "dy": math.sin(angle) * speed,
-                            "type": attack_type,
-                            "damage": 35  # Уменьшено в 2 раза
-                        })
+                        angle = self.rng.ai.uniform(0, 2 * math.pi)
+                        speed = self.rng.ai.uniform(2, 5)
+                        self.projectiles.spawn(attack_type, self.owner, self.x + self.width//2, self.y + self.height//2,
+                                               math.cos(angle) * speed, math.sin(angle) * speed, 35)  # Уменьшено в 2 раза
             
             self.special_attack_timer = 0
         
@@ -1013,38 +3011,14 @@ class TowerDefenseBoss:
         self.minion_spawn_timer += 1
         if self.minion_spawn_timer >= max(600, 900 - self.phase * 60):  # В 3-4 раза реже
             for _ in range(max(1, self.phase // 2)):  # В 2 раза меньше миньонов
-                minion = {
-                    "x": random.randint(50, SCREEN_WIDTH - 50),
-                    "y": 50,
-                    "health": 15,  # Уменьшено в 2 раза
-                    "max_health": 15,
-                    "speed": 1.5,
-                    "path_index": 0,
-                    "path_progress": 0,
-                    "reward": 5,
-                    "damage": 1,
-                    "type": "minion",
-                    "color": ORANGE,
-                    "frozen": 0
-                }
-                self.minions.append(minion)
+                minion = create_td_enemy(enemies, "minion", self.rng.spawn.randint(50, SCREEN_WIDTH - 50), 50)
+                # Первый шаг миньон делает прямо вниз, дальше идет по пути как все враги
+                minion.y += minion.speed
             self.minion_spawn_timer = 0
-        
-        # Обновление пуль босса
-        for bullet in self.boss_bullets[:]:
-            bullet["x"] += bullet["dx"]
-            bullet["y"] += bullet["dy"]
-            
-            # Удаляем пули за границами экрана
-            if (bullet["x"] < -50 or bullet["x"] > SCREEN_WIDTH + 50 or
-                bullet["y"] < -50 or bullet["y"] > SCREEN_HEIGHT + 50):
-                self.boss_bullets.remove(bullet)
-        
-        # Обновление миньонов (простое движение вниз)
-        for minion in self.minions[:]:
-            minion["y"] += minion["speed"]
-            if minion["y"] > SCREEN_HEIGHT:
-                self.minions.remove(minion)
+    
+    def cull_bullets(self):
+        # Удаляем пули за границами экрана
+        self.projectiles.cull(self.owner, -50, -50, SCREEN_WIDTH + 50, SCREEN_HEIGHT + 50)
     
     def take_damage(self, damage):
         if not self.shield_active:
@@ -1052,49 +3026,60 @@ class TowerDefenseBoss:
             return self.health <= 0
         return False
     
-    def draw(self, screen):
-        # Эффект телепортации
-        if self.phase >= 3 and self.teleport_timer > 280:
-            # Мерцание перед телепортацией
-            if (self.teleport_timer // 5) % 2:
-                return
-        
-        # Основное тело босса - ОГРОМНЫЙ
-        boss_color = RED
-        if self.rage_mode:
-            boss_color = (255, 100, 100) if (pygame.time.get_ticks() // 100) % 2 else RED
-        
-        pygame.draw.rect(screen, boss_color, (self.x, self.y, self.width, self.height))
+    def get_sprite(self, boss_color, eye_color, core_size):
+        # Каждое сочетание цвета, щита, ярости и размера ядра запекается один раз
+        key = ("td_boss", boss_color, eye_color, self.shield_active, self.rage_mode, core_size)
+        margin = 16
+        return sprites.get(key, (self.width + margin * 2, self.height + margin + 25), (margin, margin),
+                           lambda surface, x, y: self.draw_shape(surface, x, y, boss_color, eye_color, core_size))
+    
+    def draw_shape(self, surface, x, y, boss_color, eye_color, core_size):
+        draw.rect(surface, boss_color, (x, y, self.width, self.height))
         
         # Щит
         if self.shield_active:
-            pygame.draw.circle(screen, CYAN, (self.x + self.width//2, self.y + self.height//2), self.width//2 + 10, 5)
-            pygame.draw.circle(screen, WHITE, (self.x + self.width//2, self.y + self.height//2), self.width//2 + 15, 3)
+            draw.circle(surface, CYAN, (x + self.width//2, y + self.height//2), self.width//2 + 10, 5)
+            draw.circle(surface, WHITE, (x + self.width//2, y + self.height//2), self.width//2 + 15, 3)
         
         # Детали босса
         # Глаза-лазеры
-        eye_color = YELLOW if self.phase < 4 else RED
-        pygame.draw.circle(screen, eye_color, (self.x + 20, self.y + 20), 8)
-        pygame.draw.circle(screen, eye_color, (self.x + self.width - 20, self.y + 20), 8)
-        pygame.draw.circle(screen, WHITE, (self.x + 20, self.y + 20), 4)
-        pygame.draw.circle(screen, WHITE, (self.x + self.width - 20, self.y + 20), 4)
+        draw.circle(surface, eye_color, (x + 20, y + 20), 8)
+        draw.circle(surface, eye_color, (x + self.width - 20, y + 20), 8)
+        draw.circle(surface, WHITE, (x + 20, y + 20), 4)
+        draw.circle(surface, WHITE, (x + self.width - 20, y + 20), 4)
         
         # Пушки
-        pygame.draw.rect(screen, BLACK, (self.x + 10, self.y + self.height, 12, 20))
-        pygame.draw.rect(screen, BLACK, (self.x + self.width - 22, self.y + self.height, 12, 20))
-        pygame.draw.rect(screen, BLACK, (self.x + self.width//2 - 8, self.y + self.height, 16, 25))
+        draw.rect(surface, BLACK, (x + 10, y + self.height, 12, 20))
+        draw.rect(surface, BLACK, (x + self.width - 22, y + self.height, 12, 20))
+        draw.rect(surface, BLACK, (x + self.width//2 - 8, y + self.height, 16, 25))
         
         # Реактивные двигатели
         if self.rage_mode:
             flame_colors = [RED, ORANGE, YELLOW]
             for i, color in enumerate(flame_colors):
-                pygame.draw.circle(screen, color, (self.x + 15, self.y + self.height + 5 + i*3), 6 - i*2)
-                pygame.draw.circle(screen, color, (self.x + self.width - 15, self.y + self.height + 5 + i*3), 6 - i*2)
+                draw.circle(surface, color, (x + 15, y + self.height + 5 + i*3), 6 - i*2)
+                draw.circle(surface, color, (x + self.width - 15, y + self.height + 5 + i*3), 6 - i*2)
+        
+        # Центральное ядро
+        draw.circle(surface, PURPLE, (x + self.width//2, y + self.height//2), core_size)
+        draw.circle(surface, WHITE, (x + self.width//2, y + self.height//2), core_size - 5)
+    
+    def draw(self, screen, batch):
+        # Эффект телепортации
+        if self.phase >= 3 and self.teleport_timer > 280:
+            # Мерцание перед телепортацией
+            if (self.teleport_timer // 5) % 2:
+                return
         
+        # Основное тело босса - ОГРОМНЫЙ
+        boss_color = RED
+        if self.rage_mode:
+            boss_color = (255, 100, 100) if (pygame.time.get_ticks() // 100) % 2 else RED
+        eye_color = YELLOW if self.phase < 4 else RED
         # Центральное ядро - пульсирующее
         core_size = 20 + int(5 * math.sin(pygame.time.get_ticks() * 0.01))
-        pygame.draw.circle(screen, PURPLE, (self.x + self.width//2, self.y + self.height//2), core_size)
-        pygame.draw.circle(screen, WHITE, (self.x + self.width//2, self.y + self.height//2), core_size - 5)
+        
+        sprites.blit(screen, self.get_sprite(boss_color, eye_color, core_size), self.x, self.y)
         
         # Полоса здоровья босса
         bar_width = 300
@@ -1103,7 +3088,7 @@ class TowerDefenseBoss:
         bar_y = 10
         
         # Фон полосы
-        pygame.draw.rect(screen, DARK_GRAY, (bar_x, bar_y, bar_width, bar_height))
+        draw.rect(screen, DARK_GRAY, (bar_x, bar_y, bar_width, bar_height))
         
         # Здоровье с градиентом
         health_width = int((self.health / self.max_health) * bar_width)
@@ -1114,59 +3099,58 @@ class TowerDefenseBoss:
                 health_color = YELLOW
             else:
                 health_color = RED
-            pygame.draw.rect(screen, health_color, (bar_x, bar_y, health_width, bar_height))
+            draw.rect(screen, health_color, (bar_x, bar_y, health_width, bar_height))
         
         # Фазовые индикаторы
         for i in range(4):
             phase_color = YELLOW if i < self.phase else GRAY
-            pygame.draw.circle(screen, phase_color, (bar_x + i * 80 + 40, bar_y + bar_height + 15), 8)
-            pygame.draw.circle(screen, WHITE, (bar_x + i * 80 + 40, bar_y + bar_height + 15), 6, 2)
+            draw.circle(screen, phase_color, (bar_x + i * 80 + 40, bar_y + bar_height + 15), 8)
+            draw.circle(screen, WHITE, (bar_x + i * 80 + 40, bar_y + bar_height + 15), 6, 2)
         
         # Рамка
-        pygame.draw.rect(screen, WHITE, (bar_x, bar_y, bar_width, bar_height), 3)
+        draw.rect(screen, WHITE, (bar_x, bar_y, bar_width, bar_height), 3)
         
         # Текст босса
-        font = pygame.font.Font(None, 32)
-        boss_text = font.render(f"МЕГА-БОСС - ФАЗА {self.phase}", True, WHITE)
+        boss_text = text_cache.render(fonts.get(32), f"МЕГА-БОСС - ФАЗА {self.phase}", True, WHITE)
         text_rect = boss_text.get_rect(center=(SCREEN_WIDTH//2, bar_y - 25))
         screen.blit(boss_text, text_rect)
         
-        # Пули босса с разными эффектами
-        for bullet in self.boss_bullets:
-            x, y = int(bullet["x"]), int(bullet["y"])
-            if bullet["type"] == "laser":
-                pygame.draw.circle(screen, RED, (x, y), 6)
-                pygame.draw.circle(screen, WHITE, (x, y), 3)
-            elif bullet["type"] == "rocket":
-                pygame.draw.circle(screen, ORANGE, (x, y), 5)
-                pygame.draw.circle(screen, YELLOW, (x, y), 2)
-            elif bullet["type"] == "fire":
-                pygame.draw.circle(screen, (255, 150, 0), (x, y), 4)
-                pygame.draw.circle(screen, YELLOW, (x, y), 2)
-            elif bullet["type"] == "acid":
-                pygame.draw.circle(screen, GREEN, (x, y), 7)
-                pygame.draw.circle(screen, (150, 255, 150), (x, y), 4)
-        
-        # Миньоны
-        for minion in self.minions:
-            pygame.draw.circle(screen, minion["color"], (int(minion["x"]), int(minion["y"])), 12)
-            pygame.draw.circle(screen, WHITE, (int(minion["x"]), int(minion["y"])), 8, 2)
+        # Пули босса с разными эффектами - в общий пакет слоя, его выводит уровень
+        self.projectiles.draw(batch, self.get_bullet_sprite, self.owner)
+
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
     
-    def get_bullet_rects(self):
-        return [pygame.Rect(bullet["x"] - 6, bullet["y"] - 6, 12, 12) for bullet in self.boss_bullets]
+    def draw_bullet_shape(self, surface, x, y, bullet_type):
+        if bullet_type == "laser":
+            draw.circle(surface, RED, (x, y), 6)
+            draw.circle(surface, WHITE, (x, y), 3)
+        elif bullet_type == "rocket":
+            draw.circle(surface, ORANGE, (x, y), 5)
+            draw.circle(surface, YELLOW, (x, y), 2)
+        elif bullet_type == "fire":
+            draw.circle(surface, (255, 150, 0), (x, y), 4)
+            draw.circle(surface, YELLOW, (x, y), 2)
+        elif bullet_type == "acid":
+            draw.circle(surface, GREEN, (x, y), 7)
+            draw.circle(surface, (150, 255, 150), (x, y), 4)
+    
+    def get_bullet_sprite(self, bullet_type):
+        return sprites.get(("td_boss_bullet", bullet_type), (15, 15), (7, 7),
+                           lambda surface, x, y: self.draw_bullet_shape(surface, x, y, bullet_type))
 
 class Tower:
-    def __init__(self, x, y, tower_type="basic"):
+    def __init__(self, x, y, tower_type="basic", projectiles=None):
         self.x = x
         self.y = y
         self.tower_type = tower_type
         self.width = 40
         self.height = 40
         self.shoot_cooldown = 0
-        self.bullets = []
+        # Без системы снарядов башня не стреляет (образец для цены и спрайтов)
+        self.projectiles = projectiles
+        self.owner = projectiles.add_owner(self) if projectiles is not None else None
         self.level = 1
         self.kill_count = 0
         self.show_range = False
@@ -1197,49 +3181,41 @@ class Tower:
             self.cost = 80
             self.color = CYAN
     
-    def update(self, enemies):
+    def update(self, enemies, target=None):
+        # enemies - хранилище врагов, target - запасная цель (x, y), когда врагов нет
         if self.shoot_cooldown > 0:
             self.shoot_cooldown -= 1
         
-        # Обновляем пули башни
-        for bullet in self.bullets[:]:
-            bullet["x"] += bullet["dx"]
-            bullet["y"] += bullet["dy"]
-            if bullet["y"] < 0 or bullet["y"] > SCREEN_HEIGHT or bullet["x"] < 0 or bullet["x"] > SCREEN_WIDTH:
-                self.bullets.remove(bullet)
+        # Первый шаг пуль башни; второй - в update_tower_defense вместе с попаданиями
+        self.projectiles.integrate(self.owner)
+        self.projectiles.cull(self.owner, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
         
-        # Ищем ближайшего врага в радиусе
+        # Ищем ближайшего врага в радиусе: расстояния до всех врагов считаются разом
         if self.shoot_cooldown <= 0:
-            closest_enemy = None
-            min_distance = self.range
-            
-            for enemy in enemies:
-                distance = math.sqrt((self.x + self.width//2 - enemy["x"])**2 + (self.y + self.height//2 - enemy["y"])**2)
-                if distance <= min_distance:
-                    min_distance = distance
-                    closest_enemy = enemy
-            
-            if closest_enemy:
-                self.shoot_at_enemy(closest_enemy)
+            center_x = self.x + self.width//2
+            center_y = self.y + self.height//2
+            rows = enemies.rows()
+            distances = enemies.distances(center_x, center_y, rows)
+            in_range = np.flatnonzero(distances <= self.range)
+            if len(in_range):
+                # При равном расстоянии - враг, появившийся позже
+                closest = rows[in_range[::-1][np.argmin(distances[in_range][::-1])]]
+                self.shoot_at(float(enemies.x[closest]), float(enemies.y[closest]))
+                self.shoot_cooldown = self.rate
+            elif target is not None and math.sqrt((center_x - target[0])**2 + (center_y - target[1])**2) <= self.range:
+                self.shoot_at(*target)
                 self.shoot_cooldown = self.rate
     
-    def shoot_at_enemy(self, enemy):
-        # Создаем пулю направленную в сторону врага
-        dx = enemy["x"] - (self.x + self.width//2)
-        dy = enemy["y"] - (self.y + self.height//2)
+    def shoot_at(self, x, y):
+        # Создаем пулю направленную в точку (x, y)
+        dx = x - (self.x + self.width//2)
+        dy = y - (self.y + self.height//2)
         distance = math.sqrt(dx*dx + dy*dy)
         
         if distance > 0:
             speed = 5
-            bullet = {
-                "x": self.x + self.width//2,
-                "y": self.y + self.height//2,
-                "dx": (dx / distance) * speed,
-                "dy": (dy / distance) * speed,
-                "damage": self.damage,
-                "type": self.tower_type
-            }
-            self.bullets.append(bullet)
+            self.projectiles.spawn(self.tower_type, self.owner, self.x + self.width//2, self.y + self.height//2,
+                                   (dx / distance) * speed, (dy / distance) * speed, self.damage)
     
     def can_upgrade(self):
         return self.level < 3 and self.kill_count >= self.level * 3
@@ -1254,52 +3230,219 @@ class Tower:
             return True
         return False
     
-    def draw(self, screen):
-        # Рисуем радиус действия (полупрозрачный)
-        if hasattr(self, 'show_range') and self.show_range:
-            pygame.draw.circle(screen, (*self.color, 50), (self.x + self.width//2, self.y + self.height//2), self.range, 2)
-        
+    def get_sprite(self):
+        # Башня запечена для каждого типа и уровня
+        return sprites.get(("tower", self.tower_type, self.level), (self.width, self.height),
+                           (0, 0), self.draw_shape)
+    
+    def draw_shape(self, surface, x, y):
         # Основание башни
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, DARK_GRAY, (self.x + 2, self.y + 2, self.width - 4, self.height - 4), 2)
+        draw.rect(surface, self.color, (x, y, self.width, self.height))
+        draw.rect(surface, DARK_GRAY, (x + 2, y + 2, self.width - 4, self.height - 4), 2)
         
         # Пушка/оружие в зависимости от типа
-        center_x = self.x + self.width//2
-        center_y = self.y + self.height//2
+        center_x = x + self.width//2
+        center_y = y + self.height//2
         
         if self.tower_type == "basic":
-            pygame.draw.circle(screen, BLACK, (center_x, center_y), 8)
-            pygame.draw.rect(screen, DARK_GRAY, (center_x - 2, center_y - 15, 4, 15))
+            draw.circle(surface, BLACK, (center_x, center_y), 8)
+            draw.rect(surface, DARK_GRAY, (center_x - 2, center_y - 15, 4, 15))
         elif self.tower_type == "rapid":
-            pygame.draw.circle(screen, BLACK, (center_x, center_y), 6)
-            pygame.draw.rect(screen, DARK_GRAY, (center_x - 3, center_y - 12, 2, 12))
-            pygame.draw.rect(screen, DARK_GRAY, (center_x + 1, center_y - 12, 2, 12))
+            draw.circle(surface, BLACK, (center_x, center_y), 6)
+            draw.rect(surface, DARK_GRAY, (center_x - 3, center_y - 12, 2, 12))
+            draw.rect(surface, DARK_GRAY, (center_x + 1, center_y - 12, 2, 12))
         elif self.tower_type == "heavy":
-            pygame.draw.circle(screen, BLACK, (center_x, center_y), 10)
-            pygame.draw.rect(screen, DARK_GRAY, (center_x - 4, center_y - 20, 8, 20))
+            draw.circle(surface, BLACK, (center_x, center_y), 10)
+            draw.rect(surface, DARK_GRAY, (center_x - 4, center_y - 20, 8, 20))
         elif self.tower_type == "freeze":
-            pygame.draw.circle(screen, BLACK, (center_x, center_y), 7)
-            pygame.draw.circle(screen, WHITE, (center_x, center_y - 10), 3)
+            draw.circle(surface, BLACK, (center_x, center_y), 7)
+            draw.circle(surface, WHITE, (center_x, center_y - 10), 3)
         
         # Индикатор уровня
         for i in range(self.level):
-            pygame.draw.circle(screen, YELLOW, (self.x + 5 + i * 8, self.y + 5), 2)
+            draw.circle(surface, YELLOW, (x + 5 + i * 8, y + 5), 2)
+    
+    def draw(self, screen, batch):
+        # Рисуем радиус действия (полупрозрачный)
+        if hasattr(self, 'show_range') and self.show_range:
+            range_sprite = sprites.get(("tower_range", self.color, self.range), (self.range * 2 + 1, self.range * 2 + 1),
+                                       (self.range, self.range),
+                                       lambda surface, x, y: draw.circle(surface, (*self.color, 50), (x, y), self.range, 2))
+            sprites.blit(screen, range_sprite, self.x + self.width//2, self.y + self.height//2)
+        
+        sprites.blit(screen, self.get_sprite(), self.x, self.y)
         
-        # Пули башни
-        for bullet in self.bullets:
-            color = self.color if self.tower_type != "freeze" else CYAN
-            pygame.draw.circle(screen, color, (int(bullet["x"]), int(bullet["y"])), 3)
+        # Пули башни - в общий пакет слоя, его выводит уровень
+        self.projectiles.draw(batch, self.get_bullet_sprite, self.owner)
+    
+    def get_bullet_sprite(self, bullet_type):
+        color = self.color if self.tower_type != "freeze" else CYAN
+        return sprites.get(("tower_bullet", color), (7, 7), (3, 3),
+                           lambda surface, x, y: draw.circle(surface, color, (x, y), 3))
     
     def get_rect(self):
         return pygame.Rect(self.x, self.y, self.width, self.height)
 
+# Враги tower defense: здоровье (база и прибавка за волну), скорость, награда, урон, цвет.
+# Здоровье, награда и урон увеличены в 2 раза, скорость - выше исходной
+TD_ENEMY_TYPES = {
+    "basic": (160, 30, 1.4, 30, 4, RED),
+    "fast": (120, 20, 3.0, 40, 2, YELLOW),
+    "tank": (400, 50, 1.0, 80, 6, PURPLE),
+    "elite": (300, 40, 2.2, 60, 4, (255, 0, 255)),  # Магента
+    "minion": (15, 0, 1.5, 5, 1, ORANGE),  # Миньоны босса, здоровье уменьшено в 2 раза
+}
+
+class TowerDefenseEnemy(EntityRecord):
+    # Враг tower defense (миньоны босса - тоже враги); движение по пути, регенерация
+    # и заморозка считаются по всем врагам сразу в update_tower_defense
+    __slots__ = ()
+    KINDS = tuple((enemy_type, -15, -15, 30, 30) for enemy_type in TD_ENEMY_TYPES)
+    COMPONENTS = (("max_health", np.float64), ("speed", np.float64), ("path_index", np.int32),
+                  ("reward", np.int32), ("damage", np.int32), ("frozen", np.int32))
+    type = EntityRecord.kind_name
+
+    @property
+    def color(self):
+        return TD_ENEMY_TYPES[self.type][5]
+
+    @property
+    def regenerates(self):
+        # Особенность элитных врагов
+        return self.type == "elite"
+
+# Радиус тела врага: элитные крупнее, танки самые крупные
+TD_ENEMY_SIZES = {"elite": 18, "tank": 20}
+
+def draw_fast_enemy_trail(surface, x, y):
+    draw.circle(surface, (255, 255, 0, 100), (x - 5, y), 8)
+    draw.circle(surface, (255, 255, 0, 50), (x - 10, y), 6)
+
+def draw_td_enemy_shape(surface, x, y, enemy_type, frozen, regenerating):
+    # Основное тело врага с улучшенной графикой
+    base_size = TD_ENEMY_SIZES.get(enemy_type, 15)
+    draw.circle(surface, TD_ENEMY_TYPES[enemy_type][5], (x, y), base_size)
+    draw.circle(surface, WHITE, (x, y), base_size - 3, 2)
+    
+    # Эффект заморозки
+    if frozen:
+        draw.circle(surface, CYAN, (x, y), base_size + 3, 3)
+    
+    # Эффект регенерации для элитных врагов
+    if regenerating:
+        draw.circle(surface, GREEN, (x, y), base_size + 1, 1)
+    
+    # Специальные детали для разных типов врагов
+    if enemy_type == "tank":
+        draw.rect(surface, BLACK, (x - 4, y - 10, 8, 10))  # Пушка
+        draw.circle(surface, DARK_GRAY, (x, y), 5)  # Башня
+    elif enemy_type == "elite":
+        # Энергетическое поле (полупрозрачное)
+        field_radius = base_size + 2
+        field_sprite = sprites.get(("elite_field", field_radius), (field_radius * 2 + 1, field_radius * 2 + 1),
+                                   (field_radius, field_radius),
+                                   lambda surface, x, y: draw.circle(surface, (255, 0, 255, 50), (x, y), field_radius, 2))
+        sprites.blit(surface, field_sprite, x, y)
+        # Корона
+        for i in range(8):
+            angle = i * 45 * math.pi / 180
+            draw.circle(surface, YELLOW, (int(x + math.cos(angle) * 8), int(y + math.sin(angle) * 8)), 2)
+    elif enemy_type == "fast":
+        # Следы движения (полупрозрачные)
+        sprites.blit(surface, sprites.get("fast_enemy_trail", (24, 17), (18, 8), draw_fast_enemy_trail), x, y)
+
+def get_td_enemy_sprite(enemy_type, frozen, regenerating):
+    # Спрайт запекается для каждого типа и сочетания эффектов
+    return sprites.get(("td_enemy", enemy_type, bool(frozen), bool(regenerating)), (47, 47), (23, 23),
+                       lambda surface, x, y: draw_td_enemy_shape(surface, x, y, enemy_type, frozen, regenerating))
+
+def draw_td_health_bar(surface, x, y, health_width):
+    draw.rect(surface, RED, (x - 15, y - 30, 30, 5))
+    draw.rect(surface, GREEN, (x - 15, y - 30, health_width, 5))
+
+def get_td_health_bar_sprite(health_width):
+    # Полоса здоровья над врагом для каждой ширины зеленой части
+    return sprites.get(("td_health_bar", health_width), (30, 5), (15, 30),
+                       lambda surface, x, y: draw_td_health_bar(surface, x, y, health_width))
+
+def create_td_enemy(enemies, enemy_type, x, y, wave=0):
+    base_health, wave_health, speed, reward, damage, color = TD_ENEMY_TYPES[enemy_type]
+    health = base_health + wave * wave_health
+    return enemies.create(enemy_type, x, y, health=health, max_health=health, speed=speed,
+                          reward=reward, damage=damage)
+
+# Охранники, которые при отбое тревоги сбавляют скорость: порог и обычная скорость
+GUARD_CALM_SPEEDS = {"patrol": (1.2, 1.0), "office": (1.3, 1.1), "elite": (1.6, 1.4)}
+# Скорость обнаружения игрока: снайпер замечает быстрее всех
+GUARD_DETECTION_SPEEDS = {"patrol": 1, "office": 2, "elite": 3, "sniper": 4}
+
+class Guard(EntityRecord):
+    # Охранник стелс-уровня: патрулирует в пределах patrol_range от стартовой точки.
+    # Патруль, скорость и тревога считаются по всем охранникам сразу в update_stealth
+    __slots__ = ()
+    KINDS = tuple((guard_type, 0, 0, 0, 0) for guard_type in GUARD_STYLES)
+    COMPONENTS = (("direction", np.int32), ("patrol_range", np.float64), ("start_x", np.float64),
+                  ("speed", np.float64), ("vision_range", np.int32), ("alert_level", np.float64))
+    type = EntityRecord.kind_name
+
+# Здоровье юнитов стратегии
+STRATEGY_UNIT_HEALTH = {"worker": 40, "marine": 45, "tank": 150}
+
+# Скорость и урон боевых юнитов стратегии
+STRATEGY_UNIT_SPEEDS = {"worker": 1, "marine": 2, "tank": 1}
+STRATEGY_UNIT_DAMAGE = {"marine": 6, "tank": 20}
+# Население, которое занимает юнит
+STRATEGY_UNIT_SUPPLY = {"worker": 1, "marine": 2, "tank": 3}
+
+class StrategyUnit(EntityRecord):
+    # Юнит стратегии (свой или вражеский). target - номер минерального патча рабочего
+    # (-1 - нет), order_x/order_y - точка, куда игрок отправил юнита (флаг ENTITY_ORDERED)
+    __slots__ = ()
+    KINDS = tuple((unit_type, -10, -10, 20, 20) for unit_type in STRATEGY_UNIT_HEALTH)
+    COMPONENTS = (("target", np.int32), ("carrying", np.int32), ("attack_cooldown", np.int32),
+                  ("order_x", np.float64), ("order_y", np.float64))
+    type = EntityRecord.kind_name
+
+def create_strategy_unit(units, unit_type, x, y):
+    return units.create(unit_type, x, y, health=STRATEGY_UNIT_HEALTH[unit_type], target=-1)
+
+# Записи ниже - объекты с __slots__ вместо словарей: меньше памяти на объект
+# и быстрее доступ к полям
+class Building:
+    __slots__ = ("type", "x", "y", "health", "max_health")
+    
+    def __init__(self, building_type, x, y, health):
+        self.type = building_type
+        self.x = x
+        self.y = y
+        self.health = health
+        self.max_health = health
+
+class MineralPatch:
+    __slots__ = ("x", "y", "minerals")
+    
+    def __init__(self, x, y, minerals):
+        self.x = x
+        self.y = y
+        self.minerals = minerals
+
 class Menu:
     def __init__(self, progress):
         self.progress = progress
         self.selected_level = 1
-        self.font_large = pygame.font.Font(None, 48)
-        self.font_medium = pygame.font.Font(None, 36)
-        self.font_small = pygame.font.Font(None, 24)
+        self.font_large = fonts.get(48)
+        self.font_medium = fonts.get(36)
+        self.font_small = fonts.get(24)
+        # Готовый кадр меню и состояние, для которого он нарисован
+        self.surface = None
+        self.surface_state = None
+    
+    def get_state(self):
+        # Все, от чего зависит внешний вид меню
+        return (self.selected_level, tuple(self.progress.unlocked_levels))
+    
+    def needs_redraw(self):
+        return self.surface is None or self.surface_state != self.get_state()
     
     def handle_input(self, event):
         if event.type == pygame.KEYDOWN:
@@ -1313,20 +3456,29 @@ class Menu:
         return None
     
     def draw(self, screen):
+        # Меню перерисовывается только после изменения выбора или прогресса
+        if self.needs_redraw():
+            if self.surface is None:
+                self.surface = surfaces.create_canvas(screen.get_size())
+            self.draw_menu(self.surface)
+            self.surface_state = self.get_state()
+        screen.blit(self.surface, (0, 0))
+    
+    def draw_menu(self, screen):
         # Полностью статичный фон без анимации
         screen.fill((20, 20, 40))  # Темно-синий фон
         
         # Статичные декоративные элементы
-        pygame.draw.circle(screen, (60, 60, 80), (100, 100), 30)
-        pygame.draw.circle(screen, (60, 60, 80), (700, 150), 25)
-        pygame.draw.circle(screen, (60, 60, 80), (200, 400), 20)
-        pygame.draw.circle(screen, (60, 60, 80), (600, 450), 35)
+        draw.circle(screen, (60, 60, 80), (100, 100), 30)
+        draw.circle(screen, (60, 60, 80), (700, 150), 25)
+        draw.circle(screen, (60, 60, 80), (200, 400), 20)
+        draw.circle(screen, (60, 60, 80), (600, 450), 35)
         
         # Заголовок
-        title = self.font_large.render("МУЛЬТИ-ЖАНРОВАЯ ИГРА", True, WHITE)
+        title = text_cache.render(self.font_large, "МУЛЬТИ-ЖАНРОВАЯ ИГРА", True, WHITE)
         screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
         
-        subtitle = self.font_medium.render("Выберите уровень", True, WHITE)
+        subtitle = text_cache.render(self.font_medium, "Выберите уровень", True, WHITE)
         screen.blit(subtitle, (SCREEN_WIDTH//2 - subtitle.get_width()//2, 120))
         
         # Сетка уровней
@@ -1349,11 +3501,11 @@ class Menu:
                 border_color = DARK_GRAY
             
             # Рисуем кнопку уровня
-            pygame.draw.rect(screen, color, (x, y, 80, 60))
-            pygame.draw.rect(screen, border_color, (x, y, 80, 60), 3)
+            draw.rect(screen, color, (x, y, 80, 60))
+            draw.rect(screen, border_color, (x, y, 80, 60), 3)
             
             # Номер уровня
-            level_text = self.font_medium.render(str(i), True, BLACK if color != GRAY else WHITE)
+            level_text = text_cache.render(self.font_medium, str(i), True, BLACK if color != GRAY else WHITE)
             text_rect = level_text.get_rect(center=(x + 40, y + 30))
             screen.blit(level_text, text_rect)
         
@@ -1373,31 +3525,45 @@ class Menu:
         
         desc = level_descriptions.get(self.selected_level, "")
         if self.progress.is_level_unlocked(self.selected_level):
-            desc_text = self.font_small.render(desc, True, WHITE)
+            desc_text = text_cache.render(self.font_small, desc, True, WHITE)
         else:
-            desc_text = self.font_small.render("ЗАБЛОКИРОВАНО - пройдите предыдущий уровень", True, RED)
+            desc_text = text_cache.render(self.font_small, "ЗАБЛОКИРОВАНО - пройдите предыдущий уровень", True, RED)
         
         screen.blit(desc_text, (SCREEN_WIDTH//2 - desc_text.get_width()//2, 450))
         
         # Дисклеймер о раскладке клавиатуры
-        disclaimer = self.font_small.render("⚠️ ВАЖНО: Переключите клавиатуру на АНГЛИЙСКИЙ язык!", True, YELLOW)
+        disclaimer = text_cache.render(self.font_small, "⚠️ ВАЖНО: Переключите клавиатуру на АНГЛИЙСКИЙ язык!", True, YELLOW)
         screen.blit(disclaimer, (SCREEN_WIDTH//2 - disclaimer.get_width()//2, 480))
         
-        disclaimer2 = self.font_small.render("Иначе управление WASD работать не будет!", True, YELLOW)
+        disclaimer2 = text_cache.render(self.font_small, "Иначе управление WASD работать не будет!", True, YELLOW)
         screen.blit(disclaimer2, (SCREEN_WIDTH//2 - disclaimer2.get_width()//2, 500))
         
         # Инструкции
-        controls = self.font_small.render("Стрелки - выбор, Enter - играть, ESC - выход", True, WHITE)
+        controls = text_cache.render(self.font_small, "Стрелки - выбор, Enter - играть, ESC - выход", True, WHITE)
         screen.blit(controls, (SCREEN_WIDTH//2 - controls.get_width()//2, 540))
 
+# Что переживает перезапуск уровня и не входит в снимок начального состояния:
+# окно, часы, шрифты, слои фона (и данные, которые слои запоминают при первой
+# отрисовке) и буферы отрисовки. Генераторы случайных чисел заводятся заново
+RESTART_KEEP = ("screen", "clock", "font", "font_small", "compositor", "renderer", "batch",
+                "viewport", "rng", "pristine", "survival_flicker_windows", "survival_car_fires")
+# Что не попадает в сохранение уровня: то же, что переживает перезапуск, и история
+# положений для сглаживания (она ссылается на объекты по id()). Генераторы
+# случайных чисел сохраняются отдельно
+SNAPSHOT_SKIP = RESTART_KEEP + ("previous_positions", "previous_camera_y")
+# Объекты уровня, которые после загрузки не меняются (стены, препятствия, путь врагов):
+# снимок и перезапуск ссылаются на них, а не копируют
+RESTART_SHARED = ("level_types", "platforms", "spikes", "goal", "obstacles", "barricades", "enemy_path",
+                  "enemy_path_x", "enemy_path_y")
+
 class Game:
-    def __init__(self, level=1):
-        # НЕ создаем новый экран - используем уже созданный
-        self.screen = pygame.display.get_surface()
-        if self.screen is None:
-            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    def __init__(self, level=1, seed=None):
+        # НЕ создаем новый экран - рисуем в уже созданный холст
+        self.screen = display.get_canvas()
         self.clock = pygame.time.Clock()
         self.level = level
+        self.fixed_seed = seed
+        self.setup_random()
         
         # Определяем тип уровня
         self.level_types = {
@@ -1441,17 +3607,162 @@ class Game:
         self.help_expanded = True  # Показываем помощь по умолчанию
         self.help_button_rect = pygame.Rect(10, SCREEN_HEIGHT - 40, 120, 30)  # Кнопка в левом нижнем углу
         
+        # Снаряды всех владельцев (игрок, босс, башни) - в одной системе
+        self.projectiles = ProjectileSystem()
+        # Ввод последнего тика (до первого тика - пустой)
+        self.input = InputSnapshot()
+        
         # Специфичные для жанра переменные
         self.setup_level_specific()
+        self.setup_collisions()
         
         # Шрифты
-        self.font = pygame.font.Font(None, 36)
-        self.font_small = pygame.font.Font(None, 24)
+        self.font = fonts.get(36)
+        self.font_small = fonts.get(24)
+
+        # Слои фона - статичные части сцены рисуются один раз за уровень
+        self.compositor = LayerCompositor((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.setup_particles()
+        self.setup_layers()
+        self.prebake_sprites()
+
+        # Вывод на дисплей только изменившихся областей (если включено и уровень это позволяет)
+        self.renderer = DirtyRectRenderer((SCREEN_WIDTH, SCREEN_HEIGHT),
+                                          settings.dirty_rects and self.level_type in DIRTY_RECT_LEVELS,
+                                          settings.dirty_rect_threshold)
+        # Пакет для вывода однотипных объектов (ракеты, пули, ноты) одним blits()
+        self.batch = SpriteBatch()
+        # Видимая область - невидимые объекты не рисуются
+        self.viewport = Viewport(SCREEN_WIDTH, SCREEN_HEIGHT)
+        # Начальное состояние уровня - для быстрого перезапуска
+        self.save_pristine()
+
+    def setup_random(self):
+        # Зерно: явное, из командной строки или случайное
+        seed = self.fixed_seed
+        if seed is None:
+            seed = settings.seed if settings.seed is not None else random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = RandomStreams(seed, self.level)
+
+    def get_shared_memo(self):
+        # Заготовка memo для deepcopy: неизменяемые объекты "копируются" в самих себя
+        memo = {}
+        for name in RESTART_SHARED:
+            value = getattr(self, name, None)
+            if value is None:
+                continue
+            memo[id(value)] = value
+            if isinstance(value, list):
+                for item in value:
+                    memo[id(item)] = item
+        return memo
+
+    def save_pristine(self):
+        state = {name: value for name, value in self.__dict__.items() if name not in RESTART_KEEP}
+        self.pristine = copy.deepcopy(state, self.get_shared_memo())
+
+    def prebake_sprites(self):
+        # Запекаем основные варианты спрайтов уровня заранее, чтобы не тратить
+        # на это время в первых кадрах (редкие варианты допекаются по ходу игры)
+        if self.level_type in ("shooter", "final_mix"):
+            for flame_offset in range(4):
+                self.player.get_sprite(self.level_type, flame_offset)
+            if getattr(self, 'boss', None):
+                self.boss.get_sprite()
+        elif self.level_type in BAKED_PLAYER_LEVELS:
+            self.player.get_sprite(self.level_type)
+        
+        if self.level_type == "survival":
+            for zombie_type in ZOMBIE_TYPES:
+                get_zombie_sprite(zombie_type)
+            get_zombie_trail_sprite()
+        elif self.level_type == "tower_defense":
+            for tower_type in ("basic", "rapid", "heavy", "freeze"):
+                tower = Tower(0, 0, tower_type)
+                for level in range(1, 4):
+                    tower.level = level
+                    tower.get_sprite()
+        elif self.level_type == "stealth":
+            for guard_type in GUARD_STYLES:
+                for direction in (-1, 0, 1):
+                    self.get_alert_guard_sprite(guard_type, 0, direction)
+        elif self.level_type == "strategy":
+            for unit_type, carrying in (("worker", False), ("worker", True), ("marine", False),
+                                        ("tank", False), ("enemy_marine", False)):
+                self.get_unit_sprite(unit_type, carrying)
+
+    def setup_collisions(self):
+        # Сетки столкновений уровня по группам объектов
+        self.grids = {}
+        for name in STATIC_COLLISION_GROUPS.get(self.level_type, ()):
+            self.grids[name] = SpatialHash()
+            self.grids[name].rebuild((obj, obj.get_rect()) for obj in getattr(self, name))
+        for name in DYNAMIC_COLLISION_GROUPS.get(self.level_type, ()):
+            self.grids[name] = SpatialHash()
+
+    def setup_particles(self):
+        # Фоновые частицы уровня в массивах NumPy
+        self.particles = None
+        if self.level_type == "platformer":
+            index = np.arange(50)
+            self.particles = ParticleField((index * 47 + 100) % SCREEN_WIDTH, (index * 31 + 50) % (SCREEN_HEIGHT // 2),
+                                           np.ones(50))
+        elif self.level_type == "survival":
+            index = np.arange(30)
+            self.particles = ParticleField(index * 47, index * 31, 1 + index % 3,
+                                           brightness=120 + index % 40, speed=0.5 + (index % 10) * 0.1)
+        elif self.level_type == "shooter":
+            index = np.arange(80)
+            self.particles = ParticleField((index * 47) % SCREEN_WIDTH, (index * 31) % SCREEN_HEIGHT, 1 + index % 3,
+                                           brightness=150 + index % 105, period=100 + index % 200)
     
+    def setup_layers(self):
+        if self.level_type == "platformer":
+            self.compositor.add_cached("sky", self.draw_platformer_sky, self.get_platformer_sky_key)
+            self.compositor.add_dynamic("stars", self.draw_platformer_stars)
+            self.compositor.add_cached("scenery", self.draw_platformer_scenery,
+                                       self.get_platformer_sky_key, transparent=True)
+            # Весь уровень (платформы и шипы) в одной высокой поверхности,
+            # которая сдвигается вместе с камерой
+            world_objects = self.platforms + self.spikes
+            self.world_top = min(obj.y for obj in world_objects)
+            world_bottom = max(obj.y + obj.height for obj in world_objects)
+            self.compositor.add_static("world", self.draw_platformer_world,
+                                       size=(SCREEN_WIDTH, world_bottom - self.world_top),
+                                       offset_fn=lambda: (0, self.world_top - self.camera_y),
+                                       transparent=True)
+            # Пилы качаются вокруг начальной точки - индексируем всю зону их движения
+            self.saw_index = BoundsIndex(self.saws, lambda saw: (saw.start_x - saw.range / 2, saw.start_y - saw.range / 2,
+                                                                 saw.width + saw.range, saw.height + saw.range))
+        elif self.level_type == "racing":
+            self.compositor.add_static("road", self.draw_racing_road)
+        elif self.level_type == "puzzle":
+            self.compositor.add_static("maze", self.draw_puzzle_maze)
+        elif self.level_type == "rhythm":
+            self.compositor.add_static("lanes", self.draw_rhythm_lanes)
+        elif self.level_type == "tower_defense":
+            self.compositor.add_static("field", self.draw_tower_defense_field)
+        elif self.level_type == "stealth":
+            # Огни города прореживаются при снижении качества
+            self.compositor.add_cached("building", self.draw_stealth_building,
+                                       lambda: quality.get_density("city_windows"))
+        elif self.level_type == "survival":
+            self.compositor.add_static("ruins", self.draw_survival_ruins)
+            self.compositor.add_dynamic("fires", self.draw_survival_fires)
+            self.compositor.add_dynamic("ash", self.draw_survival_ash)
+        elif self.level_type == "strategy":
+            self.compositor.add_static("battlefield", self.draw_strategy_battlefield)
+        elif self.level_type == "final_mix":
+            self.compositor.add_static("space", self.draw_final_mix_space)
+        else:
+            self.compositor.add_static("sky", self.draw_shooter_sky)
+            self.compositor.add_dynamic("stars", self.draw_shooter_stars)
+            self.compositor.add_static("planets", self.draw_shooter_planets, transparent=True)
+
     def setup_level_specific(self):
         if self.level_type == "shooter":
-            self.missiles = []
-            self.player_bullets = []
+            self.missiles = EntityStore(Missile)
             self.missile_spawn_timer = 0
             self.target_score = 20
             
@@ -1520,7 +3831,7 @@ class Game:
             self.camera_y = 0  # Смещение камеры по Y
             
         elif self.level_type == "racing":
-            self.racing_obstacles = []  # Переименовываем для правильной типизации
+            self.racing_obstacles = EntityStore(RacingObstacle)
             self.obstacle_spawn_timer = 0
             self.distance = 0
             self.target_distance = 1000
@@ -1592,7 +3903,7 @@ class Game:
             self.puzzle_blocks.append(PuzzleBlock(640, 520, "goal"))  # Цель в правом нижнем углу
             
         elif self.level_type == "rhythm":
-            self.rhythm_notes = []
+            self.rhythm_notes = EntityStore(RhythmNote)
             self.note_spawn_timer = 0
             self.hit_zone_y = SCREEN_HEIGHT - 100
             self.score_multiplier = 1
@@ -1601,7 +3912,7 @@ class Game:
         elif self.level_type == "tower_defense":
             # УЛУЧШЕННЫЙ TOWER DEFENSE С БОССОМ
             self.towers = []
-            self.enemies = []
+            self.enemies = EntityStore(TowerDefenseEnemy)
             self.enemy_spawn_timer = 0
             self.lives = 20
             self.money = 300  # Еще больше денег для усиленных врагов
@@ -1640,10 +3951,12 @@ class Game:
                 {"x": 600, "y": 300},
                 {"x": SCREEN_WIDTH + 30, "y": 300}
             ]
+            # Координаты точек пути столбцами - по ним враги двигаются все разом
+            self.enemy_path_x = np.array([point["x"] for point in self.enemy_path], dtype=np.float64)
+            self.enemy_path_y = np.array([point["y"] for point in self.enemy_path], dtype=np.float64)
             
         elif self.level_type == "stealth":
             # ДЖЕЙМС БОНД СТИЛЬ - ТАЙНАЯ МИССИЯ
-            self.guards = []
             self.guard_spawn_timer = 0
             self.detection_level = 0
             self.max_detection = 100
@@ -1701,69 +4014,52 @@ class Game:
             ]
             
             # НАМНОГО БОЛЬШЕ ОПАСНЫХ ОХРАННИКОВ
-            self.guards = [
+            # (x, y, направление, дальность патруля, скорость, дальность видимости, тип)
+            guards = (
                 # ПОДВАЛ - склад с охраной
-                {"x": 150, "y": 580, "direction": 1, "patrol_range": 200, "start_x": 150,
-                 "speed": 1.5, "vision_range": 95, "type": "patrol", "alert_level": 0},
-                {"x": 500, "y": 570, "direction": -1, "patrol_range": 180, "start_x": 500,
-                 "speed": 1.3, "vision_range": 90, "type": "patrol", "alert_level": 0},
+                (150, 580, 1, 200, 1.5, 95, "patrol"),
+                (500, 570, -1, 180, 1.3, 90, "patrol"),
                 
                 # Нижний этаж - УСИЛЕННАЯ ОХРАНА ВЕСТИБЮЛЯ
-                {"x": 120, "y": 500, "direction": 1, "patrol_range": 160, "start_x": 120,
-                 "speed": 1.8, "vision_range": 110, "type": "office", "alert_level": 0},
-                {"x": 350, "y": 490, "direction": -1, "patrol_range": 140, "start_x": 350,
-                 "speed": 1.6, "vision_range": 105, "type": "office", "alert_level": 0},
-                {"x": 580, "y": 480, "direction": 1, "patrol_range": 150, "start_x": 580,
-                 "speed": 1.7, "vision_range": 100, "type": "office", "alert_level": 0},
-                {"x": 720, "y": 495, "direction": -1, "patrol_range": 80, "start_x": 720,
-                 "speed": 2.0, "vision_range": 115, "type": "elite", "alert_level": 0},
+                (120, 500, 1, 160, 1.8, 110, "office"),
+                (350, 490, -1, 140, 1.6, 105, "office"),
+                (580, 480, 1, 150, 1.7, 100, "office"),
+                (720, 495, -1, 80, 2.0, 115, "elite"),
                 
                 # Средний этаж - ОФИСНЫЕ ОХРАННИКИ (больше и быстрее)
-                {"x": 80, "y": 380, "direction": 1, "patrol_range": 120, "start_x": 80,
-                 "speed": 2.2, "vision_range": 120, "type": "office", "alert_level": 0},
-                {"x": 200, "y": 370, "direction": -1, "patrol_range": 100, "start_x": 200,
-                 "speed": 2.0, "vision_range": 110, "type": "office", "alert_level": 0},
-                {"x": 350, "y": 360, "direction": 1, "patrol_range": 130, "start_x": 350,
-                 "speed": 1.9, "vision_range": 115, "type": "office", "alert_level": 0},
-                {"x": 500, "y": 375, "direction": -1, "patrol_range": 140, "start_x": 500,
-                 "speed": 2.1, "vision_range": 125, "type": "elite", "alert_level": 0},
-                {"x": 650, "y": 365, "direction": 1, "patrol_range": 90, "start_x": 650,
-                 "speed": 2.3, "vision_range": 130, "type": "elite", "alert_level": 0},
+                (80, 380, 1, 120, 2.2, 120, "office"),
+                (200, 370, -1, 100, 2.0, 110, "office"),
+                (350, 360, 1, 130, 1.9, 115, "office"),
+                (500, 375, -1, 140, 2.1, 125, "elite"),
+                (650, 365, 1, 90, 2.3, 130, "elite"),
                 
                 # Средне-верхний этаж - ТЕХНИЧЕСКАЯ ОХРАНА
-                {"x": 150, "y": 270, "direction": 1, "patrol_range": 120, "start_x": 150,
-                 "speed": 2.5, "vision_range": 140, "type": "elite", "alert_level": 0},
-                {"x": 350, "y": 260, "direction": -1, "patrol_range": 100, "start_x": 350,
-                 "speed": 2.4, "vision_range": 135, "type": "elite", "alert_level": 0},
-                {"x": 550, "y": 255, "direction": 1, "patrol_range": 110, "start_x": 550,
-                 "speed": 2.6, "vision_range": 145, "type": "elite", "alert_level": 0},
+                (150, 270, 1, 120, 2.5, 140, "elite"),
+                (350, 260, -1, 100, 2.4, 135, "elite"),
+                (550, 255, 1, 110, 2.6, 145, "elite"),
                 
                 # ВЕРХНИЙ ЭТАЖ - ЭЛИТНАЯ VIP ОХРАНА (ОЧЕНЬ ОПАСНАЯ)
-                {"x": 200, "y": 150, "direction": 1, "patrol_range": 150, "start_x": 200,
-                 "speed": 3.0, "vision_range": 160, "type": "elite", "alert_level": 0},
-                {"x": 400, "y": 140, "direction": -1, "patrol_range": 120, "start_x": 400,
-                 "speed": 2.8, "vision_range": 150, "type": "elite", "alert_level": 0},
-                {"x": 600, "y": 135, "direction": 1, "patrol_range": 140, "start_x": 600,
-                 "speed": 2.9, "vision_range": 155, "type": "elite", "alert_level": 0},
+                (200, 150, 1, 150, 3.0, 160, "elite"),
+                (400, 140, -1, 120, 2.8, 150, "elite"),
+                (600, 135, 1, 140, 2.9, 155, "elite"),
                 
                 # СНАЙПЕРЫ НА КЛЮЧЕВЫХ ПОЗИЦИЯХ (САМЫЕ ОПАСНЫЕ)
-                {"x": 100, "y": 200, "direction": 0, "patrol_range": 0, "start_x": 100,
-                 "speed": 0, "vision_range": 250, "type": "sniper", "alert_level": 0},
-                {"x": 400, "y": 300, "direction": 0, "patrol_range": 0, "start_x": 400,
-                 "speed": 0, "vision_range": 280, "type": "sniper", "alert_level": 0},
-                {"x": 700, "y": 180, "direction": 0, "patrol_range": 0, "start_x": 700,
-                 "speed": 0, "vision_range": 260, "type": "sniper", "alert_level": 0},
+                (100, 200, 0, 0, 0, 250, "sniper"),
+                (400, 300, 0, 0, 0, 280, "sniper"),
+                (700, 180, 0, 0, 0, 260, "sniper"),
                 
                 # ДОПОЛНИТЕЛЬНЫЕ ПАТРУЛИ НА ЛЕСТНИЦАХ
-                {"x": 50, "y": 450, "direction": 1, "patrol_range": 60, "start_x": 50,
-                 "speed": 1.5, "vision_range": 80, "type": "patrol", "alert_level": 0},
-                {"x": 750, "y": 320, "direction": -1, "patrol_range": 70, "start_x": 750,
-                 "speed": 1.6, "vision_range": 85, "type": "patrol", "alert_level": 0},
-            ]
+                (50, 450, 1, 60, 1.5, 80, "patrol"),
+                (750, 320, -1, 70, 1.6, 85, "patrol"),
+            )
+            self.guards = EntityStore(Guard)
+            for x, y, direction, patrol_range, speed, vision_range, guard_type in guards:
+                self.guards.create(guard_type, x, y, direction=direction, patrol_range=patrol_range,
+                                   start_x=x, speed=speed, vision_range=vision_range)
             
         elif self.level_type == "survival":
             # SURVIVAL - выживание против зомби
-            self.zombies = []
+            self.zombies = EntityStore(Zombie)
             self.zombie_spawn_timer = 0
             self.wave = 1
             self.zombies_to_spawn = 5
@@ -1775,7 +4071,6 @@ class Game:
             self.max_ammo = 100
             self.reload_timer = 0
             self.barricades = []
-            self.player_bullets = []  # Добавляем инициализацию пуль игрока
             
             # Создаем баррикады для укрытия
             self.barricades = [
@@ -1800,53 +4095,58 @@ class Game:
             
             # Здания
             self.buildings = [
-                {"type": "command_center", "x": 100, "y": 400, "health": 500, "max_health": 500}
+                Building("command_center", 100, 400, 500)
             ]
             self.enemy_buildings = [
-                {"type": "command_center", "x": 650, "y": 400, "health": 500, "max_health": 500}
+                Building("command_center", 650, 400, 500)
             ]
             
             # Юниты
-            self.units = [
-                {"type": "worker", "x": 120, "y": 420, "health": 40, "target": None, "carrying": 0}
-            ]
-            self.enemy_units = []
+            self.units = EntityStore(StrategyUnit)
+            create_strategy_unit(self.units, "worker", 120, 420)
+            self.enemy_units = EntityStore(StrategyUnit)
             
             # Ресурсы на карте
             self.mineral_patches = [
-                {"x": 50, "y": 350, "minerals": 500},
-                {"x": 700, "y": 350, "minerals": 500}
+                MineralPatch(50, 350, 500),
+                MineralPatch(700, 350, 500)
             ]
             
             self.selected_building = None
             self.selected_unit_type = "worker"
-            self.selected_units = []  # Выделенные юниты
             self.enemy_spawn_timer = 0
             self.target_score = 1  # Уничтожить вражескую базу
             
         elif self.level_type == "final_mix":
             # Финальный уровень с боссом
-            self.missiles = []
-            self.player_bullets = []
+            self.missiles = EntityStore(Missile)
             self.missile_spawn_timer = 0
-            self.boss = Boss(SCREEN_WIDTH//2 - 60, 50)  # Босс в центре вверху
+            self.boss = Boss(SCREEN_WIDTH//2 - 60, 50, self.projectiles)  # Босс в центре вверху
             self.target_score = 1  # Победить босса
             
         # Остальные жанры пока упрощенные
         else:
-            self.missiles = []
-            self.player_bullets = []
+            self.missiles = EntityStore(Missile)
             self.missile_spawn_timer = 0
             self.target_score = 15
     
     def update(self):
+        # Тик с живым вводом: клавиатура и мышь опрашиваются один раз
+        self.step(input_state.sample())
+    
+    def step(self, snapshot):
+        # Один тик симуляции с заданным вводом (InputSnapshot). Не трогает
+        # дисплей, очередь событий и часы - уровнем можно управлять из кода
+        self.input = snapshot
+        for event in snapshot.events:
+            self.handle_event(event)
         if self.game_over or self.level_complete:
             return
         
         self.timer += 1
         # В tower defense игрок не двигается - это стратегическая игра
         if self.level_type != "tower_defense":
-            self.player.update(self.level_type)
+            self.player.update(self.level_type, self.input)
         
         if self.level_type == "shooter":
             self.update_shooter()
@@ -1872,52 +4172,61 @@ class Game:
             # Упрощенная версия для остальных жанров - инициализируем переменные если их нет
             if not hasattr(self, 'missile_spawn_timer'):
                 self.missile_spawn_timer = 0
-                self.missiles = []
-                self.player_bullets = []
+                self.missiles = EntityStore(Missile)
                 self.target_score = 15
             self.update_shooter()
     
     def update_shooter(self):
         # Стрельба (пробел или мышь)
-        keys = pygame.key.get_pressed()
-        mouse_pressed = pygame.mouse.get_pressed()[0]  # Левая кнопка мыши
+        keys = self.input
+        mouse_pressed = self.input.mouse_buttons[0]  # Левая кнопка мыши
         
         if keys[pygame.K_SPACE] or mouse_pressed:
-            bullet = self.player.shoot()
-            if bullet:
-                self.player_bullets.append(bullet)
+            self.player.shoot(self.projectiles)
         
         # Спавн ракет
         self.missile_spawn_timer += 1
         if self.missile_spawn_timer >= 60:
-            x = random.randint(0, SCREEN_WIDTH - 8)
+            x = self.rng.spawn.randint(0, SCREEN_WIDTH - 8)
             y = -15
-            self.missiles.append(Missile(x, y, self.player, 2))
+            self.missiles.create("missile", x, y, speed=2)
             self.missile_spawn_timer = 0
         
         # Обновление объектов
-        for bullet in self.player_bullets[:]:
-            bullet.update()
-            if bullet.y < 0:
-                self.player_bullets.remove(bullet)
+        projectiles = self.projectiles
+        owner = projectiles.add_owner(self.player)
+        projectiles.integrate()
+        projectiles.cull(owner, top=0)
+        
+        # Проверка столкновений пуль с ракетами: каждая ракета забирает первую свободную пулю
+        bullets = self.grids["bullets"]
+        bullets.rebuild(projectiles.boxes(owner))
+        missiles = self.missiles
+        used = set()
+        for missile, bullet in bullets.pairs(missiles.boxes(missiles.rows())):
+            if bullet in used or not missiles.alive[missile]:
                 continue
-            
-            # Проверка столкновений пуль с ракетами
-            bullet_rect = bullet.get_rect()
-            for missile in self.missiles[:]:
-                if bullet_rect.colliderect(missile.get_rect()):
-                    # Уничтожаем и ракету и пулю
-                    self.missiles.remove(missile)
-                    self.player_bullets.remove(bullet)
-                    self.score += 1  # Даём очки за уничтожение ракеты
-                    break
-        
-        for missile in self.missiles[:]:
-            missile.update()
-            if missile.get_rect().colliderect(self.player.get_rect()):
-                self.game_over = True
-            if missile.y > SCREEN_HEIGHT:
-                self.missiles.remove(missile)
+            # Уничтожаем и ракету и пулю
+            used.add(bullet)
+            missiles.destroy(missile)
+            self.score += 1  # Даём очки за уничтожение ракеты
+        projectiles.remove(sorted(used))
+        
+        # Самонаведение ракет на центр игрока
+        rows = missiles.rows()
+        dx = self.player.x + self.player.width//2 - missiles.x[rows]
+        dy = self.player.y + self.player.height//2 - missiles.y[rows]
+        distance = np.sqrt(dx * dx + dy * dy)
+        homing = distance > 0
+        rows, dx, dy, distance = rows[homing], dx[homing], dy[homing], distance[homing]
+        missiles.x[rows] += dx / distance * missiles.speed[rows]
+        missiles.y[rows] += dy / distance * missiles.speed[rows]
+        
+        rows = missiles.rows()
+        
+        if len(missiles.hits(self.player.get_rect(), rows)):
+            self.game_over = True
+        missiles.destroy_rows(rows[missiles.y[rows] > SCREEN_HEIGHT])
         
         if self.score >= self.target_score:
             self.level_complete = True
@@ -1934,8 +4243,8 @@ class Game:
         # Убираем wall jump - слишком сложно с новым управлением
         # Теперь стены просто блокируют горизонтальное движение
         
-        # Обычные столкновения с платформами
-        for platform in self.platforms:
+        # Обычные столкновения с платформами (только с ближайшими по сетке)
+        for platform in self.grids["platforms"].query(player_rect):
             platform_rect = platform.get_rect()
             
             if player_rect.colliderect(platform_rect):
@@ -1958,9 +4267,8 @@ class Game:
         # Убираем логику wall jump
         
         # Проверка столкновений с шипами
-        for spike in self.spikes:
-            if player_rect.colliderect(spike.get_rect()):
-                self.game_over = True
+        if self.grids["spikes"].query(player_rect):
+            self.game_over = True
         
         # Проверка столкновений с пилами
         for saw in self.saws:
@@ -1983,39 +4291,24 @@ class Game:
         # Проверка падения
         if self.player.y > SCREEN_HEIGHT:
             self.game_over = True
-        
-        # Инструкции управления на экране
-        instruction1 = self.font_small.render("A/D - движение влево/вправо", True, YELLOW)
-        self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 140))
-        instruction2 = self.font_small.render("W/ПРОБЕЛ - прыжок (время нажатия = высота прыжка)", True, YELLOW)
-        self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 120))
-        instruction3 = self.font_small.render("Быстрый тап = низкий прыжок, долгое нажатие = высокий прыжок", True, YELLOW)
-        self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 100))
-        instruction4 = self.font_small.render("Достигните ВЕРШИНЫ - используйте максимальные прыжки!", True, YELLOW)
-        self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 80))
-        
-        # Показываем прогресс высоты
-        height_progress = (SCREEN_HEIGHT - self.max_height_reached) / (SCREEN_HEIGHT + 350)
-        height_progress_percent = int(height_progress * 100)
-        progress_text = self.font_small.render(f"Высота: {height_progress_percent}%", True, WHITE)
-        self.screen.blit(progress_text, (10, SCREEN_HEIGHT - 60))
     
     def update_racing(self):
         # Спавн препятствий
         self.obstacle_spawn_timer += 1
         if self.obstacle_spawn_timer >= 40:
-            x = random.randint(0, SCREEN_WIDTH - 30)
-            self.racing_obstacles.append(RacingObstacle(x, -30))
+            x = self.rng.spawn.randint(0, SCREEN_WIDTH - 30)
+            self.racing_obstacles.create("obstacle", x, -30, vy=5)
             self.obstacle_spawn_timer = 0
         
         # Обновление препятствий
-        for obstacle in self.racing_obstacles[:]:
-            obstacle.update()
-            if obstacle.get_rect().colliderect(self.player.get_rect()):
-                self.game_over = True
-            if obstacle.y > SCREEN_HEIGHT:
-                self.racing_obstacles.remove(obstacle)
-                self.distance += 10
+        obstacles = self.racing_obstacles
+        obstacles.move()
+        rows = obstacles.rows()
+        if len(obstacles.hits(self.player.get_rect(), rows)):
+            self.game_over = True
+        passed = rows[obstacles.y[rows] > SCREEN_HEIGHT]
+        obstacles.destroy_rows(passed)
+        self.distance += 10 * len(passed)
         
         self.distance += 1
         if self.distance >= self.target_distance:
@@ -2024,7 +4317,7 @@ class Game:
     def update_puzzle(self):
         # Проверка сбора ключей
         player_rect = self.player.get_rect()
-        for block in self.puzzle_blocks:
+        for block in self.grids["puzzle_blocks"].nearby(player_rect):
             if block.block_type == "key" and not block.collected:
                 if player_rect.colliderect(block.get_rect()):
                     block.collected = True
@@ -2045,40 +4338,39 @@ class Game:
         # Спавн нот
         self.note_spawn_timer += 1
         if self.note_spawn_timer >= 60:
-            note_type = random.choice(["left", "right", "up", "down"])
+            note_type = self.rng.spawn.choice(["left", "right", "up", "down"])
             x = 100 + (["left", "right", "up", "down"].index(note_type) * 150)
-            self.rhythm_notes.append(RhythmNote(x, -20, note_type))
+            self.rhythm_notes.create(note_type, x, -20, vy=3)
             self.note_spawn_timer = 0
         
-        # Обновление нот
-        keys = pygame.key.get_pressed()
-        for note in self.rhythm_notes[:]:
-            note.update()
-            
-            # Проверка попадания в зону
-            if abs(note.y - self.hit_zone_y) < 30 and not note.hit:
-                hit = False
-                if note.note_type == "left" and (keys[pygame.K_LEFT] or keys[pygame.K_a]):
-                    hit = True
-                elif note.note_type == "right" and (keys[pygame.K_RIGHT] or keys[pygame.K_d]):
-                    hit = True
-                elif note.note_type == "up" and (keys[pygame.K_UP] or keys[pygame.K_w]):
-                    hit = True
-                elif note.note_type == "down" and (keys[pygame.K_DOWN] or keys[pygame.K_s]):
-                    hit = True
-                
-                if hit:
-                    note.hit = True
-                    self.score += 10 * self.score_multiplier
-                    self.combo += 1
-                    if self.combo > 10:
-                        self.score_multiplier = 2
-            
-            if note.y > SCREEN_HEIGHT:
-                if not note.hit:
-                    self.combo = 0
-                    self.score_multiplier = 1
-                self.rhythm_notes.remove(note)
+        # Обновление нот (короткое нажатие между тиками тоже засчитывается)
+        keys = self.input
+        notes = self.rhythm_notes
+        notes.move()
+        rows = notes.rows()
+        y, flags = notes.y[rows], notes.flags[rows]
+        
+        # Все ноты падают с одной скоростью, поэтому ушедшие за экран - самые старые:
+        # пропущенная нота сбрасывает комбо раньше, чем засчитываются новые попадания
+        passed = y > SCREEN_HEIGHT
+        if (passed & ((flags & ENTITY_HIT) == 0)).any():
+            self.combo = 0
+            self.score_multiplier = 1
+        
+        # Проверка попадания в зону: нажатие засчитывается нотам своей дорожки
+        pressed = np.array([keys.is_down(pygame.K_LEFT) or keys.is_down(pygame.K_a),
+                            keys.is_down(pygame.K_RIGHT) or keys.is_down(pygame.K_d),
+                            keys.is_down(pygame.K_UP) or keys.is_down(pygame.K_w),
+                            keys.is_down(pygame.K_DOWN) or keys.is_down(pygame.K_s)])
+        hit = (np.abs(y - self.hit_zone_y) < 30) & ((flags & ENTITY_HIT) == 0) & pressed[notes.kind[rows]]
+        notes.flags[rows[hit]] |= ENTITY_HIT
+        for _ in range(int(hit.sum())):
+            self.score += 10 * self.score_multiplier
+            self.combo += 1
+            if self.combo > 10:
+                self.score_multiplier = 2
+        
+        notes.destroy_rows(rows[passed])
         
         if self.score >= 500:
             self.level_complete = True
@@ -2087,7 +4379,7 @@ class Game:
         # УЛУЧШЕННАЯ ЛОГИКА TOWER DEFENSE С БОССОМ
         
         # Переключение типов башен
-        keys = pygame.key.get_pressed()
+        keys = self.input
         if keys[pygame.K_1]:
             self.selected_tower_type = "basic"
         elif keys[pygame.K_2]:
@@ -2099,43 +4391,48 @@ class Game:
         
         # БОСС ФАЗА - после всех волн
         if self.wave > self.target_score and not self.boss_spawned:
-            self.tower_defense_boss = TowerDefenseBoss(SCREEN_WIDTH//2 - 40, 50)
+            self.tower_defense_boss = TowerDefenseBoss(SCREEN_WIDTH//2 - 40, 50, self.projectiles, self.rng)
             self.boss_spawned = True
             self.boss_fight = True
             self.money += 500  # Бонусные деньги для финальной битвы
         
         if self.boss_fight and hasattr(self, 'tower_defense_boss') and self.tower_defense_boss:
-            # Обновление босса (TowerDefenseBoss)
+            # Обновление босса (TowerDefenseBoss) и его пуль
+            projectiles = self.projectiles
             self.tower_defense_boss.update(self.towers, self.enemies)
+            projectiles.integrate(self.tower_defense_boss.owner)
+            self.tower_defense_boss.cull_bullets()
             
-            # Добавляем миньонов босса к обычным врагам
-            for minion in self.tower_defense_boss.minions[:]:
-                self.enemies.append(minion)
-                self.tower_defense_boss.minions.remove(minion)
-            
-            # Проверка попаданий пуль башен по боссу
+            # Проверка попаданий пуль башен по боссу (одна пуля от башни за тик)
+            boss_rect = self.tower_defense_boss.get_rect()
             for tower in self.towers:
-                for bullet in tower.bullets[:]:
-                    bullet_rect = pygame.Rect(bullet["x"] - 3, bullet["y"] - 3, 6, 6)
-                    if bullet_rect.colliderect(self.tower_defense_boss.get_rect()):
-                        if self.tower_defense_boss.take_damage(bullet["damage"]):
-                            self.level_complete = True  # Босс побежден!
-                        tower.bullets.remove(bullet)
-                        break
+                bullet = projectiles.first_hit(boss_rect, tower.owner)
+                if bullet >= 0:
+                    if self.tower_defense_boss.take_damage(int(projectiles.damage[bullet])):
+                        self.level_complete = True  # Босс побежден!
+                    projectiles.remove([bullet])
             
             # Проверка попаданий пуль босса по башням
-            for bullet in self.tower_defense_boss.boss_bullets[:]:
-                bullet_rect = pygame.Rect(bullet["x"] - 6, bullet["y"] - 6, 12, 12)
-                for tower in self.towers[:]:
-                    if bullet_rect.colliderect(tower.get_rect()):
-                        # Уничтожаем башню
-                        self.towers.remove(tower)
-                        self.tower_defense_boss.boss_bullets.remove(bullet)
-                        # Находим место строительства и освобождаем его
-                        for spot in self.valid_build_spots:
-                            if abs(spot["x"] - tower.x) < 30 and abs(spot["y"] - tower.y) < 30:
-                                spot["occupied"] = False
-                        break
+            boss_bullets = self.grids["boss_bullets"]
+            boss_bullets.rebuild(projectiles.boxes(self.tower_defense_boss.owner))
+            used = set()
+            destroyed = []
+            for tower, bullet in boss_bullets.pairs((tower, tower.get_rect()) for tower in self.towers):
+                if bullet in used or tower.owner in destroyed:
+                    continue
+                used.add(bullet)
+                # Уничтожаем башню вместе с ее пулями
+                destroyed.append(tower.owner)
+                # Находим место строительства и освобождаем его
+                for spot in self.valid_build_spots:
+                    if abs(spot["x"] - tower.x) < 30 and abs(spot["y"] - tower.y) < 30:
+                        spot["occupied"] = False
+            if destroyed:
+                self.towers = [tower for tower in self.towers if tower.owner not in destroyed]
+                # Попавшие пули и пули уничтоженных башен - одним удалением
+                mask = projectiles.owned_mask(destroyed)
+                mask[sorted(used)] = True
+                projectiles.remove_mask(mask)
         
         # Обычная логика волн (только если босс не появился)
         elif not self.boss_fight:
@@ -2151,15 +4448,15 @@ class Game:
                     if self.wave <= 2:
                         enemy_type = "basic"
                     elif self.wave <= 4:
-                        enemy_type = "fast" if random.random() < 0.4 else "basic"
+                        enemy_type = "fast" if self.rng.spawn.random() < 0.4 else "basic"
                     elif self.wave <= 8:
-                        enemy_type = random.choice(["basic", "fast", "tank", "elite"])
+                        enemy_type = self.rng.spawn.choice(["basic", "fast", "tank", "elite"])
                     else:
                         # В поздних волнах больше элитных врагов
-                        enemy_type = random.choice(["fast", "tank", "elite", "elite"])
+                        enemy_type = self.rng.spawn.choice(["fast", "tank", "elite", "elite"])
                     
-                    enemy = self.create_enemy(enemy_type)
-                    self.enemies.append(enemy)
+                    start = self.enemy_path[0]
+                    create_td_enemy(self.enemies, enemy_type, start["x"], start["y"], self.wave)
                     self.enemies_spawned += 1
                     self.enemy_spawn_timer = 0
                 
@@ -2177,157 +4474,91 @@ class Game:
                         self.enemies_in_wave += 3 + self.wave // 2  # Больше врагов
                         self.enemies_spawned = 0
                         self.wave_complete = False
-                        self.wave_delay = 150  # Меньше времени между волнами
-        
-        # Обновление врагов (движение по пути и регенерация)
-        for enemy in self.enemies[:]:
-            # Регенерация для элитных врагов
-            if enemy.get("regenerates") and enemy["health"] < enemy["max_health"]:
-                enemy["health"] = min(enemy["max_health"], enemy["health"] + 1)
-            
-            self.move_enemy_along_path(enemy)
-            
-            # Проверка достижения конца пути
-            if enemy["path_index"] >= len(self.enemy_path) - 1:
-                self.lives -= enemy.get("damage", 1)
-                self.enemies.remove(enemy)
-                if self.lives <= 0:
-                    self.game_over = True
-        
-        # Обновление башен
-        for tower in self.towers:
-            # Обновляем против обычных врагов и босса
-            all_targets = self.enemies[:]
-            if self.boss_fight and hasattr(self, 'tower_defense_boss') and self.tower_defense_boss:
-                # Босс как дополнительная цель (но башни предпочитают обычных врагов)
-                if len(self.enemies) == 0:  # Только если нет других врагов
-                    all_targets.append({
-                        "x": self.tower_defense_boss.x + self.tower_defense_boss.width//2,
-                        "y": self.tower_defense_boss.y + self.tower_defense_boss.height//2,
-                        "type": "boss"
-                    })
-            
-            tower.update(all_targets)
-            
-            # Проверка попаданий пуль башен по обычным врагам
-            for bullet in tower.bullets[:]:
-                bullet["x"] += bullet["dx"]
-                bullet["y"] += bullet["dy"]
-                
-                hit = False
-                for enemy in self.enemies[:]:
-                    enemy_rect = pygame.Rect(enemy["x"] - 15, enemy["y"] - 15, 30, 30)
-                    bullet_rect = pygame.Rect(bullet["x"] - 3, bullet["y"] - 3, 6, 6)
-                    
-                    if bullet_rect.colliderect(enemy_rect):
-                        # Наносим урон
-                        enemy["health"] -= bullet["damage"]
-                        
-                        # Особые эффекты башен
-                        if bullet["type"] == "freeze":
-                            enemy["frozen"] = 60  # Заморозка на 1 секунду
-                        
-                        if enemy["health"] <= 0:
-                            self.money += enemy.get("reward", 10)
-                            tower.kill_count += 1
-                            self.enemies.remove(enemy)
-                        
-                        tower.bullets.remove(bullet)
-                        hit = True
-                        break
-                
-                if not hit and (bullet["x"] < 0 or bullet["x"] > SCREEN_WIDTH or 
-                               bullet["y"] < 0 or bullet["y"] > SCREEN_HEIGHT):
-                    tower.bullets.remove(bullet)
-    
-    def create_enemy(self, enemy_type):
-        if enemy_type == "basic":
-            return {
-                "x": self.enemy_path[0]["x"],
-                "y": self.enemy_path[0]["y"],
-                "health": 160 + self.wave * 30,  # В 2 РАЗА больше здоровья
-                "max_health": 160 + self.wave * 30,
-                "speed": 1.4,  # Еще быстрее
-                "path_index": 0,
-                "path_progress": 0,
-                "reward": 30,  # В 2 раза больше награды
-                "damage": 4,  # В 2 раза больше урона
-                "type": "basic",
-                "color": RED,
-                "frozen": 0
-            }
-        elif enemy_type == "fast":
-            return {
-                "x": self.enemy_path[0]["x"],
-                "y": self.enemy_path[0]["y"],
-                "health": 120 + self.wave * 20,  # В 2 раза больше здоровья
-                "max_health": 120 + self.wave * 20,
-                "speed": 3.0,  # Еще быстрее
-                "path_index": 0,
-                "path_progress": 0,
-                "reward": 40,  # В 2 раза больше награды
-                "damage": 2,  # В 2 раза больше урона
-                "type": "fast",
-                "color": YELLOW,
-                "frozen": 0
-            }
-        elif enemy_type == "tank":
-            return {
-                "x": self.enemy_path[0]["x"],
-                "y": self.enemy_path[0]["y"],
-                "health": 400 + self.wave * 50,  # В 2 РАЗА больше здоровья
-                "max_health": 400 + self.wave * 50,
-                "speed": 1.0,  # Быстрее
-                "path_index": 0,
-                "path_progress": 0,
-                "reward": 80,  # В 2 раза большая награда
-                "damage": 6,  # В 2 раза больше урона
-                "type": "tank",
-                "color": PURPLE,
-                "frozen": 0
-            }
-        elif enemy_type == "elite":
-            return {
-                "x": self.enemy_path[0]["x"],
-                "y": self.enemy_path[0]["y"],
-                "health": 300 + self.wave * 40,  # В 2 раза больше здоровья
-                "max_health": 300 + self.wave * 40,
-                "speed": 2.2,  # Быстрее
-                "path_index": 0,
-                "path_progress": 0,
-                "reward": 60,  # В 2 раза больше
-                "damage": 4,  # В 2 раза больше урона
-                "type": "elite",
-                "color": (255, 0, 255),  # Магента
-                "frozen": 0,
-                "regenerates": True  # Особенность элитных врагов
-            }
-    
-    def move_enemy_along_path(self, enemy):
-        if enemy["frozen"] > 0:
-            enemy["frozen"] -= 1
-            return
+                        self.wave_delay = 150  # Меньше времени между волнами
         
-        if enemy["path_index"] < len(self.enemy_path) - 1:
-            current_point = self.enemy_path[enemy["path_index"]]
-            next_point = self.enemy_path[enemy["path_index"] + 1]
-            
-            # Движение к следующей точке пути
-            dx = next_point["x"] - current_point["x"]
-            dy = next_point["y"] - current_point["y"]
-            distance = math.sqrt(dx*dx + dy*dy)
-            
-            if distance > 0:
-                move_x = (dx / distance) * enemy["speed"]
-                move_y = (dy / distance) * enemy["speed"]
+        # Обновление врагов (движение по пути и регенерация) - по столбцам
+        enemies = self.enemies
+        rows = enemies.rows()
+        health, max_health = enemies.health, enemies.max_health
+        
+        # Регенерация для элитных врагов
+        regenerating = rows[enemies.get_kinds(rows, "elite") & (health[rows] < max_health[rows])]
+        health[regenerating] = np.minimum(max_health[regenerating], health[regenerating] + 1)
+        
+        # Замороженные стоят на месте
+        frozen = enemies.frozen
+        stopped = frozen[rows] > 0
+        frozen[rows[stopped]] -= 1
+        self.move_enemies_along_path(rows[~stopped])
+        
+        # Дошедшие до конца пути отнимают жизни
+        finished = rows[enemies.path_index[rows] >= len(self.enemy_path) - 1]
+        if len(finished):
+            self.lives -= int(enemies.damage[finished].sum())
+            enemies.destroy_rows(finished)
+            if self.lives <= 0:
+                self.game_over = True
+        
+        # Обновление башен: ближайшая цель в радиусе считается по столбцам врагов
+        boss_target = None
+        if self.boss_fight and hasattr(self, 'tower_defense_boss') and self.tower_defense_boss:
+            # Босс как дополнительная цель (но башни предпочитают обычных врагов)
+            if len(enemies) == 0:  # Только если нет других врагов
+                boss_target = (self.tower_defense_boss.x + self.tower_defense_boss.width//2,
+                               self.tower_defense_boss.y + self.tower_defense_boss.height//2)
+        projectiles = self.projectiles
+        for tower in self.towers:
+            tower.update(enemies, boss_target)
+            
+            # Второй шаг пуль башни и попадания по обычным врагам - сразу после ее хода:
+            # следующая башня выбирает цель уже после них. Каждая пуля ранит первого
+            # задетого врага
+            owner = tower.owner
+            projectiles.integrate(owner)
+            rows = enemies.rows()
+            used = []
+            for bullet in projectiles.rows(owner):
+                hits = enemies.hits(projectiles.get_rect(bullet), rows)
+                if not len(hits):
+                    continue
+                enemy = int(hits[0])
+                used.append(bullet)
+                # Наносим урон
+                enemies.health[enemy] -= int(projectiles.damage[bullet])
                 
-                enemy["x"] += move_x
-                enemy["y"] += move_y
+                # Особые эффекты башен
+                if projectiles.get_type_name(bullet) == "freeze":
+                    enemies.frozen[enemy] = 60  # Заморозка на 1 секунду
                 
-                # Проверяем достижение следующей точки
-                dist_to_next = math.sqrt((enemy["x"] - next_point["x"])**2 + (enemy["y"] - next_point["y"])**2)
-                if dist_to_next < 10:
-                    enemy["path_index"] += 1
+                if enemies.health[enemy] <= 0:
+                    self.money += int(enemies.reward[enemy])
+                    tower.kill_count += 1
+                    enemies.destroy(enemy)
+                    rows = rows[rows != enemy]
+            projectiles.remove(used)
+            projectiles.cull(owner, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    
+    def move_enemies_along_path(self, rows):
+        # Каждый враг идет по отрезку пути от своей точки к следующей
+        enemies = self.enemies
+        rows = rows[enemies.path_index[rows] < len(self.enemy_path) - 1]
+        index = enemies.path_index[rows]
+        path_x, path_y = self.enemy_path_x, self.enemy_path_y
+        next_x, next_y = path_x[index + 1], path_y[index + 1]
+        
+        # Движение к следующей точке пути
+        dx = next_x - path_x[index]
+        dy = next_y - path_y[index]
+        distance = np.sqrt(dx * dx + dy * dy)
+        moving = distance > 0
+        rows, next_x, next_y = rows[moving], next_x[moving], next_y[moving]
+        speed = enemies.speed[rows]
+        enemies.x[rows] += dx[moving] / distance[moving] * speed
+        enemies.y[rows] += dy[moving] / distance[moving] * speed
+        
+        # Проверяем достижение следующей точки
+        dist_to_next = np.sqrt((enemies.x[rows] - next_x) ** 2 + (enemies.y[rows] - next_y) ** 2)
+        enemies.path_index[rows[dist_to_next < 10]] += 1
     
     def update_stealth(self):
         # Обновляем таймеры миссии
@@ -2350,84 +4581,81 @@ class Game:
         else:
             self.mission_phase = 5  # VIP зона
         
-        # УЛУЧШЕННАЯ ЛОГИКА ОХРАННИКОВ
-        for guard in self.guards:
-            # Базовое движение зависит от типа
-            if guard["type"] == "sniper":
-                # Снайпер поворачивается медленно
-                if self.stealth_timer % 120 == 0:  # Каждые 2 секунды
-                    guard["direction"] = 1 if guard["direction"] <= 0 else -1
-            else:
-                # Обычное патрулирование с разной скоростью
-                guard["x"] += guard["direction"] * guard["speed"]
-                if abs(guard["x"] - guard["start_x"]) > guard["patrol_range"]:
-                    guard["direction"] *= -1
-            
-            # Увеличиваем скорость при тревоге
-            if self.alarm_active and guard["type"] != "sniper":
-                guard["speed"] = min(guard["speed"] * 1.5, 3.0)
-            elif not self.alarm_active:
-                # Восстанавливаем нормальную скорость
-                if guard["type"] == "patrol":
-                    guard["speed"] = 1.0 if guard["speed"] > 1.2 else guard["speed"]
-                elif guard["type"] == "office":
-                    guard["speed"] = 1.1 if guard["speed"] > 1.3 else guard["speed"]
-                elif guard["type"] == "elite":
-                    guard["speed"] = 1.4 if guard["speed"] > 1.6 else guard["speed"]
+        # УЛУЧШЕННАЯ ЛОГИКА ОХРАННИКОВ - по столбцам всех охранников
+        guards = self.guards
+        rows = guards.rows()
+        direction, speed = guards.direction, guards.speed
+        snipers = guards.get_kinds(rows, "sniper")
+        # Снайпер поворачивается медленно
+        if self.stealth_timer % 120 == 0:  # Каждые 2 секунды
+            turning = rows[snipers]
+            direction[turning] = np.where(direction[turning] <= 0, 1, -1)
+        # Обычное патрулирование с разной скоростью
+        patrolling = rows[~snipers]
+        guards.x[patrolling] += direction[patrolling] * speed[patrolling]
+        turned = patrolling[np.abs(guards.x[patrolling] - guards.start_x[patrolling]) > guards.patrol_range[patrolling]]
+        direction[turned] *= -1
+        
+        # Увеличиваем скорость при тревоге
+        if self.alarm_active:
+            speed[patrolling] = np.minimum(speed[patrolling] * 1.5, 3.0)
+        else:
+            # Восстанавливаем нормальную скорость
+            for guard_type, (limit, normal) in GUARD_CALM_SPEEDS.items():
+                calming = rows[guards.get_kinds(rows, guard_type)]
+                speed[calming[speed[calming] > limit]] = normal
         
         # ПРОВЕРКА УКРЫТИЯ
         player_hidden = False
-        for obstacle in self.obstacles:
+        obstacles = self.grids["obstacles"]
+        for obstacle in obstacles.nearby((self.player.x - 10, self.player.y - 10, 20, 20)):
             if (obstacle.x - 5 <= self.player.x <= obstacle.x + obstacle.width + 5 and
                 obstacle.y - 5 <= self.player.y <= obstacle.y + obstacle.height + 5):
                 player_hidden = True
                 break
         
         # СЛОЖНАЯ СИСТЕМА ОБНАРУЖЕНИЯ
+        alert_level = guards.alert_level
         if not player_hidden:
-            for guard in self.guards:
-                distance = math.sqrt((guard["x"] - self.player.x)**2 + (guard["y"] - self.player.y)**2)
-                
+            # Тревога может включиться по ходу проверки и увеличить дальность видимости
+            # остальных - поэтому отбираем всех, кто увидел бы игрока и с увеличенной
+            distance = guards.distances(self.player.x, self.player.y, rows)
+            near = distance < guards.vision_range[rows] * 1.5
+            for guard, guard_distance in zip(rows[near].tolist(), distance[near].tolist()):
                 # Разная дальность видимости у разных типов
-                vision_range = guard["vision_range"]
+                vision_range = int(guards.vision_range[guard])
                 if self.alarm_active:
                     vision_range *= 1.5  # Увеличенная бдительность при тревоге
                 
-                if distance < vision_range:
+                if guard_distance < vision_range:
                     # Проверка линии видимости (не через препятствия)
+                    guard_x, guard_y = float(guards.x[guard]), float(guards.y[guard])
                     can_see = True
-                    for obstacle in self.obstacles:
+                    left, top = min(guard_x, self.player.x), min(guard_y, self.player.y)
+                    sight_rect = (left - 1, top - 1, max(guard_x, self.player.x) - left + 2,
+                                  max(guard_y, self.player.y) - top + 2)
+                    for obstacle in obstacles.nearby(sight_rect):
                         # Простая проверка препятствий между охранником и игроком
-                        if (min(guard["x"], self.player.x) < obstacle.x + obstacle.width and
-                            max(guard["x"], self.player.x) > obstacle.x and
-                            min(guard["y"], self.player.y) < obstacle.y + obstacle.height and
-                            max(guard["y"], self.player.y) > obstacle.y):
+                        if (min(guard_x, self.player.x) < obstacle.x + obstacle.width and
+                            max(guard_x, self.player.x) > obstacle.x and
+                            min(guard_y, self.player.y) < obstacle.y + obstacle.height and
+                            max(guard_y, self.player.y) > obstacle.y):
                             can_see = False
                             break
                     
                     if can_see:
                         # Скорость обнаружения зависит от типа охранника
-                        detection_speed = 1
-                        if guard["type"] == "elite":
-                            detection_speed = 3
-                        elif guard["type"] == "sniper":
-                            detection_speed = 4  # Снайпер замечает быстрее всех
-                        elif guard["type"] == "office":
-                            detection_speed = 2
-                        
-                        self.detection_level += detection_speed
-                        guard["alert_level"] = min(guard["alert_level"] + 2, 100)
+                        self.detection_level += GUARD_DETECTION_SPEEDS[guards.kind_names[guards.kind[guard]]]
+                        alert_level[guard] = min(alert_level[guard] + 2, 100)
                         
                         # При высоком уровне тревоги включается общая тревога
-                        if guard["alert_level"] > 50 and not self.alarm_active:
+                        if alert_level[guard] > 50 and not self.alarm_active:
                             self.alarm_active = True
                             # Все охранники становятся более бдительными
-                            for g in self.guards:
-                                g["alert_level"] = max(g["alert_level"], 30)
+                            alert_level[rows] = np.maximum(alert_level[rows], 30)
         else:
             # В укрытии - медленное снижение тревоги
-            for guard in self.guards:
-                guard["alert_level"] = max(guard["alert_level"] - 0.3, 0)
+            alert_level[rows] = np.maximum(alert_level[rows] - 0.3, 0)
         
         # Снижение общего уровня обнаружения
         if self.detection_level > 0:
@@ -2442,9 +4670,8 @@ class Game:
             self.alarm_active = False
             self.alarm_timer = 0
             # Сбрасываем состояние всех охранников
-            for guard in self.guards:
-                guard["alert_level"] = 0
-                guard["x"] = guard["start_x"]
+            alert_level[rows] = 0
+            guards.x[rows] = guards.start_x[rows]
         
         # Проверка достижения цели
         if abs(self.player.x - self.target_x) < 30 and abs(self.player.y - self.target_y) < 30:
@@ -2452,7 +4679,7 @@ class Game:
     
     def update_survival(self):
         # SURVIVAL - выживание против зомби
-        keys = pygame.key.get_pressed()
+        keys = self.input
         
         # Перезарядка
         if self.reload_timer > 0:
@@ -2460,9 +4687,7 @@ class Game:
         
         # Стрельба
         if keys[pygame.K_SPACE] and self.ammo > 0 and self.reload_timer <= 0:
-            bullet = self.player.shoot("survival")
-            if bullet:
-                self.player_bullets.append(bullet)
+            if self.player.shoot(self.projectiles, "survival"):
                 self.ammo -= 1
         
         # Перезарядка при нажатии R
@@ -2483,27 +4708,28 @@ class Game:
                 if self.wave <= 2:
                     zombie_type = "basic"
                 elif self.wave <= 5:
-                    zombie_type = "fast" if random.random() < 0.3 else "basic"
+                    zombie_type = "fast" if self.rng.spawn.random() < 0.3 else "basic"
                 elif self.wave <= 8:
                     types = ["basic", "fast", "tank"]
-                    zombie_type = random.choice(types)
+                    zombie_type = self.rng.spawn.choice(types)
                 else:
                     types = ["basic", "fast", "tank", "runner"]
-                    zombie_type = random.choice(types)
+                    zombie_type = self.rng.spawn.choice(types)
                 
                 # Спавн с краев экрана
-                side = random.choice(["top", "bottom", "left", "right"])
+                side = self.rng.spawn.choice(["top", "bottom", "left", "right"])
                 if side == "top":
-                    x, y = random.randint(0, SCREEN_WIDTH), -25
+                    x, y = self.rng.spawn.randint(0, SCREEN_WIDTH), -25
                 elif side == "bottom":
-                    x, y = random.randint(0, SCREEN_WIDTH), SCREEN_HEIGHT + 25
+                    x, y = self.rng.spawn.randint(0, SCREEN_WIDTH), SCREEN_HEIGHT + 25
                 elif side == "left":
-                    x, y = -25, random.randint(0, SCREEN_HEIGHT)
+                    x, y = -25, self.rng.spawn.randint(0, SCREEN_HEIGHT)
                 else:  # right
-                    x, y = SCREEN_WIDTH + 25, random.randint(0, SCREEN_HEIGHT)
+                    x, y = SCREEN_WIDTH + 25, self.rng.spawn.randint(0, SCREEN_HEIGHT)
                 
-                zombie = Zombie(x, y, zombie_type)
-                self.zombies.append(zombie)
+                speed, health, damage, color = ZOMBIE_TYPES[zombie_type]
+                self.zombies.create(zombie_type, x, y, health=health, speed=speed, max_health=health,
+                                    damage=damage)
                 self.zombies_spawned += 1
                 self.zombie_spawn_timer = 0
             
@@ -2525,49 +4751,62 @@ class Game:
                     self.player.health = min(100, self.player.health + 20)
                     self.ammo = self.max_ammo
         
-        # Обновление зомби
-        for zombie in self.zombies[:]:
-            zombie.update(self.player)
-            
-            # Атака зомби
-            if zombie.attack(self.player):
-                pass  # Урон уже нанесен в методе attack
-            
-            if self.player.health <= 0:
-                self.game_over = True
+        # Обновление зомби: движение к игроку и атаки считаются по столбцам
+        zombies = self.zombies
+        player = self.player
+        rows = zombies.rows()
+        dx = player.x - zombies.x[rows]
+        dy = player.y - zombies.y[rows]
+        distance = np.maximum(1, np.sqrt(dx * dx + dy * dy))
+        zombies.x[rows] += dx / distance * zombies.speed[rows]
+        zombies.y[rows] += dy / distance * zombies.speed[rows]
+        
+        # Кулдаун атаки
+        cooldown = zombies.attack_cooldown
+        cooldown[rows[cooldown[rows] > 0]] -= 1
+        
+        # Атака зомби: кто рядом и без кулдауна, бьет игрока
+        attackers = rows[(zombies.distances(player.x, player.y, rows) < 30) & (cooldown[rows] <= 0)]
+        if len(attackers):
+            player.take_damage(int(zombies.damage[attackers].sum()))
+            cooldown[attackers] = 60  # 1 секунда кулдаун
+        
+        if len(rows) and player.health <= 0:
+            self.game_over = True
         
         # Обновление пуль игрока
-        for bullet in self.player_bullets[:]:
-            bullet.update()
-            # Удаляем пули за границами экрана
-            if (bullet.x < -10 or bullet.x > SCREEN_WIDTH + 10 or 
-                bullet.y < -10 or bullet.y > SCREEN_HEIGHT + 10):
-                self.player_bullets.remove(bullet)
+        projectiles = self.projectiles
+        owner = projectiles.add_owner(self.player)
+        projectiles.integrate()
+        # Удаляем пули за границами экрана
+        projectiles.cull(owner, -10, -10, SCREEN_WIDTH + 10, SCREEN_HEIGHT + 10)
+        
+        # Проверка попаданий в зомби: каждая пуля ранит одного зомби
+        bullets = self.grids["bullets"]
+        bullets.rebuild(projectiles.boxes(owner))
+        used = set()
+        for zombie, bullet in bullets.pairs(zombies.boxes(zombies.rows())):
+            if bullet in used or not zombies.alive[zombie]:
                 continue
-            
-            # Проверка попаданий в зомби
-            bullet_rect = bullet.get_rect()
-            for zombie in self.zombies[:]:
-                if bullet_rect.colliderect(zombie.get_rect()):
-                    if zombie.take_damage(25):  # Убили зомби
-                        self.zombies.remove(zombie)
-                        self.score += 5
-                    self.player_bullets.remove(bullet)
-                    break
+            used.add(bullet)
+            zombies.health[zombie] -= 25
+            if zombies.health[zombie] <= 0:  # Убили зомби
+                zombies.destroy(zombie)
+                self.score += 5
+        projectiles.remove(sorted(used))
         
         # Проверка столкновений с баррикадами
         player_rect = self.player.get_rect()
-        for barricade in self.barricades:
-            if player_rect.colliderect(barricade.get_rect()):
-                # Простая физика отталкивания
-                if self.player.x < barricade.x:
-                    self.player.x = barricade.x - self.player.width
-                else:
-                    self.player.x = barricade.x + barricade.width
+        for barricade in self.grids["barricades"].query(player_rect):
+            # Простая физика отталкивания
+            if self.player.x < barricade.x:
+                self.player.x = barricade.x - self.player.width
+            else:
+                self.player.x = barricade.x + barricade.width
     
     def update_strategy(self):
         # StarCraft-стиль стратегия
-        keys = pygame.key.get_pressed()
+        keys = self.input
         
         # Переключение типа юнитов
         if keys[pygame.K_1]:
@@ -2587,135 +4826,67 @@ class Game:
                 
                 # Создаем юнита БЕЗОПАСНО рядом с командным центром
                 command_center = self.buildings[0]
-                spawn_x = command_center["x"] + 90  # Дальше от базы
-                spawn_y = command_center["y"] + 70  # Ниже базы
-                self.units.append({
-                    "type": self.selected_unit_type,
-                    "x": spawn_x,
-                    "y": spawn_y,
-                    "health": {"worker": 40, "marine": 45, "tank": 150}[self.selected_unit_type],
-                    "target": None,
-                    "carrying": 0 if self.selected_unit_type == "worker" else 0,
-                    "attack_cooldown": 0,
-                    "move_target": None
-                })
+                spawn_x = command_center.x + 90  # Дальше от базы
+                spawn_y = command_center.y + 70  # Ниже базы
+                create_strategy_unit(self.units, self.selected_unit_type, spawn_x, spawn_y)
                 self.minerals -= unit_costs[self.selected_unit_type]
                 self.supply_used += supply_costs[self.selected_unit_type]
         
         # Обновление рабочих - сбор минералов
-        for unit in self.units[:]:
-            if unit["type"] == "worker":
-                if unit["target"] is None:
-                    # Ищем ближайший минеральный патч
-                    closest_patch = None
-                    min_distance = float('inf')
-                    for patch in self.mineral_patches:
-                        if patch["minerals"] > 0:
-                            distance = math.sqrt((unit["x"] - patch["x"])**2 + (unit["y"] - patch["y"])**2)
-                            if distance < min_distance:
-                                min_distance = distance
-                                closest_patch = patch
-                    unit["target"] = closest_patch
-                
-                if unit["target"] and unit["carrying"] == 0:
-                    # Идем к минералам
-                    dx = unit["target"]["x"] - unit["x"]
-                    dy = unit["target"]["y"] - unit["y"]
-                    distance = math.sqrt(dx*dx + dy*dy)
-                    if distance < 20:
-                        # Собираем минералы
-                        if unit["target"]["minerals"] > 0:
-                            unit["carrying"] = 8
-                            unit["target"]["minerals"] -= 8
-                    else:
-                        # Движемся к минералам
-                        unit["x"] += (dx / distance) * 1
-                        unit["y"] += (dy / distance) * 1
-                
-                elif unit["carrying"] > 0:
-                    # Возвращаемся к командному центру
-                    command_center = self.buildings[0]
-                    dx = command_center["x"] - unit["x"]
-                    dy = command_center["y"] - unit["y"]
-                    distance = math.sqrt(dx*dx + dy*dy)
-                    if distance < 30:
-                        # Сдаем минералы
-                        self.minerals += unit["carrying"]
-                        unit["carrying"] = 0
-                        unit["target"] = None
-                    else:
-                        # Движемся к базе
-                        unit["x"] += (dx / distance) * 1
-                        unit["y"] += (dy / distance) * 1
-            
-            elif unit["type"] in ["marine", "tank"]:
-                # Боевые юниты - сначала проверяем команды игрока
-                if unit["attack_cooldown"] > 0:
-                    unit["attack_cooldown"] -= 1
-                
-                # Если есть цель движения от игрока
-                if unit.get("move_target"):
-                    target = unit["move_target"]
-                    dx = target["x"] - unit["x"]
-                    dy = target["y"] - unit["y"]
-                    distance = math.sqrt(dx*dx + dy*dy)
-                    
-                    if distance < 10:  # Достигли цели
-                        unit["move_target"] = None
-                    else:
-                        # Движемся к цели
-                        speed = {"marine": 2, "tank": 1}[unit["type"]]
-                        unit["x"] += (dx / distance) * speed
-                        unit["y"] += (dy / distance) * speed
-                else:
-                    # Автоматическое поведение - ищем ближайшего врага
-                    closest_enemy = None
-                    min_distance = float('inf')
-                    for enemy in self.enemy_units:
-                        distance = math.sqrt((unit["x"] - enemy["x"])**2 + (unit["y"] - enemy["y"])**2)
-                        if distance < min_distance:
-                            min_distance = distance
-                            closest_enemy = enemy
-                    
-                    # Ищем ближайшую цель (враги или здания)
-                    closest_target = None
-                    min_distance = float('inf')
-                    
-                    # Проверяем вражеские юниты
-                    for enemy in self.enemy_units:
-                        distance = math.sqrt((unit["x"] - enemy["x"])**2 + (unit["y"] - enemy["y"])**2)
-                        if distance < min_distance:
-                            min_distance = distance
-                            closest_target = enemy
-                    
-                    # Проверяем вражеские здания
-                    for building in self.enemy_buildings:
-                        distance = math.sqrt((unit["x"] - building["x"])**2 + (unit["y"] - building["y"])**2)
-                        if distance < min_distance:
-                            min_distance = distance
-                            closest_target = building
-                    
-                    if closest_target:
-                        if min_distance < 100:  # Дальность атаки
-                            if unit["attack_cooldown"] <= 0:
-                                damage = {"marine": 6, "tank": 20}[unit["type"]]
-                                closest_target["health"] -= damage
-                                unit["attack_cooldown"] = 30
-                                if closest_target["health"] <= 0:
-                                    if closest_target in self.enemy_units:
-                                        self.enemy_units.remove(closest_target)
-                                        self.score += 1
-                                    elif closest_target in self.enemy_buildings:
-                                        self.enemy_buildings.remove(closest_target)
-                                        self.score += 10  # Больше очков за здания
-                        else:
-                            # Движемся к цели
-                            dx = closest_target["x"] - unit["x"]
-                            dy = closest_target["y"] - unit["y"]
-                            distance = math.sqrt(dx*dx + dy*dy)
-                            speed = {"marine": 2, "tank": 1}[unit["type"]]
-                            unit["x"] += (dx / distance) * speed
-                            unit["y"] += (dy / distance) * speed
+        units = self.units
+        self.minerals += self.update_workers(units, self.buildings[0] if self.buildings else None)
+        
+        # Боевые юниты - сначала проверяем команды игрока
+        rows = units.rows()
+        combat = rows[~units.get_kinds(rows, "worker")]
+        cooldown = units.attack_cooldown
+        cooldown[combat[cooldown[combat] > 0]] -= 1
+        speeds = np.array([STRATEGY_UNIT_SPEEDS[name] for name in units.kind_names])
+        
+        # Если есть цель движения от игрока
+        ordered = (units.flags[combat] & ENTITY_ORDERED) != 0
+        moving = combat[ordered]
+        order_x, order_y = units.order_x[moving], units.order_y[moving]
+        arrived = np.sqrt((order_x - units.x[moving]) ** 2 + (order_y - units.y[moving]) ** 2) < 10
+        units.flags[moving[arrived]] &= ~ENTITY_ORDERED  # Достигли цели
+        moving, order_x, order_y = moving[~arrived], order_x[~arrived], order_y[~arrived]
+        units.move_toward(moving, order_x, order_y, speeds[units.kind[moving]])
+        
+        # Автоматическое поведение - ищем ближайшую цель (враги или здания)
+        auto = combat[~ordered]
+        enemy_rows, nearest, target_x, target_y, distance = self.find_unit_targets(units.x[auto], units.y[auto])
+        # Атаки идут по очереди юнитов: после убийства цели юнитов дальше по очереди
+        # пересчитываем - они выбирают из оставшихся, как при поштучном обходе
+        start = 0
+        while True:
+            ready = np.flatnonzero((nearest[start:] >= 0) & (distance[start:] < 100) &
+                                   (cooldown[auto[start:]] <= 0))  # Дальность атаки
+            if not len(ready):
+                break
+            i = start + int(ready[0])
+            start = i + 1
+            cooldown[auto[i]] = 30
+            damage = STRATEGY_UNIT_DAMAGE[units.kind_names[units.kind[auto[i]]]]
+            if nearest[i] < len(enemy_rows):
+                enemy = enemy_rows[nearest[i]]
+                self.enemy_units.health[enemy] -= damage
+                if self.enemy_units.health[enemy] > 0:
+                    continue
+                self.enemy_units.destroy(enemy)
+                self.score += 1
+            else:
+                building = self.enemy_buildings[nearest[i] - len(enemy_rows)]
+                building.health -= damage
+                if building.health > 0:
+                    continue
+                self.enemy_buildings.remove(building)
+                self.score += 10  # Больше очков за здания
+            enemy_rows, nearest[start:], target_x[start:], target_y[start:], distance[start:] = \
+                self.find_unit_targets(units.x[auto[start:]], units.y[auto[start:]])
+        
+        # Цель вне дальности атаки - движемся к ней
+        far = (nearest >= 0) & (distance >= 100)
+        units.move_toward(auto[far], target_x[far], target_y[far], speeds[units.kind[auto[far]]])
         
         # Спавн вражеских юнитов - ТОЛЬКО ЗА РЕСУРСЫ
         self.enemy_spawn_timer += 1
@@ -2734,17 +4905,9 @@ class Game:
                 if (self.enemy_minerals >= unit_costs[unit_type] and 
                     self.enemy_supply_used + supply_costs[unit_type] <= self.enemy_supply_max):
                     
-                    spawn_x = enemy_base["x"] - 40
-                    spawn_y = enemy_base["y"] + 70
-                    self.enemy_units.append({
-                        "type": unit_type,
-                        "x": spawn_x,
-                        "y": spawn_y,
-                        "health": {"worker": 40, "marine": 45}[unit_type],
-                        "attack_cooldown": 0,
-                        "target": None,
-                        "carrying": 0 if unit_type == "worker" else 0
-                    })
+                    spawn_x = enemy_base.x - 40
+                    spawn_y = enemy_base.y + 70
+                    create_strategy_unit(self.enemy_units, unit_type, spawn_x, spawn_y)
                     
                     # Тратим ресурсы врага
                     self.enemy_minerals -= unit_costs[unit_type]
@@ -2753,160 +4916,193 @@ class Game:
             self.enemy_spawn_timer = 0
         
         # Обновление вражеских юнитов
-        for enemy in self.enemy_units[:]:
-            if enemy["attack_cooldown"] > 0:
-                enemy["attack_cooldown"] -= 1
-            
-            # Вражеские рабочие добывают минералы
-            if enemy["type"] == "worker":
-                if enemy["target"] is None:
-                    # Ищем ближайший минеральный патч
-                    closest_patch = None
-                    min_distance = float('inf')
-                    for patch in self.mineral_patches:
-                        if patch["minerals"] > 0:
-                            distance = math.sqrt((enemy["x"] - patch["x"])**2 + (enemy["y"] - patch["y"])**2)
-                            if distance < min_distance:
-                                min_distance = distance
-                                closest_patch = patch
-                    enemy["target"] = closest_patch
-                
-                if enemy["target"] and enemy["carrying"] == 0:
-                    # Идем к минералам
-                    dx = enemy["target"]["x"] - enemy["x"]
-                    dy = enemy["target"]["y"] - enemy["y"]
-                    distance = math.sqrt(dx*dx + dy*dy)
-                    if distance < 20:
-                        # Собираем минералы
-                        if enemy["target"]["minerals"] > 0:
-                            enemy["carrying"] = 8
-                            enemy["target"]["minerals"] -= 8
-                    else:
-                        # Движемся к минералам
-                        enemy["x"] += (dx / distance) * 1
-                        enemy["y"] += (dy / distance) * 1
-                
-                elif enemy["carrying"] > 0:
-                    # Возвращаемся к вражескому командному центру
-                    if len(self.enemy_buildings) > 0:
-                        enemy_command_center = self.enemy_buildings[0]
-                        dx = enemy_command_center["x"] - enemy["x"]
-                        dy = enemy_command_center["y"] - enemy["y"]
-                        distance = math.sqrt(dx*dx + dy*dy)
-                        if distance < 30:
-                            # Сдаем минералы врагу
-                            self.enemy_minerals += enemy["carrying"]
-                            enemy["carrying"] = 0
-                            enemy["target"] = None
-                        else:
-                            # Движемся к базе
-                            enemy["x"] += (dx / distance) * 1
-                            enemy["y"] += (dy / distance) * 1
-            
-            else:  # Боевые юниты
-                # Атакуют ближайшую цель - ПРИОРИТЕТ ЗДАНИЯМ
-                closest_target = None
-                min_distance = float('inf')
-                
-                # СНАЧАЛА проверяем здания (высший приоритет)
-                for building in self.buildings:
-                    distance = math.sqrt((enemy["x"] - building["x"])**2 + (enemy["y"] - building["y"])**2)
-                    if distance < min_distance:
-                        min_distance = distance
-                        closest_target = building
-                
-                # Если зданий нет рядом, проверяем юниты
-                if min_distance > 200:  # Только если здания далеко
-                    for unit in self.units:
-                        distance = math.sqrt((enemy["x"] - unit["x"])**2 + (enemy["y"] - unit["y"])**2)
-                        if distance < min_distance:
-                            min_distance = distance
-                            closest_target = unit
-                
-                # Игрока атакуем только в крайнем случае
-                if min_distance > 300:  # Только если все остальное очень далеко
-                    player_distance = math.sqrt((enemy["x"] - self.player.x)**2 + (enemy["y"] - self.player.y)**2)
-                    if player_distance < min_distance:
-                        min_distance = player_distance
-                        closest_target = "player"
-                
-                if closest_target:
-                    if min_distance < 50:  # Дальность атаки
-                        if enemy["attack_cooldown"] <= 0:
-                            if closest_target == "player":
-                                self.player.health -= 6
-                                if self.player.health <= 0:
-                                    self.game_over = True
-                            elif isinstance(closest_target, dict):
-                                if "health" in closest_target:
-                                    closest_target["health"] -= 6
-                                    if closest_target["health"] <= 0:
-                                        if closest_target in self.units:
-                                            self.supply_used -= {"worker": 1, "marine": 2, "tank": 3}.get(closest_target["type"], 1)
-                                            self.units.remove(closest_target)
-                                        elif closest_target in self.buildings:
-                                            self.buildings.remove(closest_target)
-                                            if closest_target["type"] == "command_center":
-                                                self.game_over = True
-                            enemy["attack_cooldown"] = 30
-                    else:
-                        # Движемся к цели
-                        if closest_target == "player":
-                            dx = self.player.x - enemy["x"]
-                            dy = self.player.y - enemy["y"]
-                        else:
-                            dx = closest_target["x"] - enemy["x"]
-                            dy = closest_target["y"] - enemy["y"]
-                        
-                        distance = math.sqrt(dx*dx + dy*dy)
-                        enemy["x"] += (dx / distance) * 1.5
-                        enemy["y"] += (dy / distance) * 1.5
+        enemies = self.enemy_units
+        rows = enemies.rows()
+        cooldown = enemies.attack_cooldown
+        cooldown[rows[cooldown[rows] > 0]] -= 1
+        
+        # Вражеские рабочие добывают минералы
+        self.enemy_minerals += self.update_workers(enemies, self.enemy_buildings[0] if self.enemy_buildings else None)
+        
+        # Боевые юниты атакуют ближайшую цель - ПРИОРИТЕТ ЗДАНИЯМ
+        combat = rows[~enemies.get_kinds(rows, "worker")]
+        kinds, targets, target_x, target_y, distance = self.find_enemy_unit_targets(enemies.x[combat],
+                                                                                     enemies.y[combat])
+        # Атаки - по очереди, с пересчетом целей после убийства (как у своих юнитов)
+        start = 0
+        while True:
+            ready = np.flatnonzero((distance[start:] < 50) & (cooldown[combat[start:]] <= 0))  # Дальность атаки
+            if not len(ready):
+                break
+            i = start + int(ready[0])
+            start = i + 1
+            cooldown[combat[i]] = 30
+            target = int(targets[i])
+            if kinds[i] == "player":
+                self.player.health -= 6
+                if self.player.health <= 0:
+                    self.game_over = True
+                continue
+            if kinds[i] == "unit":
+                units.health[target] -= 6
+                if units.health[target] > 0:
+                    continue
+                self.supply_used -= STRATEGY_UNIT_SUPPLY[units.kind_names[units.kind[target]]]
+                units.destroy(target)
+            else:
+                building = self.buildings[target]
+                building.health -= 6
+                if building.health > 0:
+                    continue
+                self.buildings.remove(building)
+                if building.type == "command_center":
+                    self.game_over = True
+            kinds[start:], targets[start:], target_x[start:], target_y[start:], distance[start:] = \
+                self.find_enemy_unit_targets(enemies.x[combat[start:]], enemies.y[combat[start:]])
+        
+        # Цель вне дальности атаки - движемся к ней
+        far = distance >= 50
+        enemies.move_toward(combat[far], target_x[far], target_y[far], 1.5)
         
         # Проверка победы - уничтожить вражескую базу
         if len(self.enemy_buildings) == 0:
             self.level_complete = True
     
+    def update_workers(self, units, command_center):
+        # Рабочие (свои или вражеские) добывают минералы и несут их на базу
+        # command_center (None - базы нет); возвращает сданные за тик минералы
+        rows = units.rows()
+        rows = rows[units.get_kinds(rows, "worker")]
+        patches = self.mineral_patches
+        patch_x = np.array([patch.x for patch in patches], dtype=np.float64)
+        patch_y = np.array([patch.y for patch in patches], dtype=np.float64)
+        minerals = np.array([patch.minerals for patch in patches])
+        target, carrying = units.target, units.carrying
+        
+        # Свободные рабочие выбирают ближайший минеральный патч, где еще есть минералы
+        idle = rows[target[rows] < 0]
+        if len(idle) and (minerals > 0).any():
+            nearest, distance = nearest_points(units.x[idle], units.y[idle],
+                                               np.where(minerals > 0, patch_x, np.inf), patch_y)
+            target[idle] = nearest
+        
+        gathering = rows[(target[rows] >= 0) & (carrying[rows] == 0)]
+        returning = rows[carrying[rows] > 0]
+        
+        # Идем к минералам
+        index = target[gathering]
+        distance = np.sqrt((patch_x[index] - units.x[gathering]) ** 2 + (patch_y[index] - units.y[gathering]) ** 2)
+        near = distance < 20
+        units.move_toward(gathering[~near], patch_x[index[~near]], patch_y[index[~near]], 1)
+        # Собираем минералы: рабочие у патча берут по 8, пока на нем что-то есть
+        for i, patch in enumerate(patches):
+            arrived = gathering[near & (index == i)]
+            if len(arrived) and patch.minerals > 0:
+                arrived = arrived[:-(-patch.minerals // 8)]
+                carrying[arrived] = 8
+                patch.minerals -= 8 * len(arrived)
+        
+        # Возвращаемся к командному центру
+        if command_center is None or not len(returning):
+            return 0
+        distance = np.sqrt((command_center.x - units.x[returning]) ** 2 + (command_center.y - units.y[returning]) ** 2)
+        home = returning[distance < 30]
+        units.move_toward(returning[distance >= 30], command_center.x, command_center.y, 1)
+        # Сдаем минералы
+        delivered = int(carrying[home].sum())
+        carrying[home] = 0
+        target[home] = -1
+        return delivered
+    
+    def find_unit_targets(self, x, y):
+        # Ближайшие цели своих боевых юнитов в точках (x, y) - вражеские юниты, затем здания.
+        # Возвращает строки вражеских юнитов и для каждой точки номер цели (сначала по этим
+        # строкам, дальше - здания по порядку; -1 - целей нет), ее координаты и расстояние
+        enemies = self.enemy_units
+        rows = enemies.rows()
+        target_x = np.concatenate((enemies.x[rows], [building.x for building in self.enemy_buildings]))
+        target_y = np.concatenate((enemies.y[rows], [building.y for building in self.enemy_buildings]))
+        if not len(target_x):
+            return rows, np.full(len(x), -1), np.zeros(len(x)), np.zeros(len(x)), np.full(len(x), np.inf)
+        nearest, distance = nearest_points(x, y, target_x, target_y)
+        return rows, nearest, target_x[nearest], target_y[nearest], distance
+    
+    def find_enemy_unit_targets(self, x, y):
+        # Цели вражеских боевых юнитов в точках (x, y): СНАЧАЛА здания, юниты игрока - только
+        # если здания дальше 200, а сам игрок - только если все остальное дальше 300.
+        # Возвращает вид цели ("building", "unit", "player"), номер здания или строку юнита,
+        # координаты цели и расстояние до нее
+        count = len(x)
+        kinds = np.full(count, "building", dtype=object)
+        targets = np.zeros(count, dtype=np.int64)
+        target_x, target_y = np.zeros(count), np.zeros(count)
+        distance = np.full(count, np.inf)
+        if self.buildings:
+            building_x = np.array([building.x for building in self.buildings], dtype=np.float64)
+            building_y = np.array([building.y for building in self.buildings], dtype=np.float64)
+            targets, distance = nearest_points(x, y, building_x, building_y)
+            target_x, target_y = building_x[targets], building_y[targets]
+        
+        # Если зданий нет рядом, проверяем юниты
+        units = self.units
+        rows = units.rows()
+        if len(rows):
+            nearest, unit_distance = nearest_points(x, y, units.x[rows], units.y[rows])
+            closer = (distance > 200) & (unit_distance < distance)
+            kinds[closer] = "unit"
+            targets[closer] = rows[nearest[closer]]
+            target_x[closer] = units.x[targets[closer]]
+            target_y[closer] = units.y[targets[closer]]
+            distance[closer] = unit_distance[closer]
+        
+        # Игрока атакуем только в крайнем случае
+        player_distance = np.sqrt((x - self.player.x) ** 2 + (y - self.player.y) ** 2)
+        closer = (distance > 300) & (player_distance < distance)
+        kinds[closer] = "player"
+        target_x[closer] = self.player.x
+        target_y[closer] = self.player.y
+        distance[closer] = player_distance[closer]
+        return kinds, targets, target_x, target_y, distance
+    
     def update_final_mix(self):
         # Финальный уровень с боссом
-        keys = pygame.key.get_pressed()
+        keys = self.input
         
         # Стрельба игрока
         if keys[pygame.K_SPACE]:
-            bullet = self.player.shoot()
-            if bullet:
-                self.player_bullets.append(bullet)
+            self.player.shoot(self.projectiles)
         
-        # Обновление пуль игрока
-        for bullet in self.player_bullets[:]:
-            bullet.update()
-            if bullet.y < 0:
-                self.player_bullets.remove(bullet)
-                continue
-            
-            # Проверка попадания в босса
-            if hasattr(self, 'boss') and self.boss and bullet.get_rect().colliderect(self.boss.get_rect()):
+        # Пули игрока летят и проверяются по боссу до его хода
+        projectiles = self.projectiles
+        owner = projectiles.add_owner(self.player)
+        projectiles.integrate(owner)
+        projectiles.cull(owner, top=0)
+        
+        # Проверка попадания в босса
+        if hasattr(self, 'boss') and self.boss:
+            hits = projectiles.hits(self.boss.get_rect(), owner)
+            for bullet in hits:
                 if self.boss.take_damage(10):  # Босс побежден
                     self.level_complete = True
-                self.player_bullets.remove(bullet)
                 self.score += 1
+            projectiles.remove(hits)
         
-        # Обновление босса
+        # Обновление босса и его пуль
         if hasattr(self, 'boss') and self.boss:
             self.boss.update(self.player)
+            projectiles.integrate(self.boss.owner)
+            self.boss.cull_bullets()
         
         # Проверка столкновений с пулями босса
         if hasattr(self, 'boss') and self.boss:
             player_rect = self.player.get_rect()
-            for bullet_rect in self.boss.get_bullet_rects():
-                if player_rect.colliderect(bullet_rect):
-                    self.player.health -= 15
-                    if self.player.health <= 0:
-                        self.game_over = True
-                    # Удаляем пулю босса после попадания
-                    for bullet in self.boss.boss_bullets[:]:
-                        if pygame.Rect(bullet["x"] - 4, bullet["y"] - 4, 8, 8).colliderect(player_rect):
-                            self.boss.boss_bullets.remove(bullet)
-                            break
+            hits = projectiles.hits(player_rect, self.boss.owner)
+            for bullet in hits:
+                self.player.health -= 15
+                if self.player.health <= 0:
+                    self.game_over = True
+            # Удаляем пули босса после попадания
+            projectiles.remove(hits)
             
             # Проверка столкновения с самим боссом
             if player_rect.colliderect(self.boss.get_rect()):
@@ -2915,8 +5111,10 @@ class Game:
                     self.game_over = True
     
     def draw(self):
-        self.screen.fill(BLACK)
-        
+        # Фон и статичные части сцены из кэшированных слоев
+        self.compositor.render(self.screen)
+        self.viewport.camera_y = getattr(self, 'camera_y', 0)
+
         if self.level_type == "shooter":
             self.draw_shooter()
         elif self.level_type == "platformer":
@@ -2943,11 +5141,11 @@ class Game:
         # Общий UI
         self.draw_ui()
         self.draw_help()  # Добавляем помощь поверх всего
-        pygame.display.flip()
+        self.renderer.present()
     
-    def draw_shooter(self):
+    def draw_shooter_sky(self, surface):
         # КРАСИВЫЙ КОСМИЧЕСКИЙ ФОН
-        
+
         # Градиентное космическое небо
         for y in range(SCREEN_HEIGHT):
             intensity = y / SCREEN_HEIGHT
@@ -2956,11 +5154,24 @@ class Game:
             green = int(20 - (15 * intensity))
             red = int(10 - (5 * intensity))
             color = (red, green, blue)
-            pygame.draw.line(self.screen, color, (0, y), (SCREEN_WIDTH, y))
-        
+            draw.line(surface, color, (0, y), (SCREEN_WIDTH, y))
+
+    def draw_shooter_stars(self, surface):
         # ЗВЕЗДЫ РАЗНЫХ РАЗМЕРОВ И ЯРКОСТИ
-        star_data = []
-        for i in range(80):
+        twinkle_enabled = quality.get_density("star_twinkle") > 0
+        count = quality.count("stars", 80)
+        if self.particles is not None and ParticleField.can_draw(surface):
+            field = self.particles
+            # Мерцающие звезды - все сразу
+            twinkle = (pygame.time.get_ticks() // field.period[:count]) % 4 == 0
+            brightness = np.minimum(255, field.brightness[:count] + twinkle * 50)
+            radius = field.radius[:count]
+            # Крестообразные блики у ярких звезд
+            cross = (radius > 1) & (brightness > 200) & twinkle_enabled
+            field.draw(surface, field.x[:count], field.y[:count], radius, brightness, brightness, brightness, cross)
+            return
+        
+        for i in range(count):
             x = (i * 47) % SCREEN_WIDTH
             y = (i * 31) % SCREEN_HEIGHT
             size = 1 + (i % 3)
@@ -2972,35 +5183,36 @@ class Game:
                 brightness = min(255, brightness + 50)
             
             color = (brightness, brightness, brightness)
-            pygame.draw.circle(self.screen, color, (x, y), size)
-            
+            draw.circle(surface, color, (x, y), size)
+
             # Крестообразные блики у ярких звезд
-            if size > 1 and brightness > 200:
-                pygame.draw.line(self.screen, color, (x-4, y), (x+4, y), 1)
-                pygame.draw.line(self.screen, color, (x, y-4), (x, y+4), 1)
-        
+            if twinkle_enabled and size > 1 and brightness > 200:
+                draw.line(surface, color, (x-4, y), (x+4, y), 1)
+                draw.line(surface, color, (x, y-4), (x, y+4), 1)
+
+    def draw_shooter_planets(self, surface):
         # ДАЛЕКИЕ ПЛАНЕТЫ И ТУМАННОСТИ
-        
+
         # Большая планета справа
         planet_x, planet_y, planet_radius = 650, 150, 60
-        pygame.draw.circle(self.screen, (100, 80, 120), (planet_x, planet_y), planet_radius)
-        pygame.draw.circle(self.screen, (120, 100, 140), (planet_x - 15, planet_y - 15), planet_radius - 10)
+        draw.circle(surface, (100, 80, 120), (planet_x, planet_y), planet_radius)
+        draw.circle(surface, (120, 100, 140), (planet_x - 15, planet_y - 15), planet_radius - 10)
         # Кольца планеты
         for i in range(3):
             ring_radius = planet_radius + 15 + i * 8
-            pygame.draw.circle(self.screen, (80, 70, 90), (planet_x, planet_y), ring_radius, 2)
-        
+            draw.circle(surface, (80, 70, 90), (planet_x, planet_y), ring_radius, 2)
+
         # Малая планета слева
         small_planet_x, small_planet_y, small_radius = 120, 80, 25
-        pygame.draw.circle(self.screen, (80, 120, 100), (small_planet_x, small_planet_y), small_radius)
-        pygame.draw.circle(self.screen, (100, 140, 120), (small_planet_x - 8, small_planet_y - 8), small_radius - 5)
-        
+        draw.circle(surface, (80, 120, 100), (small_planet_x, small_planet_y), small_radius)
+        draw.circle(surface, (100, 140, 120), (small_planet_x - 8, small_planet_y - 8), small_radius - 5)
+
         # Туманность (цветное облако)
         nebula_points = [
             (300, 100), (400, 80), (480, 120), (450, 180), (350, 200), (280, 160)
         ]
-        pygame.draw.polygon(self.screen, (60, 20, 80), nebula_points)
-        pygame.draw.polygon(self.screen, (80, 30, 100), nebula_points, 3)
+        draw.polygon(surface, (60, 20, 80), nebula_points)
+        draw.polygon(surface, (80, 30, 100), nebula_points, 3)
         
         # АСТЕРОИДЫ
         asteroids = [
@@ -3015,57 +5227,46 @@ class Game:
             points = []
             for i in range(8):
                 angle = i * 45 * math.pi / 180
-                radius = ast_size + random.randint(-3, 3)  # Неровные края
+                radius = ast_size + self.rng.cosmetic.randint(-3, 3)  # Неровные края
                 x = ast_x + int(radius * math.cos(angle))
                 y = ast_y + int(radius * math.sin(angle))
                 points.append((x, y))
             
-            pygame.draw.polygon(self.screen, (80, 70, 60), points)
-            pygame.draw.polygon(self.screen, (100, 90, 80), points, 2)
-            
+            draw.polygon(surface, (80, 70, 60), points)
+            draw.polygon(surface, (100, 90, 80), points, 2)
+
             # Кратеры на астероидах
-            pygame.draw.circle(self.screen, (60, 50, 40), (ast_x - 3, ast_y + 2), 3)
-            pygame.draw.circle(self.screen, (60, 50, 40), (ast_x + 4, ast_y - 3), 2)
-        
+            draw.circle(surface, (60, 50, 40), (ast_x - 3, ast_y + 2), 3)
+            draw.circle(surface, (60, 50, 40), (ast_x + 4, ast_y - 3), 2)
+
+    def draw_shooter(self):
+        # Фон (небо, звезды, планеты, астероиды) рисуется слоями в draw()
+
         # ИГРОВЫЕ ОБЪЕКТЫ
         
         self.player.draw(self.screen, self.level_type)
         
-        # Ракеты с улучшенными эффектами
-        for missile in self.missiles:
-            missile.draw(self.screen)
-            
-            # Плазменный след
-            for i in range(8):
-                trail_x = missile.x - i * 2
-                trail_y = missile.y + missile.height + i
-                trail_size = max(1, 4 - i//2)
-                trail_alpha = 255 - i * 30
-                
-                if trail_alpha > 0:
-                    trail_color = (255, 100 + i*10, 50)
-                    pygame.draw.circle(self.screen, trail_color, (int(trail_x), int(trail_y)), trail_size)
-        
-        # Пули игрока с энергетическими эффектами
-        for bullet in self.player_bullets:
-            bullet.draw(self.screen)
-            
-            # Энергетическое свечение
-            glow_size = 8
-            for i in range(3):
-                glow_alpha = 100 - i * 30
-                glow_color = (0, 255 - i*50, 255)
-                glow_radius = glow_size - i * 2
-                if glow_radius > 0:
-                    pygame.draw.circle(self.screen, glow_color, (int(bullet.x + 2), int(bullet.y + 5)), glow_radius)
+        # Ракеты с плазменным следом и пули игрока со свечением - одним пакетом
+        # (ракеты появляются над экраном - их пропускаем, пока не видно)
+        missiles = self.missiles
+        rows = self.viewport.visible_rows(missiles, margin=20)
+        self.batch.add_many(get_missile_sprite(trail=True), missiles.x[rows], missiles.y[rows])
+        self.projectiles.draw(self.batch, lambda bullet_type: get_player_bullet_sprite(glow=True),
+                              self.projectiles.add_owner(self.player), self.viewport, margin=10)
+        self.batch.draw(self.screen)
     
-    def draw_platformer(self):
+    def get_platformer_height_progress(self):
         # ДИНАМИЧЕСКИЙ ФОН НА ОСНОВЕ ВЫСОТЫ ИГРОКА
         # Вычисляем прогресс подъема с учетом высокой вершины
         # Общий диапазон: от SCREEN_HEIGHT (внизу) до -350 (на вершине) = 950 пикселей
         total_height_range = SCREEN_HEIGHT + 350
-        height_progress = max(0.0, min(1.0, (SCREEN_HEIGHT - self.max_height_reached) / total_height_range))
-        
+        return max(0.0, min(1.0, (SCREEN_HEIGHT - self.max_height_reached) / total_height_range))
+
+    def get_platformer_sky_key(self):
+        # Небо и декорации перерисовываются шагами по 0.5% высоты, а не каждый кадр
+        return round(self.get_platformer_height_progress() * 200) / 200
+
+    def draw_platformer_sky(self, surface, height_progress):
         # ПЛАВНЫЕ ГРАДИЕНТНЫЕ ПЕРЕХОДЫ НЕБА С ВЫСОТОЙ
         for y in range(SCREEN_HEIGHT):
             local_intensity = y / SCREEN_HEIGHT
@@ -3113,39 +5314,87 @@ class Game:
                 red = int(80 - (30 * local_intensity) - (70 * progress_in_stage))
             
             color = (max(0, red), max(0, green), max(0, blue))
-            pygame.draw.line(self.screen, color, (0, y), (SCREEN_WIDTH, y))
+            draw.line(surface, color, (0, y), (SCREEN_WIDTH, y))
         
+    def draw_platformer_stars(self, surface):
         # ЗВЕЗДЫ ПОЯВЛЯЮТСЯ ПОСТЕПЕННО НА БОЛЬШОЙ ВЫСОТЕ
+        height_progress = self.get_platformer_height_progress()
         if height_progress > 0.5:  # Звезды начинают появляться выше
             # Плавное появление звезд от 50% до 100% высоты
             star_intensity = (height_progress - 0.5) / 0.5
             star_brightness = int(star_intensity * 255)
             
             # Количество звезд увеличивается с высотой
-            num_stars = int(50 * star_intensity)
+            num_stars = int(quality.count("stars", 50) * star_intensity)
+            twinkle_enabled = quality.get_density("star_twinkle") > 0
+            # Звезды ярче на большей высоте
+            star_alpha = int(star_brightness * (0.5 + 0.5 * star_intensity))
+            
+            if self.particles is not None and ParticleField.can_draw(surface):
+                self.draw_platformer_star_field(surface, num_stars, star_alpha, star_intensity,
+                                                height_progress, twinkle_enabled)
+                return
             
             for i in range(num_stars):
                 star_x = (i * 47 + 100) % SCREEN_WIDTH
                 star_y = (i * 31 + 50) % (SCREEN_HEIGHT // 2)
                 
-                # Звезды ярче на большей высоте
-                star_alpha = int(star_brightness * (0.5 + 0.5 * star_intensity))
                 star_color = (star_alpha, star_alpha, star_alpha)
                 
-                pygame.draw.circle(self.screen, star_color, (star_x, star_y), 1)
+                draw.circle(surface, star_color, (star_x, star_y), 1)
                 
                 # Большие мерцающие звезды на очень большой высоте
-                if height_progress > 0.7 and i % 4 == 0:
+                if twinkle_enabled and height_progress > 0.7 and i % 4 == 0:
                     twinkle = int(abs(math.sin(pygame.time.get_ticks() * 0.01 + i)) * star_intensity * 150)
                     bright_star_color = (min(255, star_alpha + twinkle), min(255, star_alpha + twinkle), min(255, star_alpha + twinkle))
-                    pygame.draw.circle(self.screen, bright_star_color, (star_x, star_y), 2)
+                    draw.circle(surface, bright_star_color, (star_x, star_y), 2)
                 
                 # СУПЕР яркие звезды в космосе (выше 90%)
-                if height_progress > 0.9 and i % 8 == 0:
+                if twinkle_enabled and height_progress > 0.9 and i % 8 == 0:
                     cosmic_twinkle = int(abs(math.sin(pygame.time.get_ticks() * 0.005 + i)) * 255)
                     cosmic_color = (cosmic_twinkle, cosmic_twinkle, min(255, cosmic_twinkle + 100))
-                    pygame.draw.circle(self.screen, cosmic_color, (star_x, star_y), 3)
-        
+                    draw.circle(surface, cosmic_color, (star_x, star_y), 3)
+        
+    def draw_platformer_star_field(self, surface, num_stars, star_alpha, star_intensity, height_progress, twinkle_enabled):
+        # Те же звезды, что и в draw_platformer_stars, но одним векторным шагом:
+        # обычные звезды, поверх - мерцающие и космические
+        field = self.particles
+        index = field.index[:num_stars]
+        ticks = pygame.time.get_ticks()
+        x = [field.x[:num_stars]]
+        y = [field.y[:num_stars]]
+        radius = [np.ones(num_stars, dtype=np.int64)]
+        red = [np.full(num_stars, star_alpha)]
+        green = [red[0]]
+        blue = [red[0]]
+        
+        if twinkle_enabled and height_progress > 0.7:
+            # Большие мерцающие звезды на очень большой высоте
+            bright = index % 4 == 0
+            twinkle = (np.abs(np.sin(ticks * 0.01 + index[bright])) * star_intensity * 150).astype(np.int64)
+            color = np.minimum(255, star_alpha + twinkle)
+            x.append(field.x[:num_stars][bright])
+            y.append(field.y[:num_stars][bright])
+            radius.append(np.full(len(color), 2))
+            red.append(color)
+            green.append(color)
+            blue.append(color)
+        
+        if twinkle_enabled and height_progress > 0.9:
+            # СУПЕР яркие звезды в космосе (выше 90%)
+            cosmic = index % 8 == 0
+            cosmic_twinkle = (np.abs(np.sin(ticks * 0.005 + index[cosmic])) * 255).astype(np.int64)
+            x.append(field.x[:num_stars][cosmic])
+            y.append(field.y[:num_stars][cosmic])
+            radius.append(np.full(len(cosmic_twinkle), 3))
+            red.append(cosmic_twinkle)
+            green.append(cosmic_twinkle)
+            blue.append(np.minimum(255, cosmic_twinkle + 100))
+        
+        field.draw(surface, np.concatenate(x), np.concatenate(y), np.concatenate(radius),
+                   np.concatenate(red), np.concatenate(green), np.concatenate(blue))
+    
+    def draw_platformer_scenery(self, surface, height_progress):
         # ЭВОЛЮЦИЯ ОБЛАКОВ НА РАЗНЫХ ВЫСОТАХ
         if height_progress < 0.8:  # Облака видны до космических высот
             # Низкие облака (0-40% высоты)
@@ -3167,7 +5416,7 @@ class Game:
                         ]):
                             intensity = cloud_color_base if i < 3 else cloud_color_base - 20
                             cloud_color = (intensity, intensity, intensity)
-                            pygame.draw.circle(self.screen, cloud_color, (x + offset_x, cloud_y_adjusted + offset_y), radius)
+                            draw.circle(surface, cloud_color, (x + offset_x, cloud_y_adjusted + offset_y), radius)
             
             # Средние облака (25-65% высоты)
             if 0.25 < height_progress < 0.65:
@@ -3187,7 +5436,7 @@ class Game:
                             (0, 0, size//2), (size//3, 0, size//3), (-size//3, 0, size//3)
                         ]):
                             cloud_color = (alpha_intensity, alpha_intensity, alpha_intensity)
-                            pygame.draw.circle(self.screen, cloud_color, (x + offset_x, cloud_y_adjusted + offset_y), radius)
+                            draw.circle(surface, cloud_color, (x + offset_x, cloud_y_adjusted + offset_y), radius)
             
             # Высокие облака (50-80% высоты) - более разреженные
             if 0.5 < height_progress < 0.8:
@@ -3204,7 +5453,7 @@ class Game:
                         (0, 0, size//2), (size//4, 0, size//3)
                     ]):
                         cloud_color = (alpha_intensity, alpha_intensity, alpha_intensity)
-                        pygame.draw.circle(self.screen, cloud_color, (x + offset_x, y + offset_y), radius)
+                        draw.circle(surface, cloud_color, (x + offset_x, y + offset_y), radius)
         
         # МНОГОСЛОЙНЫЕ ГОРЫ НА РАЗНЫХ ВЫСОТАХ
         # Дальние горы (видны с 15% высоты)
@@ -3215,7 +5464,7 @@ class Game:
                 (0, 500), (200, 400), (400, 450), (600, 380), (800, 420), (800, 600), (0, 600)
             ]
             far_color = (max(30, far_intensity), max(40, far_intensity + 10), max(60, far_intensity + 20))
-            pygame.draw.polygon(self.screen, far_color, far_mountains)
+            draw.polygon(surface, far_color, far_mountains)
         
         # Средние горы (видны с 30% высоты)
         if height_progress > 0.3:
@@ -3225,7 +5474,7 @@ class Game:
                 (0, 450), (150, 350), (300, 400), (450, 320), (600, 370), (750, 300), (800, 350), (800, 600), (0, 600)
             ]
             mid_color = (max(40, mid_intensity), max(50, mid_intensity + 15), max(70, mid_intensity + 25))
-            pygame.draw.polygon(self.screen, mid_color, mid_mountains)
+            draw.polygon(surface, mid_color, mid_mountains)
         
         # Ближние горы (видны с 45% высоты)
         if height_progress > 0.45:
@@ -3235,7 +5484,7 @@ class Game:
                 (0, 400), (100, 300), (250, 350), (400, 280), (550, 330), (700, 260), (800, 300), (800, 600), (0, 600)
             ]
             near_color = (max(50, near_intensity), max(60, near_intensity + 20), max(80, near_intensity + 40))
-            pygame.draw.polygon(self.screen, near_color, near_mountains)
+            draw.polygon(surface, near_color, near_mountains)
         
         # ДЕРЕВЬЯ ТОЛЬКО ВНИЗУ
         if height_progress < 0.5:
@@ -3247,98 +5496,98 @@ class Game:
                     tree_crown_color = (max(15, 34 - int(height_progress * 20)), max(80, 139 - int(height_progress * 59)), max(15, 34 - int(height_progress * 20)))
                     
                     # Ствол
-                    pygame.draw.rect(self.screen, tree_trunk_color, (tree_x, tree_y, 8, 40))
+                    draw.rect(surface, tree_trunk_color, (tree_x, tree_y, 8, 40))
                     # Крона
-                    pygame.draw.circle(self.screen, tree_crown_color, (tree_x + 4, tree_y - 5), 20)
-                    pygame.draw.circle(self.screen, (max(0, tree_crown_color[0] - 30), max(30, tree_crown_color[1] - 30), max(0, tree_crown_color[2] - 30)), (tree_x + 4, tree_y - 5), 15)
+                    draw.circle(surface, tree_crown_color, (tree_x + 4, tree_y - 5), 20)
+                    draw.circle(surface, (max(0, tree_crown_color[0] - 30), max(30, tree_crown_color[1] - 30), max(0, tree_crown_color[2] - 30)), (tree_x + 4, tree_y - 5), 15)
         
-        # Платформы с улучшенной графикой (С УЧЕТОМ КАМЕРЫ)
+    def draw_platformer_world(self, surface):
+        # Платформы с улучшенной графикой (в координатах мира, сдвиг камеры - при выводе слоя)
         for platform in self.platforms:
-            # Применяем смещение камеры
             platform_x = platform.x
-            platform_y = platform.y - self.camera_y
-            
-            # Рисуем только видимые платформы
-            if platform_y + platform.height >= 0 and platform_y <= SCREEN_HEIGHT:
-                if platform.is_wall:
-                    # Каменные стены с текстурой
-                    pygame.draw.rect(self.screen, (80, 80, 90), (platform_x, platform_y, platform.width, platform.height))
-                    # Каменная текстура
-                    for i in range(0, platform.height, 25):
-                        for j in range(0, platform.width, 20):
-                            stone_x = platform_x + j
-                            stone_y = platform_y + i
-                            pygame.draw.rect(self.screen, (90, 90, 100), (stone_x, stone_y, 18, 23), 1)
-                            pygame.draw.rect(self.screen, (70, 70, 80), (stone_x + 1, stone_y + 1, 16, 21), 1)
-                    pygame.draw.rect(self.screen, (60, 60, 70), (platform_x, platform_y, platform.width, platform.height), 3)
-                else:
-                    # Деревянные платформы с досками
-                    pygame.draw.rect(self.screen, (139, 69, 19), (platform_x, platform_y, platform.width, platform.height))
-                    # Доски
-                    for i in range(0, platform.width, 12):
-                        board_x = platform_x + i
-                        pygame.draw.line(self.screen, (160, 82, 45), (board_x, platform_y), (board_x, platform_y + platform.height), 2)
-                        pygame.draw.line(self.screen, (101, 67, 33), (board_x + 6, platform_y), (board_x + 6, platform_y + platform.height), 1)
-                    # Гвозди
-                    for i in range(10, platform.width, 20):
-                        pygame.draw.circle(self.screen, (80, 80, 80), (platform_x + i, platform_y + 5), 2)
-                        pygame.draw.circle(self.screen, (80, 80, 80), (platform_x + i, platform_y + platform.height - 5), 2)
-        
-        # Шипы с улучшенной графикой (С УЧЕТОМ КАМЕРЫ)
+            platform_y = platform.y - self.world_top
+
+            if platform.is_wall:
+                # Каменные стены с текстурой
+                draw.rect(surface, (80, 80, 90), (platform_x, platform_y, platform.width, platform.height))
+                # Каменная текстура
+                for i in range(0, platform.height, 25):
+                    for j in range(0, platform.width, 20):
+                        stone_x = platform_x + j
+                        stone_y = platform_y + i
+                        draw.rect(surface, (90, 90, 100), (stone_x, stone_y, 18, 23), 1)
+                        draw.rect(surface, (70, 70, 80), (stone_x + 1, stone_y + 1, 16, 21), 1)
+                draw.rect(surface, (60, 60, 70), (platform_x, platform_y, platform.width, platform.height), 3)
+            else:
+                # Деревянные платформы с досками
+                draw.rect(surface, (139, 69, 19), (platform_x, platform_y, platform.width, platform.height))
+                # Доски
+                for i in range(0, platform.width, 12):
+                    board_x = platform_x + i
+                    draw.line(surface, (160, 82, 45), (board_x, platform_y), (board_x, platform_y + platform.height), 2)
+                    draw.line(surface, (101, 67, 33), (board_x + 6, platform_y), (board_x + 6, platform_y + platform.height), 1)
+                # Гвозди
+                for i in range(10, platform.width, 20):
+                    draw.circle(surface, (80, 80, 80), (platform_x + i, platform_y + 5), 2)
+                    draw.circle(surface, (80, 80, 80), (platform_x + i, platform_y + platform.height - 5), 2)
+
+        # Шипы с улучшенной графикой
         for spike in self.spikes:
-            spike_y = spike.y - self.camera_y
-            # Рисуем только видимые шипы
-            if spike_y + spike.height >= 0 and spike_y <= SCREEN_HEIGHT:
-                # Основание шипа
-                pygame.draw.rect(self.screen, (100, 100, 100), (spike.x, spike_y + spike.height - 5, spike.width, 5))
-                # Металлический шип
-                points = [
-                    (spike.x + spike.width//2, spike_y),  # Острый верх
-                    (spike.x + 2, spike_y + spike.height - 5),  # Левый низ
-                    (spike.x + spike.width - 2, spike_y + spike.height - 5)  # Правый низ
-                ]
-                pygame.draw.polygon(self.screen, (120, 120, 120), points)
-                pygame.draw.polygon(self.screen, (80, 80, 80), points, 2)
-                # Блик на шипе
-                pygame.draw.line(self.screen, (200, 200, 200), 
-                               (spike.x + spike.width//2 - 2, spike_y + 3), 
-                               (spike.x + spike.width//2 - 1, spike_y + spike.height//2), 2)
-        
+            spike_y = spike.y - self.world_top
+            # Основание шипа
+            draw.rect(surface, (100, 100, 100), (spike.x, spike_y + spike.height - 5, spike.width, 5))
+            # Металлический шип
+            points = [
+                (spike.x + spike.width//2, spike_y),  # Острый верх
+                (spike.x + 2, spike_y + spike.height - 5),  # Левый низ
+                (spike.x + spike.width - 2, spike_y + spike.height - 5)  # Правый низ
+            ]
+            draw.polygon(surface, (120, 120, 120), points)
+            draw.polygon(surface, (80, 80, 80), points, 2)
+            # Блик на шипе
+            draw.line(surface, (200, 200, 200),
+                           (spike.x + spike.width//2 - 2, spike_y + 3),
+                           (spike.x + spike.width//2 - 1, spike_y + spike.height//2), 2)
+
+    def draw_platformer(self):
+        # Небо, звезды, облака, горы, платформы и шипы рисуются слоями в draw()
+        height_progress = self.get_platformer_height_progress()
+
         # Пилы с улучшенной графикой (С УЧЕТОМ КАМЕРЫ)
-        for saw in self.saws:
+        # Рисуем только видимые пилы (с запасом на зубцы)
+        for saw in self.viewport.query(self.saw_index, margin=8):
             saw_y = saw.y - self.camera_y
-            # Рисуем только видимые пилы
-            if saw_y + saw.height >= 0 and saw_y <= SCREEN_HEIGHT:
-                center_x = saw.x + saw.width // 2
-                center_y = saw_y + saw.height // 2
-                radius = saw.width // 2
-                
-                # Основной круг пилы с градиентом
-                pygame.draw.circle(self.screen, (150, 150, 150), (center_x, center_y), radius)
-                pygame.draw.circle(self.screen, (180, 180, 180), (center_x, center_y), radius - 3)
-                
-                # Зубцы пилы
-                for i in range(12):
-                    angle = (saw.rotation + i * 30) * math.pi / 180
-                    # Внешние зубцы
-                    outer_x = center_x + int((radius + 6) * math.cos(angle))
-                    outer_y = center_y + int((radius + 6) * math.sin(angle))
-                    inner_x = center_x + int((radius - 2) * math.cos(angle))
-                    inner_y = center_y + int((radius - 2) * math.sin(angle))
-                    
-                    pygame.draw.line(self.screen, (100, 100, 100), (inner_x, inner_y), (outer_x, outer_y), 3)
-                    pygame.draw.line(self.screen, (200, 200, 200), (inner_x, inner_y), (outer_x, outer_y), 1)
+            center_x = saw.x + saw.width // 2
+            center_y = saw_y + saw.height // 2
+            radius = saw.width // 2
+            
+            # Основной круг пилы с градиентом
+            draw.circle(self.screen, (150, 150, 150), (center_x, center_y), radius)
+            draw.circle(self.screen, (180, 180, 180), (center_x, center_y), radius - 3)
+            
+            # Зубцы пилы
+            for i in range(12):
+                angle = (saw.rotation + i * 30) * math.pi / 180
+                # Внешние зубцы
+                outer_x = center_x + int((radius + 6) * math.cos(angle))
+                outer_y = center_y + int((radius + 6) * math.sin(angle))
+                inner_x = center_x + int((radius - 2) * math.cos(angle))
+                inner_y = center_y + int((radius - 2) * math.sin(angle))
                 
-                # Центр пилы
-                pygame.draw.circle(self.screen, (80, 80, 80), (center_x, center_y), 5)
-                pygame.draw.circle(self.screen, (120, 120, 120), (center_x, center_y), 3)
+                draw.line(self.screen, (100, 100, 100), (inner_x, inner_y), (outer_x, outer_y), 3)
+                draw.line(self.screen, (200, 200, 200), (inner_x, inner_y), (outer_x, outer_y), 1)
+            
+            # Центр пилы
+            draw.circle(self.screen, (80, 80, 80), (center_x, center_y), 5)
+            draw.circle(self.screen, (120, 120, 120), (center_x, center_y), 3)
         
         # Цель с красивой анимацией (С УЧЕТОМ КАМЕРЫ)
         goal_y = self.goal.y - self.camera_y
-        if goal_y + self.goal.height >= 0 and goal_y <= SCREEN_HEIGHT:
+        # Запас - на звездочки, летающие вокруг цели
+        if self.viewport.is_visible(self.goal.x, self.goal.y, self.goal.width, self.goal.height, margin=43):
             goal_color = (0, 255, 0) if (pygame.time.get_ticks() // 300) % 2 else (0, 200, 0)
-            pygame.draw.rect(self.screen, goal_color, (self.goal.x, goal_y, self.goal.width, self.goal.height))
-            pygame.draw.rect(self.screen, (255, 255, 255), (self.goal.x + 2, goal_y + 2, self.goal.width - 4, self.goal.height - 4), 2)
+            draw.rect(self.screen, goal_color, (self.goal.x, goal_y, self.goal.width, self.goal.height))
+            draw.rect(self.screen, (255, 255, 255), (self.goal.x + 2, goal_y + 2, self.goal.width - 4, self.goal.height - 4), 2)
             
             # Звездочки вокруг цели
             star_time = pygame.time.get_ticks() // 100
@@ -3346,7 +5595,7 @@ class Game:
                 angle = (star_time + i * 45) * math.pi / 180
                 star_x = self.goal.x + self.goal.width//2 + int(40 * math.cos(angle))
                 star_y = goal_y + self.goal.height//2 + int(40 * math.sin(angle))
-                pygame.draw.circle(self.screen, (255, 255, 0), (star_x, star_y), 3)
+                draw.circle(self.screen, (255, 255, 0), (star_x, star_y), 3)
         
         # Игрок (С УЧЕТОМ КАМЕРЫ)
         player_y = self.player.y - self.camera_y
@@ -3358,115 +5607,145 @@ class Game:
         self.player.y = original_player_y
         
         # Инструкции управления на экране
-        instruction1 = self.font_small.render("A/D - движение влево/вправо", True, YELLOW)
+        instruction1 = text_cache.render(self.font_small, "A/D - движение влево/вправо", True, YELLOW)
         self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 140))
-        instruction2 = self.font_small.render("W/ПРОБЕЛ - прыжок (время нажатия = высота прыжка)", True, YELLOW)
+        instruction2 = text_cache.render(self.font_small, "W/ПРОБЕЛ - прыжок (время нажатия = высота прыжка)", True, YELLOW)
         self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 120))
-        instruction3 = self.font_small.render("Быстрый тап = низкий прыжок, долгое нажатие = высокий прыжок", True, YELLOW)
+        instruction3 = text_cache.render(self.font_small, "Быстрый тап = низкий прыжок, долгое нажатие = высокий прыжок", True, YELLOW)
         self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 100))
-        instruction4 = self.font_small.render("Достигните ВЕРШИНЫ - используйте максимальные прыжки!", True, YELLOW)
+        instruction4 = text_cache.render(self.font_small, "Достигните ВЕРШИНЫ - используйте максимальные прыжки!", True, YELLOW)
         self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 80))
         
         # Показываем прогресс высоты
         height_progress_percent = int(height_progress * 100)
-        progress_text = self.font_small.render(f"Высота: {height_progress_percent}%", True, WHITE)
+        progress_text = text_cache.render(self.font_small, f"Высота: {height_progress_percent}%", True, WHITE)
         self.screen.blit(progress_text, (10, SCREEN_HEIGHT - 60))
     
-    def draw_racing(self):
+    def draw_racing_road(self, surface):
         # Трасса с тремя полосами
-        pygame.draw.rect(self.screen, DARK_GRAY, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        draw.rect(surface, DARK_GRAY, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
         
         # Разделители полос
-        pygame.draw.line(self.screen, WHITE, (200, 0), (200, SCREEN_HEIGHT), 3)
-        pygame.draw.line(self.screen, WHITE, (400, 0), (400, SCREEN_HEIGHT), 3)
-        pygame.draw.line(self.screen, WHITE, (600, 0), (600, SCREEN_HEIGHT), 3)
+        draw.line(surface, WHITE, (200, 0), (200, SCREEN_HEIGHT), 3)
+        draw.line(surface, WHITE, (400, 0), (400, SCREEN_HEIGHT), 3)
+        draw.line(surface, WHITE, (600, 0), (600, SCREEN_HEIGHT), 3)
         
         # Разметка дороги (пунктирные линии)
         for i in range(0, SCREEN_HEIGHT, 40):
-            pygame.draw.rect(self.screen, YELLOW, (300 - 5, i, 10, 20))
-            pygame.draw.rect(self.screen, YELLOW, (500 - 5, i, 10, 20))
+            draw.rect(surface, YELLOW, (300 - 5, i, 10, 20))
+            draw.rect(surface, YELLOW, (500 - 5, i, 10, 20))
+    
+    def draw_racing(self):
+        # Трасса рисуется слоем в draw()
         
         # Препятствия на дороге
-        for obstacle in self.racing_obstacles:
-            obstacle.draw(self.screen)
+        obstacles = self.racing_obstacles
+        bounds = obstacles.get_bounds(self.viewport.visible_rows(obstacles))
+        for x, y, width, height in zip(*(column.tolist() for column in bounds)):
+            draw.rect(self.screen, GRAY, (x, y, width, height))
+            draw.rect(self.screen, WHITE, (x + 5, y + 5, width - 10, height - 10))
+        self.renderer.mark_boxes(*bounds, "obstacle")
         
         # Боты-соперники
         for i, bot in enumerate(self.bots):
             if 0 <= bot["y"] <= SCREEN_HEIGHT:  # Рисуем только видимых ботов
                 # Машина бота
-                pygame.draw.rect(self.screen, bot["color"], (bot["x"], bot["y"], 30, 20))
-                pygame.draw.rect(self.screen, BLACK, (bot["x"] + 5, bot["y"] - 5, 5, 5))  # Колесо
-                pygame.draw.rect(self.screen, BLACK, (bot["x"] + 20, bot["y"] - 5, 5, 5))  # Колесо
+                draw.rect(self.screen, bot["color"], (bot["x"], bot["y"], 30, 20))
+                draw.rect(self.screen, BLACK, (bot["x"] + 5, bot["y"] - 5, 5, 5))  # Колесо
+                draw.rect(self.screen, BLACK, (bot["x"] + 20, bot["y"] - 5, 5, 5))  # Колесо
                 
                 # Номер бота
-                bot_text = self.font_small.render(str(i+1), True, WHITE)
+                bot_text = text_cache.render(self.font_small, str(i+1), True, WHITE)
                 self.screen.blit(bot_text, (bot["x"] + 10, bot["y"] + 5))
+                self.renderer.mark((bot["x"], bot["y"] - 5, 30, 25), i)
         
         # Игрок
-        self.player.draw(self.screen, self.level_type)
+        self.renderer.mark(self.player.draw(self.screen, self.level_type), "player")
         
         # UI гонок
         # Информация о круге
-        lap_text = self.font.render(f"Круг: {self.current_lap}/{self.target_laps}", True, WHITE)
-        self.screen.blit(lap_text, (10, 10))
+        lap_text = text_cache.render(self.font, f"Круг: {self.current_lap}/{self.target_laps}", True, WHITE)
+        self.renderer.blit(self.screen, lap_text, (10, 10))
         
         # Позиция в гонке
-        position_text = self.font.render(f"Позиция: {self.player_position}/4", True, WHITE)
-        self.screen.blit(position_text, (10, 50))
+        position_text = text_cache.render(self.font, f"Позиция: {self.player_position}/4", True, WHITE)
+        self.renderer.blit(self.screen, position_text, (10, 50))
         
         # Прогресс круга
         progress_percent = int((self.lap_progress / 1000) * 100)
-        progress_text = self.font_small.render(f"Прогресс: {progress_percent}%", True, WHITE)
-        self.screen.blit(progress_text, (10, 90))
+        progress_text = text_cache.render(self.font_small, f"Прогресс: {progress_percent}%", True, WHITE)
+        self.renderer.blit(self.screen, progress_text, (10, 90))
         
         # Инструкции
-        instruction1 = self.font_small.render("A/D - поворот влево/вправо", True, YELLOW)
+        instruction1 = text_cache.render(self.font_small, "A/D - поворот влево/вправо", True, YELLOW)
         self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 100))
-        instruction2 = self.font_small.render("Финишируйте ПЕРВЫМ в 3 кругах!", True, YELLOW)
+        instruction2 = text_cache.render(self.font_small, "Финишируйте ПЕРВЫМ в 3 кругах!", True, YELLOW)
         self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 80))
-        instruction3 = self.font_small.render("Соревнуйтесь с 3 ботами!", True, YELLOW)
+        instruction3 = text_cache.render(self.font_small, "Соревнуйтесь с 3 ботами!", True, YELLOW)
         self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 60))
     
-    def draw_puzzle(self):
+    def draw_puzzle_maze(self, surface):
         # Фон
-        pygame.draw.rect(self.screen, BLACK, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        draw.rect(surface, BLACK, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
         
-        # Блоки
+        # Стены и цель не меняются за уровень
+        for block in self.puzzle_blocks:
+            if block.block_type != "key":
+                block.draw(surface)
+    
+    def draw_puzzle(self):
+        # Лабиринт рисуется слоем в draw(), здесь только ключи
         for block in self.puzzle_blocks:
-            block.draw(self.screen)
+            if block.block_type == "key":
+                block.draw(self.screen)
+                self.renderer.mark(block.get_rect(), block.collected)
         
-        self.player.draw(self.screen, self.level_type)
+        self.renderer.mark(self.player.draw(self.screen, self.level_type), "player")
         
         # Инструкции для сложного лабиринта
-        instruction1 = self.font_small.render("WASD/СТРЕЛКИ - пошаговое движение по лабиринту", True, YELLOW)
+        instruction1 = text_cache.render(self.font_small, "WASD/СТРЕЛКИ - пошаговое движение по лабиринту", True, YELLOW)
         self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 120))
-        instruction2 = self.font_small.render("СОБЕРИТЕ все 3 ЖЕЛТЫХ ключа в труднодоступных местах!", True, YELLOW)
+        instruction2 = text_cache.render(self.font_small, "СОБЕРИТЕ все 3 ЖЕЛТЫХ ключа в труднодоступных местах!", True, YELLOW)
         self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 100))
-        instruction3 = self.font_small.render("Затем доберитесь до ЗЕЛЕНОЙ цели в правом нижнем углу", True, YELLOW)
+        instruction3 = text_cache.render(self.font_small, "Затем доберитесь до ЗЕЛЕНОЙ цели в правом нижнем углу", True, YELLOW)
         self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 80))
-        instruction4 = self.font_small.render("Серые блоки - стены. Планируйте маршрут!", True, YELLOW)
+        instruction4 = text_cache.render(self.font_small, "Серые блоки - стены. Планируйте маршрут!", True, YELLOW)
         self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 60))
-        instruction4 = self.font_small.render("Серые блоки - стены. Планируйте маршрут!", True, YELLOW)
+        instruction4 = text_cache.render(self.font_small, "Серые блоки - стены. Планируйте маршрут!", True, YELLOW)
         self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 60))
     
-    def draw_rhythm(self):
+    def draw_rhythm_lanes(self, surface):
         # Фон
-        pygame.draw.rect(self.screen, BLACK, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        draw.rect(surface, BLACK, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
         
         # Дорожки для нот
         for i in range(4):
             x = 100 + i * 150
-            pygame.draw.rect(self.screen, DARK_GRAY, (x, 0, 30, SCREEN_HEIGHT))
+            draw.rect(surface, DARK_GRAY, (x, 0, 30, SCREEN_HEIGHT))
         
         # Зона попадания
-        pygame.draw.rect(self.screen, WHITE, (50, self.hit_zone_y - 30, 650, 60), 3)
+        draw.rect(surface, WHITE, (50, self.hit_zone_y - 30, 650, 60), 3)
+    
+    def get_note_sprite(self, note_type):
+        def draw_shape(surface, x, y):
+            draw.rect(surface, RHYTHM_NOTE_COLORS.get(note_type, WHITE), (x, y, 30, 20))
+            draw.rect(surface, WHITE, (x + 2, y + 2, 30 - 4, 20 - 4), 2)
+        return sprites.get(("rhythm_note", note_type), (30, 20), (0, 0), draw_shape)
+    
+    def draw_rhythm(self):
+        # Дорожки и зона попадания рисуются слоем в draw()
         
         # Ноты
-        for note in self.rhythm_notes:
-            note.draw(self.screen)
+        notes = self.rhythm_notes
+        rows = notes.rows()
+        for note_type in notes.kind_names:
+            lane = rows[notes.get_kinds(rows, note_type)]
+            self.batch.add_many(self.get_note_sprite(note_type), notes.x[lane], notes.y[lane])
+            self.renderer.mark_boxes(*notes.get_bounds(lane), note_type)
+        self.batch.draw(self.screen)
         
         # Индикаторы клавиш
-        keys = pygame.key.get_pressed()
+        keys = self.input
         indicators = [
             ("A", keys[pygame.K_LEFT] or keys[pygame.K_a]),
             ("D", keys[pygame.K_RIGHT] or keys[pygame.K_d]),
@@ -3477,29 +5756,56 @@ class Game:
         for i, (key, pressed) in enumerate(indicators):
             x = 100 + i * 150
             color = YELLOW if pressed else WHITE
-            text = self.font.render(key, True, color)
-            self.screen.blit(text, (x + 5, self.hit_zone_y - 10))
+            text = text_cache.render(self.font, key, True, color)
+            self.renderer.blit(self.screen, text, (x + 5, self.hit_zone_y - 10))
     
-    def draw_tower_defense(self):
+    def draw_tower_defense_field(self, surface):
         # Фон поля боя
-        pygame.draw.rect(self.screen, (40, 60, 40), (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))  # Темно-зеленый
+        draw.rect(surface, (40, 60, 40), (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))  # Темно-зеленый
         
         # Рисуем путь врагов
         for i in range(len(self.enemy_path) - 1):
             start = self.enemy_path[i]
             end = self.enemy_path[i + 1]
-            pygame.draw.line(self.screen, BROWN, (start["x"], start["y"]), (end["x"], end["y"]), 30)
+            draw.line(surface, BROWN, (start["x"], start["y"]), (end["x"], end["y"]), 30)
+    
+    def mark_tower(self, tower):
+        # Башня меняется при улучшении и наведении мыши (радиус), пули летают всегда
+        if tower.show_range:
+            center = (tower.x + tower.width//2, tower.y + tower.height//2)
+            area = pygame.Rect(0, 0, tower.range * 2 + 2, tower.range * 2 + 2)
+            area.center = center
+            area.union_ip(tower.get_rect())
+        else:
+            area = tower.get_rect()
+        self.renderer.mark(area, (tower.level, tower.show_range))
+        projectiles = self.projectiles
+        for bullet in projectiles.rows(tower.owner):
+            self.renderer.mark((projectiles.x[bullet] - 4, projectiles.y[bullet] - 4, 8, 8))
+    
+    def mark_tower_defense_boss(self, boss):
+        # Корпус со щитом и двигателями, полоса здоровья и пули
+        self.renderer.mark((boss.x - 16, boss.y - 16, boss.width + 32, boss.height + 16 + 25))
+        self.renderer.mark((SCREEN_WIDTH//2 - 180, 0, 360, 75))
+        projectiles = self.projectiles
+        for bullet in projectiles.rows(boss.owner):
+            self.renderer.mark((projectiles.x[bullet] - 8, projectiles.y[bullet] - 8, 16, 16))
+    
+    def draw_tower_defense(self):
+        # Поле и путь врагов рисуются слоем в draw()
         
         # Валидные места для строительства
-        mouse_x, mouse_y = pygame.mouse.get_pos()
+        mouse_x, mouse_y = self.input.mouse_pos
         for spot in self.valid_build_spots:
             if not spot["occupied"]:
                 distance = math.sqrt((mouse_x - spot["x"])**2 + (mouse_y - spot["y"])**2)
                 if distance < 50:  # Подсвечиваем близкие места
                     color = GREEN if self.money >= Tower(0, 0, self.selected_tower_type).cost else RED
-                    pygame.draw.circle(self.screen, color, (spot["x"] + 20, spot["y"] + 20), 25, 2)
+                    spot_rect = draw.circle(self.screen, color, (spot["x"] + 20, spot["y"] + 20), 25, 2)
                 else:
-                    pygame.draw.circle(self.screen, GRAY, (spot["x"] + 20, spot["y"] + 20), 20, 1)
+                    color = GRAY
+                    spot_rect = draw.circle(self.screen, GRAY, (spot["x"] + 20, spot["y"] + 20), 20, 1)
+                self.renderer.mark(spot_rect, color)
         
         # Башни и их радиусы
         for tower in self.towers:
@@ -3509,103 +5815,80 @@ class Game:
                 tower.show_range = True
             else:
                 tower.show_range = False
-            tower.draw(self.screen)
+            tower.draw(self.screen, self.batch)
+            self.mark_tower(tower)
         
         # БОСС - рисуем первым чтобы он был на заднем плане
         if self.boss_fight and hasattr(self, 'tower_defense_boss') and self.tower_defense_boss:
-            self.tower_defense_boss.draw(self.screen)
-        
-        # Враги с полосами здоровья
-        for enemy in self.enemies:
-            # Основное тело врага с улучшенной графикой
-            base_size = 15
-            if enemy["type"] == "elite":
-                base_size = 18  # Элитные враги крупнее
-            elif enemy["type"] == "tank":
-                base_size = 20  # Танки самые крупные
-            
-            pygame.draw.circle(self.screen, enemy["color"], (int(enemy["x"]), int(enemy["y"])), base_size)
-            pygame.draw.circle(self.screen, WHITE, (int(enemy["x"]), int(enemy["y"])), base_size - 3, 2)
-            
-            # Эффект заморозки
-            if enemy["frozen"] > 0:
-                pygame.draw.circle(self.screen, CYAN, (int(enemy["x"]), int(enemy["y"])), base_size + 3, 3)
-            
-            # Эффект регенерации для элитных врагов
-            if enemy.get("regenerates") and enemy["health"] < enemy["max_health"]:
-                pygame.draw.circle(self.screen, GREEN, (int(enemy["x"]), int(enemy["y"])), base_size + 1, 1)
-            
-            # Полоса здоровья над врагом
-            health_width = int((enemy["health"] / enemy["max_health"]) * 30)
-            pygame.draw.rect(self.screen, RED, (enemy["x"] - 15, enemy["y"] - 30, 30, 5))
-            pygame.draw.rect(self.screen, GREEN, (enemy["x"] - 15, enemy["y"] - 30, health_width, 5))
-            
-            # Специальные детали для разных типов врагов
-            if enemy["type"] == "tank":
-                pygame.draw.rect(self.screen, BLACK, (enemy["x"] - 4, enemy["y"] - 10, 8, 10))  # Пушка
-                pygame.draw.circle(self.screen, DARK_GRAY, (int(enemy["x"]), int(enemy["y"])), 5)  # Башня
-            elif enemy["type"] == "elite":
-                # Энергетическое поле
-                pygame.draw.circle(self.screen, (255, 0, 255, 50), (int(enemy["x"]), int(enemy["y"])), base_size + 2, 2)
-                # Корона
-                for i in range(8):
-                    angle = i * 45 * math.pi / 180
-                    crown_x = enemy["x"] + math.cos(angle) * 8
-                    crown_y = enemy["y"] + math.sin(angle) * 8
-                    pygame.draw.circle(self.screen, YELLOW, (int(crown_x), int(crown_y)), 2)
-            elif enemy["type"] == "fast":
-                # Следы движения
-                pygame.draw.circle(self.screen, (255, 255, 0, 100), (int(enemy["x"] - 5), int(enemy["y"])), 8)
-                pygame.draw.circle(self.screen, (255, 255, 0, 50), (int(enemy["x"] - 10), int(enemy["y"])), 6)
+            self.tower_defense_boss.draw(self.screen, self.batch)
+            self.mark_tower_defense_boss(self.tower_defense_boss)
+        
+        # Пули всех башен и босса - одним выводом
+        self.batch.draw(self.screen)
+        
+        # Враги с полосами здоровья: спрайт общий для врагов одного типа и состояния
+        enemies = self.enemies
+        rows = self.viewport.visible_rows(enemies, margin=30)
+        x, y = enemies.x[rows], enemies.y[rows]
+        health, max_health = enemies.health[rows], enemies.max_health[rows]
+        regenerating = enemies.get_kinds(rows, "elite") & (health < max_health)
+        self.batch.add_variants((enemies.kind[rows], enemies.frozen[rows] > 0, regenerating),
+                                lambda kind, frozen, regenerating: get_td_enemy_sprite(
+                                    enemies.kind_names[kind], frozen, regenerating),
+                                x, y)
+        self.batch.add_variants(((health / max_health * 30).astype(np.int64),), get_td_health_bar_sprite, x, y)
+        self.batch.draw(self.screen)
+        # Враг вместе с эффектами и полосой здоровья
+        self.renderer.mark_boxes(x - 25, y - 30, np.full(len(rows), 50), np.full(len(rows), 55))
         
         # UI панель
-        pygame.draw.rect(self.screen, BLACK, (10, 10, 300, 120))
-        pygame.draw.rect(self.screen, WHITE, (10, 10, 300, 120), 2)
+        draw.rect(self.screen, BLACK, (10, 10, 300, 120))
+        draw.rect(self.screen, WHITE, (10, 10, 300, 120), 2)
         
         # Ресурсы
-        money_text = self.font_small.render(f"Деньги: {self.money}", True, YELLOW)
-        self.screen.blit(money_text, (15, 15))
+        money_text = text_cache.render(self.font_small, f"Деньги: {self.money}", True, YELLOW)
+        self.renderer.blit(self.screen, money_text, (15, 15))
         
-        lives_text = self.font_small.render(f"Жизни: {self.lives}", True, RED)
-        self.screen.blit(lives_text, (15, 35))
+        lives_text = text_cache.render(self.font_small, f"Жизни: {self.lives}", True, RED)
+        self.renderer.blit(self.screen, lives_text, (15, 35))
         
-        wave_text = self.font_small.render(f"Волна: {self.wave}/{self.target_score}", True, WHITE)
-        self.screen.blit(wave_text, (15, 55))
+        wave_text = text_cache.render(self.font_small, f"Волна: {self.wave}/{self.target_score}", True, WHITE)
+        self.renderer.blit(self.screen, wave_text, (15, 55))
         
         # Выбранный тип башни
         tower_costs = {"basic": 50, "rapid": 75, "heavy": 100, "freeze": 80}
-        selected_text = self.font_small.render(f"Башня: {self.selected_tower_type.upper()} ({tower_costs[self.selected_tower_type]}$)", True, GREEN)
-        self.screen.blit(selected_text, (15, 75))
+        selected_text = text_cache.render(self.font_small, f"Башня: {self.selected_tower_type.upper()} ({tower_costs[self.selected_tower_type]}$)", True, GREEN)
+        self.renderer.blit(self.screen, selected_text, (15, 75))
         
         # Прогресс волны или статус босса
         if self.boss_fight:
-            boss_status = self.font_small.render("⚡ БИТВА С МЕГА-БОССОМ! ⚡", True, RED)
-            self.screen.blit(boss_status, (15, 95))
+            boss_status = text_cache.render(self.font_small, "⚡ БИТВА С МЕГА-БОССОМ! ⚡", True, RED)
+            self.renderer.blit(self.screen, boss_status, (15, 95))
         elif not self.wave_complete:
-            progress_text = self.font_small.render(f"Врагов: {self.enemies_spawned}/{self.enemies_in_wave}", True, WHITE)
-            self.screen.blit(progress_text, (15, 95))
+            progress_text = text_cache.render(self.font_small, f"Врагов: {self.enemies_spawned}/{self.enemies_in_wave}", True, WHITE)
+            self.renderer.blit(self.screen, progress_text, (15, 95))
         else:
-            delay_text = self.font_small.render(f"Следующая волна через: {self.wave_delay // 60 + 1}с", True, YELLOW)
-            self.screen.blit(delay_text, (15, 95))
+            delay_text = text_cache.render(self.font_small, f"Следующая волна через: {self.wave_delay // 60 + 1}с", True, YELLOW)
+            self.renderer.blit(self.screen, delay_text, (15, 95))
         
         # Инструкции
-        instruction1 = self.font_small.render("1-Базовая(50$), 2-Скорострел(75$), 3-Тяжелая(100$), 4-Заморозка(80$)", True, YELLOW)
+        instruction1 = text_cache.render(self.font_small, "1-Базовая(50$), 2-Скорострел(75$), 3-Тяжелая(100$), 4-Заморозка(80$)", True, YELLOW)
         self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 120))
-        instruction2 = self.font_small.render("ЛКМ - построить башню, ПКМ - улучшить", True, YELLOW)
+        instruction2 = text_cache.render(self.font_small, "ЛКМ - построить башню, ПКМ - улучшить", True, YELLOW)
         self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 100))
         
         if self.boss_fight:
-            instruction3 = self.font_small.render("БОСС УНИЧТОЖАЕТ БАШНИ! СТРОЙТЕ БОЛЬШЕ!", True, RED)
-            self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 80))
-            instruction4 = self.font_small.render("Побейте МЕГА-БОССА чтобы пройти уровень!", True, RED)
-            self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 60))
+            instruction3 = text_cache.render(self.font_small, "БОСС УНИЧТОЖАЕТ БАШНИ! СТРОЙТЕ БОЛЬШЕ!", True, RED)
+            self.renderer.blit(self.screen, instruction3, (10, SCREEN_HEIGHT - 80))
+            instruction4 = text_cache.render(self.font_small, "Побейте МЕГА-БОССА чтобы пройти уровень!", True, RED)
+            self.renderer.blit(self.screen, instruction4, (10, SCREEN_HEIGHT - 60))
         else:
-            instruction3 = self.font_small.render("Усиленные враги: Танки(💜), Элиты(🟣), Быстрые(🟡)", True, YELLOW)
-            self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 80))
-            instruction4 = self.font_small.render(f"ЦЕЛЬ: Выжить {self.target_score} волн усиленных врагов, затем ПОБИТЬ БОССА!", True, YELLOW)
-            self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 60))
+            instruction3 = text_cache.render(self.font_small, "Усиленные враги: Танки(💜), Элиты(🟣), Быстрые(🟡)", True, YELLOW)
+            self.renderer.blit(self.screen, instruction3, (10, SCREEN_HEIGHT - 80))
+            instruction4 = text_cache.render(self.font_small, f"ЦЕЛЬ: Выжить {self.target_score} волн усиленных врагов, затем ПОБИТЬ БОССА!", True, YELLOW)
+            self.renderer.blit(self.screen, instruction4, (10, SCREEN_HEIGHT - 60))
     
-    def draw_stealth(self):
+    def draw_stealth_building(self, surface, windows_density):
         # ДЖЕЙМС БОНД СТИЛЬ - ЭЛЕГАНТНОЕ ЗДАНИЕ КАЗИНО/КОРПОРАЦИИ
         
         # Градиентный фон ночного неба
@@ -3615,7 +5898,7 @@ class Game:
             midnight = int(20 + (30 * intensity))  # От 50 до 20
             black = int(35 + (25 * intensity))     # От 60 до 35
             color = (dark_blue, midnight, black)
-            pygame.draw.line(self.screen, color, (0, y), (SCREEN_WIDTH, y))
+            draw.line(surface, color, (0, y), (SCREEN_WIDTH, y))
         
         # Силуэты городских зданий на заднем плане
         city_buildings = [
@@ -3628,10 +5911,14 @@ class Game:
             {"x": 750, "y": 260, "width": 80, "height": 340},
         ]
         
+        lit_windows = 0
         for building in city_buildings:
-            pygame.draw.rect(self.screen, (25, 25, 40), 
+            draw.rect(surface, (25, 25, 40), 
                            (building["x"], building["y"], building["width"], building["height"]))
             
+            if windows_density <= 0:
+                continue
+            
             # Окна с редкими огнями в ночном городе
             for row in range(2, building["height"]//25):
                 for col in range(1, building["width"]//20):
@@ -3640,10 +5927,15 @@ class Game:
                     
                     # Только некоторые окна светятся
                     window_hash = (window_x + window_y * 3) % 8
+                    if window_hash > 1:
+                        continue
+                    lit_windows += 1
+                    if not quality.keep("city_windows", lit_windows):
+                        continue
                     if window_hash == 0:  # Желтый свет офиса
-                        pygame.draw.rect(self.screen, (80, 70, 30), (window_x, window_y, 12, 15))
+                        draw.rect(surface, (80, 70, 30), (window_x, window_y, 12, 15))
                     elif window_hash == 1:  # Синий свет экрана
-                        pygame.draw.rect(self.screen, (30, 50, 80), (window_x, window_y, 12, 15))
+                        draw.rect(surface, (30, 50, 80), (window_x, window_y, 12, 15))
         
         # ЧЁТКИЕ ЭТАЖИ ЗДАНИЯ С ПОДПИСЯМИ
         
@@ -3660,33 +5952,33 @@ class Game:
         for i, floor in enumerate(floor_levels):
             # Основной пол этажа
             floor_height = 25 if i == 0 else 20
-            pygame.draw.rect(self.screen, floor["color"], (0, floor["y"], SCREEN_WIDTH, floor_height))
+            draw.rect(surface, floor["color"], (0, floor["y"], SCREEN_WIDTH, floor_height))
             
             # Яркая разделительная линия между этажами
-            pygame.draw.line(self.screen, (200, 200, 200), (0, floor["y"]), (SCREEN_WIDTH, floor["y"]), 3)
+            draw.line(surface, (200, 200, 200), (0, floor["y"]), (SCREEN_WIDTH, floor["y"]), 3)
             
             # Подпись этажа
-            floor_text = self.font_small.render(floor["name"], True, (255, 255, 255))
-            self.screen.blit(floor_text, (SCREEN_WIDTH - 100, floor["y"] - 15))
+            floor_text = text_cache.render(self.font_small, floor["name"], True, (255, 255, 255))
+            surface.blit(floor_text, (SCREEN_WIDTH - 100, floor["y"] - 15))
             
             # Номер этажа слева
-            floor_num = self.font.render(str(len(floor_levels) - i), True, (255, 255, 100))
-            self.screen.blit(floor_num, (5, floor["y"] - 20))
+            floor_num = text_cache.render(self.font, str(len(floor_levels) - i), True, (255, 255, 100))
+            surface.blit(floor_num, (5, floor["y"] - 20))
             
             # Узор пола в зависимости от этажа
             if floor["name"] == "ПОДВАЛ":
                 # Бетонные плиты
                 for x in range(0, SCREEN_WIDTH, 60):
-                    pygame.draw.line(self.screen, (80, 60, 50), (x, floor["y"]), (x, floor["y"] + floor_height), 2)
+                    draw.line(surface, (80, 60, 50), (x, floor["y"]), (x, floor["y"] + floor_height), 2)
             elif floor["name"] == "ВЕСТИБЮЛЬ":
                 # Мраморные прожилки
                 for x in range(0, SCREEN_WIDTH, 40):
-                    pygame.draw.line(self.screen, (70, 80, 90), (x, floor["y"]), (x + 20, floor["y"] + floor_height), 2)
+                    draw.line(surface, (70, 80, 90), (x, floor["y"]), (x + 20, floor["y"] + floor_height), 2)
             elif floor["name"] == "VIP ЗОНА" or floor["name"] == "СЕЙФ":
                 # Роскошный паркет
                 for x in range(0, SCREEN_WIDTH, 30):
-                    pygame.draw.rect(self.screen, (100, 80, 60), (x, floor["y"], 25, floor_height))
-                    pygame.draw.rect(self.screen, (120, 100, 80), (x + 25, floor["y"], 5, floor_height))
+                    draw.rect(surface, (100, 80, 60), (x, floor["y"], 25, floor_height))
+                    draw.rect(surface, (120, 100, 80), (x + 25, floor["y"], 5, floor_height))
         
         # Роскошные препятствия для укрытия
         for obstacle in self.obstacles:
@@ -3695,37 +5987,37 @@ class Game:
             # Определяем тип препятствия по позиции
             if y > 450:  # Нижний этаж - вестибюль
                 if w > 100:  # Стойка ресепшен
-                    pygame.draw.rect(self.screen, (60, 30, 20), (x, y, w, h))  # Темное дерево
-                    pygame.draw.rect(self.screen, (80, 60, 40), (x, y, w, 10))  # Столешница
+                    draw.rect(surface, (60, 30, 20), (x, y, w, h))  # Темное дерево
+                    draw.rect(surface, (80, 60, 40), (x, y, w, 10))  # Столешница
                     # Золотая отделка
-                    pygame.draw.line(self.screen, (200, 180, 100), (x, y), (x + w, y), 3)
+                    draw.line(surface, (200, 180, 100), (x, y), (x + w, y), 3)
                 else:  # Диваны и колонны
-                    pygame.draw.rect(self.screen, (70, 20, 20), (x, y, w, h))  # Красная кожа/мрамор
-                    pygame.draw.rect(self.screen, (90, 40, 40), (x + 5, y + 5, w - 10, h - 10))
+                    draw.rect(surface, (70, 20, 20), (x, y, w, h))  # Красная кожа/мрамор
+                    draw.rect(surface, (90, 40, 40), (x + 5, y + 5, w - 10, h - 10))
                     
             elif y > 300:  # Средний этаж - офисы
                 # Офисная мебель
-                pygame.draw.rect(self.screen, (40, 40, 45), (x, y, w, h))  # Современная мебель
-                pygame.draw.rect(self.screen, (50, 50, 55), (x, y, w, 5))  # Глянцевая поверхность
+                draw.rect(surface, (40, 40, 45), (x, y, w, h))  # Современная мебель
+                draw.rect(surface, (50, 50, 55), (x, y, w, 5))  # Глянцевая поверхность
                 # Встроенные мониторы
                 if w > 100:
                     for i in range(1, w//30):
                         screen_x = x + i * 30
-                        pygame.draw.rect(self.screen, (10, 10, 15), (screen_x, y - 15, 20, 12))
-                        pygame.draw.rect(self.screen, (0, 50, 100), (screen_x + 2, y - 13, 16, 8))
+                        draw.rect(surface, (10, 10, 15), (screen_x, y - 15, 20, 12))
+                        draw.rect(surface, (0, 50, 100), (screen_x + 2, y - 13, 16, 8))
                         
             else:  # Верхний этаж - VIP зона
                 # Роскошная мебель
-                pygame.draw.rect(self.screen, (80, 50, 30), (x, y, w, h))  # Позолоченное дерево
-                pygame.draw.rect(self.screen, (120, 100, 60), (x, y, w, 8))  # Золотая отделка
+                draw.rect(surface, (80, 50, 30), (x, y, w, h))  # Позолоченное дерево
+                draw.rect(surface, (120, 100, 60), (x, y, w, 8))  # Золотая отделка
                 # Хрустальные украшения
                 if w > 120:  # Большой стол руководителя
-                    pygame.draw.circle(self.screen, (150, 200, 255), (x + w//2, y - 10), 8)
+                    draw.circle(surface, (150, 200, 255), (x + w//2, y - 10), 8)
                     for i in range(6):
                         angle = i * 60 * math.pi / 180
                         crystal_x = x + w//2 + math.cos(angle) * 12
                         crystal_y = y - 10 + math.sin(angle) * 12
-                        pygame.draw.circle(self.screen, (100, 150, 200), (int(crystal_x), int(crystal_y)), 3)
+                        draw.circle(surface, (100, 150, 200), (int(crystal_x), int(crystal_y)), 3)
         
         # Элегантное освещение
         light_sources = [
@@ -3741,68 +6033,71 @@ class Game:
             for radius in range(light["power"], 0, -20):
                 alpha = int(15 * (light["power"] - radius) / light["power"])
                 color = (80 + alpha, 80 + alpha, 100 + alpha)
-                pygame.draw.circle(self.screen, color, (light["x"], light["y"]), radius, 3)
+                draw.circle(surface, color, (light["x"], light["y"]), radius, 3)
+
+    def get_guard_sprite(self, guard_type, size, body_color, weapon_color, direction):
+        return sprites.get(("guard", guard_type, body_color, direction),
+                           (GUARD_SPRITE_RADIUS * 2, GUARD_SPRITE_RADIUS * 2),
+                           (GUARD_SPRITE_RADIUS, GUARD_SPRITE_RADIUS),
+                           lambda surface, x, y: self.draw_guard_shape(surface, x, y, guard_type, size,
+                                                                       body_color, weapon_color, direction))
+    
+    def get_alert_guard_sprite(self, guard_type, boost, direction):
+        # boost - насколько тревога осветляет форму
+        size, body_color, weapon_color = GUARD_STYLES.get(guard_type, GUARD_STYLES["sniper"])
+        body_color = tuple(min(255, c + boost) for c in body_color)
+        return self.get_guard_sprite(guard_type, size, body_color, weapon_color, direction)
+    
+    def draw_guard_shape(self, surface, x, y, guard_type, size, body_color, weapon_color, direction):
+        # Тело охранника
+        draw.circle(surface, body_color, (x, y), size)
+        draw.circle(surface, (200, 180, 160), (x, y - 5), size//3)  # Голова
+        
+        # Оружие
+        if guard_type == "sniper":
+            # Снайперская винтовка
+            rifle_end_x = x + direction * 40
+            rifle_end_y = y - 5
+            draw.line(surface, weapon_color, (x, y), (rifle_end_x, rifle_end_y), 4)
+            draw.circle(surface, weapon_color, (rifle_end_x, rifle_end_y), 6)
+        else:
+            # Обычное оружие
+            weapon_end_x = x + direction * 20
+            weapon_end_y = y
+            draw.line(surface, weapon_color, (x, y), (weapon_end_x, weapon_end_y), 3)
+    
+    def draw_stealth(self):
+        # Небо, город, этажи, мебель и освещение рисуются слоем в draw()
         
         # ПРОДВИНУТЫЕ ОХРАННИКИ
-        for guard in self.guards:
-            x, y = int(guard["x"]), int(guard["y"])
-            guard_type = guard["type"]
-            alert_level = guard["alert_level"]
-            
-            # Размер и цвет зависят от типа
-            if guard_type == "patrol":
-                size = 25
-                body_color = (100, 100, 150)  # Синяя форма
-                weapon_color = (80, 80, 80)
-            elif guard_type == "office":
-                size = 28
-                body_color = (80, 80, 120)   # Темно-синяя форма
-                weapon_color = (60, 60, 60)
-            elif guard_type == "elite":
-                size = 32
-                body_color = (120, 80, 80)   # Красная элитная форма
-                weapon_color = (40, 40, 40)
-            else:  # sniper
-                size = 30
-                body_color = (60, 60, 60)    # Черная форма снайпера
-                weapon_color = (30, 30, 30)
-            
-            # Усиление цвета при тревоге
-            if alert_level > 30:
-                body_color = tuple(min(255, c + int(alert_level * 0.5)) for c in body_color)
-            
-            # Тело охранника
-            pygame.draw.circle(self.screen, body_color, (x, y), size)
-            pygame.draw.circle(self.screen, (200, 180, 160), (x, y - 5), size//3)  # Голова
-            
-            # Оружие
-            if guard_type == "sniper":
-                # Снайперская винтовка
-                rifle_end_x = x + guard["direction"] * 40
-                rifle_end_y = y - 5
-                pygame.draw.line(self.screen, weapon_color, (x, y), (rifle_end_x, rifle_end_y), 4)
-                pygame.draw.circle(self.screen, weapon_color, (rifle_end_x, rifle_end_y), 6)
+        guards = self.guards
+        rows = guards.rows()
+        x, y = guards.x[rows].astype(np.int64), guards.y[rows].astype(np.int64)
+        alert_level = guards.alert_level[rows]
+        # Усиление цвета при тревоге
+        boost = np.where(alert_level > 30, (alert_level * 0.5).astype(np.int64), 0)
+        # Охранник запекается для каждого цвета формы и направления
+        self.batch.add_variants((guards.kind[rows], boost, guards.direction[rows]),
+                                lambda kind, boost, direction: self.get_alert_guard_sprite(
+                                    guards.kind_names[kind], boost, direction),
+                                x, y)
+        self.batch.draw(self.screen)
+        
+        # Радиус обнаружения (только если настороже)
+        watching = (alert_level > 20) | self.alarm_active
+        vision_range = guards.vision_range[rows[watching]]
+        if self.alarm_active:
+            vision_range = (vision_range * 1.5).astype(np.int64)
+        for guard_x, guard_y, radius, level in zip(x[watching].tolist(), y[watching].tolist(),
+                                                   vision_range.tolist(), alert_level[watching].tolist()):
+            # Красный конус видимости при высокой тревоге
+            if level > 50:
+                color = (255, 100, 100)
+            elif level > 20:
+                color = (255, 200, 100)
             else:
-                # Обычное оружие
-                weapon_end_x = x + guard["direction"] * 20
-                weapon_end_y = y
-                pygame.draw.line(self.screen, weapon_color, (x, y), (weapon_end_x, weapon_end_y), 3)
-            
-            # Радиус обнаружения (только если настороже)
-            if alert_level > 20 or self.alarm_active:
-                vision_range = guard["vision_range"]
-                if self.alarm_active:
-                    vision_range = int(vision_range * 1.5)
-                    
-                # Красный конус видимости при высокой тревоге
-                if alert_level > 50:
-                    color = (255, 100, 100, 30)
-                elif alert_level > 20:
-                    color = (255, 200, 100, 20)
-                else:
-                    color = (200, 200, 200, 10)
-                    
-                pygame.draw.circle(self.screen, color[:3], (x, y), vision_range, 2)
+                color = (200, 200, 200)
+            draw.circle(self.screen, color, (guard_x, guard_y), radius, 2)
         
         # ЦЕЛЬ МИССИИ - ОЧЕНЬ ЗАМЕТНЫЙ СЕЙФ
         target_x, target_y = self.target_x, self.target_y
@@ -3813,20 +6108,20 @@ class Game:
         
         # Пульсирующий фон сейфа
         pulse = abs(math.sin(time_factor)) * 20 + 10
-        pygame.draw.circle(self.screen, (255, 215, 0, int(pulse)), (target_x, target_y), seiф_size + 15)
+        draw.circle(self.screen, (255, 215, 0, int(pulse)), (target_x, target_y), seiф_size + 15)
         
         # Основной корпус сейфа - очень заметный
-        pygame.draw.rect(self.screen, (60, 60, 70), (target_x - seiф_size//2, target_y - seiф_size//2, seiф_size, seiф_size))
-        pygame.draw.rect(self.screen, (100, 100, 110), (target_x - seiф_size//2 + 5, target_y - seiф_size//2 + 5, seiф_size - 10, seiф_size - 10))
+        draw.rect(self.screen, (60, 60, 70), (target_x - seiф_size//2, target_y - seiф_size//2, seiф_size, seiф_size))
+        draw.rect(self.screen, (100, 100, 110), (target_x - seiф_size//2 + 5, target_y - seiф_size//2 + 5, seiф_size - 10, seiф_size - 10))
         
         # Золотая отделка
-        pygame.draw.rect(self.screen, (255, 215, 0), (target_x - seiф_size//2, target_y - seiф_size//2, seiф_size, seiф_size), 4)
+        draw.rect(self.screen, (255, 215, 0), (target_x - seiф_size//2, target_y - seiф_size//2, seiф_size, seiф_size), 4)
         
         # Большой круглый замок в центре
-        pygame.draw.circle(self.screen, (255, 215, 0), (target_x, target_y), 20)
-        pygame.draw.circle(self.screen, (200, 170, 0), (target_x, target_y), 15)
-        pygame.draw.circle(self.screen, (150, 120, 0), (target_x, target_y), 10)
-        pygame.draw.circle(self.screen, (100, 80, 0), (target_x, target_y), 5)
+        draw.circle(self.screen, (255, 215, 0), (target_x, target_y), 20)
+        draw.circle(self.screen, (200, 170, 0), (target_x, target_y), 15)
+        draw.circle(self.screen, (150, 120, 0), (target_x, target_y), 10)
+        draw.circle(self.screen, (100, 80, 0), (target_x, target_y), 5)
         
         # Вращающиеся цифры на замке
         for i in range(12):
@@ -3835,7 +6130,7 @@ class Game:
             digit_x = target_x + math.cos(angle_rad) * 12
             digit_y = target_y + math.sin(angle_rad) * 12
             digit = str(i % 10)
-            digit_surface = self.font_small.render(digit, True, (255, 255, 255))
+            digit_surface = text_cache.render(self.font_small, digit, True, (255, 255, 255))
             self.screen.blit(digit_surface, (digit_x - 5, digit_y - 5))
         
         # Мерцающие огни безопасности вокруг сейфа
@@ -3844,16 +6139,16 @@ class Game:
         
         # Красные лазеры
         if blink_fast:
-            pygame.draw.circle(self.screen, (255, 0, 0), (target_x + 35, target_y - 20), 5)
-            pygame.draw.circle(self.screen, (255, 0, 0), (target_x - 35, target_y + 20), 5)
+            draw.circle(self.screen, (255, 0, 0), (target_x + 35, target_y - 20), 5)
+            draw.circle(self.screen, (255, 0, 0), (target_x - 35, target_y + 20), 5)
         
         # Зелёные сенсоры
         if blink_slow:
-            pygame.draw.circle(self.screen, (0, 255, 0), (target_x - 25, target_y - 30), 4)
-            pygame.draw.circle(self.screen, (0, 255, 0), (target_x + 25, target_y + 30), 4)
+            draw.circle(self.screen, (0, 255, 0), (target_x - 25, target_y - 30), 4)
+            draw.circle(self.screen, (0, 255, 0), (target_x + 25, target_y + 30), 4)
         
         # Текст "ЦЕЛЬ" над сейфом
-        target_text = self.font.render("ЦЕЛЬ!", True, (255, 255, 0))
+        target_text = text_cache.render(self.font, "ЦЕЛЬ!", True, (255, 255, 0))
         text_rect = target_text.get_rect(center=(target_x, target_y - 50))
         
         # Мерцающий текст
@@ -3866,7 +6161,7 @@ class Game:
             (target_x - 10, target_y - 55),
             (target_x + 10, target_y - 55)
         ]
-        pygame.draw.polygon(self.screen, (255, 255, 0), arrow_points)
+        draw.polygon(self.screen, (255, 255, 0), arrow_points)
         
         # Игрок-шпион
         self.player.draw(self.screen, self.level_type)
@@ -3877,34 +6172,31 @@ class Game:
         if self.alarm_active:
             # Мигающий красный свет
             alarm_alpha = int(abs(math.sin(pygame.time.get_ticks() * 0.01)) * 100)
-            alarm_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-            alarm_surface.set_alpha(alarm_alpha)
-            alarm_surface.fill((255, 0, 0))
-            self.screen.blit(alarm_surface, (0, 0))
+            self.screen.blit(surfaces.get_overlay((255, 0, 0), alarm_alpha), (0, 0))
             
             # Текст тревоги
-            alarm_text = self.font.render("! ТРЕВОГА !", True, (255, 255, 255))
+            alarm_text = text_cache.render(self.font, "! ТРЕВОГА !", True, (255, 255, 255))
             self.screen.blit(alarm_text, (SCREEN_WIDTH//2 - 80, 50))
         
         # UI для stealth в стиле шпионских фильмов
         # Темная панель
-        pygame.draw.rect(self.screen, (0, 0, 0, 180), (5, 5, 250, 140))
-        pygame.draw.rect(self.screen, (100, 150, 200), (5, 5, 250, 140), 2)
+        self.screen.blit(surfaces.get_panel((250, 140), BLACK, 180), (5, 5))
+        draw.rect(self.screen, (100, 150, 200), (5, 5, 250, 140), 2)
         
         # Информация о миссии
         phase_names = ["ПОДВАЛ", "ВЕСТИБЮЛЬ", "ОФИСЫ", "ТЕХОТДЕЛ", "VIP ЗОНА"]
         phase_colors = [(150, 100, 50), (100, 150, 200), (150, 150, 150), (100, 200, 100), (255, 200, 100)]
-        phase_text = self.font_small.render(f"Этаж: {phase_names[self.mission_phase - 1]}", True, phase_colors[self.mission_phase - 1])
+        phase_text = text_cache.render(self.font_small, f"Этаж: {phase_names[self.mission_phase - 1]}", True, phase_colors[self.mission_phase - 1])
         self.screen.blit(phase_text, (10, 10))
         
-        detection_text = self.font_small.render(f"Обнаружение: {int(self.detection_level)}/{self.max_detection}", True, WHITE)
+        detection_text = text_cache.render(self.font_small, f"Обнаружение: {int(self.detection_level)}/{self.max_detection}", True, WHITE)
         self.screen.blit(detection_text, (10, 30))
         
         # Стильная полоса обнаружения
         bar_width = 200
         bar_height = 12
-        pygame.draw.rect(self.screen, (50, 50, 50), (10, 50, bar_width, bar_height))
-        pygame.draw.rect(self.screen, (100, 150, 200), (10, 50, bar_width, bar_height), 2)
+        draw.rect(self.screen, (50, 50, 50), (10, 50, bar_width, bar_height))
+        draw.rect(self.screen, (100, 150, 200), (10, 50, bar_width, bar_height), 2)
         
         fill_width = int((self.detection_level / self.max_detection) * bar_width)
         if fill_width > 0:
@@ -3916,28 +6208,29 @@ class Game:
                 color = (255, 200, 0)    # Средняя опасность
             else:
                 color = (0, 200, 0)      # Безопасно
-            pygame.draw.rect(self.screen, color, (10, 50, fill_width, bar_height))
+            draw.rect(self.screen, color, (10, 50, fill_width, bar_height))
         
         # Статус тревоги
         if self.alarm_active:
-            alarm_status = self.font_small.render("СТАТУС: ТРЕВОГА АКТИВНА", True, (255, 100, 100))
+            alarm_status = text_cache.render(self.font_small, "СТАТУС: ТРЕВОГА АКТИВНА", True, (255, 100, 100))
         else:
-            alarm_status = self.font_small.render("СТАТУС: СКРЫТНОСТЬ", True, (100, 255, 100))
+            alarm_status = text_cache.render(self.font_small, "СТАТУС: СКРЫТНОСТЬ", True, (100, 255, 100))
         self.screen.blit(alarm_status, (10, 70))
         
         # Инструкции в стиле шпионского брифинга
-        instruction1 = self.font_small.render("МИССИЯ: Пройти все 5 этажей и взломать ЗОЛОТОЙ СЕЙФ", True, (200, 200, 255))
+        instruction1 = text_cache.render(self.font_small, "МИССИЯ: Пройти все 5 этажей и взломать ЗОЛОТОЙ СЕЙФ", True, (200, 200, 255))
         self.screen.blit(instruction1, (10, 100))
-        instruction2 = self.font_small.render("WASD - скрытное перемещение | Используйте укрытия!", True, (150, 200, 255))
+        instruction2 = text_cache.render(self.font_small, "WASD - скрытное перемещение | Используйте укрытия!", True, (150, 200, 255))
         self.screen.blit(instruction2, (10, 120))
         
         # Прогресс миссии
-        progress_text = self.font_small.render(f"Прогресс: {self.mission_phase}/5 этажей", True, (255, 255, 100))
+        progress_text = text_cache.render(self.font_small, f"Прогресс: {self.mission_phase}/5 этажей", True, (255, 255, 100))
         self.screen.blit(progress_text, (270, 10))
         
         # Статус охранников
-        alert_guards = sum(1 for g in self.guards if g['alert_level'] > 30)
-        guard_info = self.font_small.render(f"Охранников в тревоге: {alert_guards}/{len(self.guards)}", True, 
+        guards = self.guards
+        alert_guards = int((guards.alert_level[guards.rows()] > 30).sum())
+        guard_info = text_cache.render(self.font_small, f"Охранников в тревоге: {alert_guards}/{len(self.guards)}", True, 
                                           (255, 100, 100) if alert_guards > 5 else YELLOW)
         self.screen.blit(guard_info, (270, 30))
         
@@ -3950,15 +6243,15 @@ class Game:
         ]
         
         for i, info in enumerate(type_info):
-            info_text = self.font_small.render(info, True, YELLOW)
+            info_text = text_cache.render(self.font_small, info, True, YELLOW)
             self.screen.blit(info_text, (270, 50 + i * 15))
         
         # Подсказка для новичков
         if self.mission_phase == 1:
-            tip_text = self.font_small.render("СОВЕТ: Ждите когда охранники отвернутся!", True, (100, 255, 100))
+            tip_text = text_cache.render(self.font_small, "СОВЕТ: Ждите когда охранники отвернутся!", True, (100, 255, 100))
             self.screen.blit(tip_text, (270, 110))
     
-    def draw_survival(self):
+    def draw_survival_ruins(self, surface):
         # КРАСИВАЯ АПОКАЛИПТИЧЕСКАЯ АТМОСФЕРА
         
         # Градиентное небо - от темно-красного вверху до темно-серого внизу
@@ -3968,7 +6261,7 @@ class Game:
             green = int(20 + (30 * intensity))      # От 20 до 50
             blue = int(20 + (30 * intensity))       # От 20 до 50
             color = (red, green, blue)
-            pygame.draw.line(self.screen, color, (0, y), (SCREEN_WIDTH, y))
+            draw.line(surface, color, (0, y), (SCREEN_WIDTH, y))
         
         # СТАТИЧНЫЕ ДЕКОРАЦИИ ГОРОДА
         
@@ -3982,10 +6275,14 @@ class Game:
             {"x": 650, "y": 90, "width": 75, "height": 260, "broken": False},
         ]
         
+        # Мерцающие окна и огонь в машинах анимируются отдельным слоем
+        self.survival_flicker_windows = []
+        self.survival_car_fires = []
+        
         for building in buildings:
             # Основное здание
             color = (40, 35, 30) if building["broken"] else (50, 45, 40)
-            pygame.draw.rect(self.screen, color, (building["x"], building["y"], building["width"], building["height"]))
+            draw.rect(surface, color, (building["x"], building["y"], building["width"], building["height"]))
             
             # Окна в зданиях
             for row in range(3, building["height"]//20):
@@ -3996,29 +6293,25 @@ class Game:
                     # Случайные разбитые/целые окна
                     window_hash = (window_x + window_y * 7) % 5
                     if window_hash == 0:  # Разбитое окно
-                        pygame.draw.rect(self.screen, (20, 20, 20), (window_x, window_y, 8, 12))
+                        draw.rect(surface, (20, 20, 20), (window_x, window_y, 8, 12))
                         # Трещины
-                        pygame.draw.line(self.screen, (60, 60, 60), (window_x, window_y), (window_x + 8, window_y + 12), 1)
-                        pygame.draw.line(self.screen, (60, 60, 60), (window_x + 8, window_y), (window_x, window_y + 12), 1)
+                        draw.line(surface, (60, 60, 60), (window_x, window_y), (window_x + 8, window_y + 12), 1)
+                        draw.line(surface, (60, 60, 60), (window_x + 8, window_y), (window_x, window_y + 12), 1)
                     elif window_hash == 1:  # Горит огонь
-                        pygame.draw.rect(self.screen, (100, 40, 0), (window_x, window_y, 8, 12))
-                        pygame.draw.rect(self.screen, (150, 80, 0), (window_x + 1, window_y + 1, 6, 10))
-                        pygame.draw.rect(self.screen, (200, 120, 20), (window_x + 2, window_y + 2, 4, 8))
+                        draw.rect(surface, (100, 40, 0), (window_x, window_y, 8, 12))
+                        draw.rect(surface, (150, 80, 0), (window_x + 1, window_y + 1, 6, 10))
+                        draw.rect(surface, (200, 120, 20), (window_x + 2, window_y + 2, 4, 8))
                     elif window_hash == 2:  # Темное окно
-                        pygame.draw.rect(self.screen, (15, 15, 25), (window_x, window_y, 8, 12))
+                        draw.rect(surface, (15, 15, 25), (window_x, window_y, 8, 12))
                     elif window_hash == 3:  # Мерцающий свет
-                        flicker = (pygame.time.get_ticks() // 100) % 3
-                        if flicker == 0:
-                            pygame.draw.rect(self.screen, (80, 80, 60), (window_x, window_y, 8, 12))
-                        else:
-                            pygame.draw.rect(self.screen, (40, 40, 30), (window_x, window_y, 8, 12))
+                        self.survival_flicker_windows.append((window_x, window_y))
             
             # Повреждения на разрушенных зданиях
             if building["broken"]:
                 # Большая дыра сверху
                 hole_width = building["width"] // 3
                 hole_height = building["height"] // 4
-                pygame.draw.rect(self.screen, (30, 25, 20), 
+                draw.rect(surface, (30, 25, 20), 
                                (building["x"] + hole_width, building["y"], hole_width, hole_height))
                 
                 # Трещины на стенах
@@ -4035,7 +6328,7 @@ class Game:
                         points.append((crack_x + x_offset, y_pos))
                     
                     if len(points) > 2:
-                        pygame.draw.lines(self.screen, (20, 20, 20), False, points, 2)
+                        draw.lines(surface, (20, 20, 20), False, points, 2)
         
         # ОБЛОМКИ И МУСОР НА ЗЕМЛЕ
         debris_positions = [
@@ -4051,9 +6344,9 @@ class Game:
         
         for debris in debris_positions:
             x, y, w, h, color = debris
-            pygame.draw.ellipse(self.screen, color, (x, y, w, h))
+            draw.ellipse(surface, color, (x, y, w, h))
             # Добавляем тени
-            pygame.draw.ellipse(self.screen, (color[0]-10, color[1]-10, color[2]-10), (x+2, y+2, w, h))
+            draw.ellipse(surface, (color[0]-10, color[1]-10, color[2]-10), (x+2, y+2, w, h))
         
         # ЗАБРОШЕННЫЕ АВТОМОБИЛИ
         cars = [
@@ -4064,48 +6357,46 @@ class Game:
         
         for car in cars:
             # Основа машины
-            pygame.draw.rect(self.screen, car["color"], (car["x"], car["y"], 50, 25))
+            draw.rect(surface, car["color"], (car["x"], car["y"], 50, 25))
             
             # Колеса
             wheel_color = (20, 20, 20) if not car["burned"] else (10, 10, 10)
-            pygame.draw.circle(self.screen, wheel_color, (car["x"] + 10, car["y"] + 25), 6)
-            pygame.draw.circle(self.screen, wheel_color, (car["x"] + 40, car["y"] + 25), 6)
+            draw.circle(surface, wheel_color, (car["x"] + 10, car["y"] + 25), 6)
+            draw.circle(surface, wheel_color, (car["x"] + 40, car["y"] + 25), 6)
             
             # Окна
             if car["burned"]:
                 # Разбитые окна с огнем
-                pygame.draw.rect(self.screen, (20, 20, 20), (car["x"] + 5, car["y"] + 5, 40, 10))
+                draw.rect(surface, (20, 20, 20), (car["x"] + 5, car["y"] + 5, 40, 10))
                 # Огонь внутри
-                flame_color = [(120, 60, 20), (150, 80, 30), (100, 50, 10)]
-                flame_idx = (pygame.time.get_ticks() // 150) % len(flame_color)
-                pygame.draw.rect(self.screen, flame_color[flame_idx], (car["x"] + 10, car["y"] + 6, 30, 8))
+                self.survival_car_fires.append((car["x"] + 10, car["y"] + 6))
             else:
                 # Целые, но темные окна
-                pygame.draw.rect(self.screen, (30, 30, 40), (car["x"] + 5, car["y"] + 5, 40, 10))
+                draw.rect(surface, (30, 30, 40), (car["x"] + 5, car["y"] + 5, 40, 10))
         
         # УЛУЧШЕННЫЕ БАРРИКАДЫ С ДЕТАЛЯМИ
         for barricade in self.barricades:
             # Основная баррикада
-            pygame.draw.rect(self.screen, BROWN, (barricade.x, barricade.y, barricade.width, barricade.height))
-            pygame.draw.rect(self.screen, (100, 70, 50), (barricade.x + 2, barricade.y + 2, barricade.width - 4, barricade.height - 4), 2)
+            draw.rect(surface, BROWN, (barricade.x, barricade.y, barricade.width, barricade.height))
+            draw.rect(surface, (100, 70, 50), (barricade.x + 2, barricade.y + 2, barricade.width - 4, barricade.height - 4), 2)
             
             # Доски и гвозди
             for i in range(3):
                 board_y = barricade.y + i * (barricade.height // 3)
-                pygame.draw.line(self.screen, (120, 90, 70), 
+                draw.line(surface, (120, 90, 70), 
                                (barricade.x, board_y + 5), (barricade.x + barricade.width, board_y + 5), 3)
                 
                 # Гвозди
                 for j in range(0, barricade.width, 15):
                     nail_x = barricade.x + j + 5
-                    pygame.draw.circle(self.screen, (80, 80, 80), (nail_x, board_y + 5), 2)
+                    draw.circle(surface, (80, 80, 80), (nail_x, board_y + 5), 2)
             
             # Колючая проволока сверху
             wire_y = barricade.y - 3
             for x in range(barricade.x, barricade.x + barricade.width, 5):
-                pygame.draw.circle(self.screen, (120, 120, 120), (x, wire_y), 1)
+                draw.circle(surface, (120, 120, 120), (x, wire_y), 1)
                 if x % 10 == 0:  # Колючки
-                    pygame.draw.line(self.screen, (100, 100, 100), (x, wire_y - 3), (x, wire_y + 3), 1)
+                    draw.line(surface, (100, 100, 100), (x, wire_y - 3), (x, wire_y + 3), 1)
         
         # АТМОСФЕРНЫЕ ЭФФЕКТЫ
         
@@ -4123,12 +6414,39 @@ class Game:
             for i in range(4):
                 smoke_size = size + i * 8
                 gray_value = 100 - i * 15
-                pygame.draw.circle(self.screen, (gray_value, gray_value, gray_value), (x + i*3, y - i*5), smoke_size)
+                draw.circle(surface, (gray_value, gray_value, gray_value), (x + i*3, y - i*5), smoke_size)
+
+    def draw_survival_fires(self, surface):
+        if quality.get_density("flicker") <= 0:
+            return
         
+        # Мерцающий свет в окнах
+        flicker = (pygame.time.get_ticks() // 100) % 3
+        window_color = (80, 80, 60) if flicker == 0 else (40, 40, 30)
+        for window_x, window_y in self.survival_flicker_windows:
+            draw.rect(surface, window_color, (window_x, window_y, 8, 12))
+        
+        # Огонь в сгоревших машинах
+        flame_color = [(120, 60, 20), (150, 80, 30), (100, 50, 10)]
+        flame_idx = (pygame.time.get_ticks() // 150) % len(flame_color)
+        for fire_x, fire_y in self.survival_car_fires:
+            draw.rect(surface, flame_color[flame_idx], (fire_x, fire_y, 30, 8))
+
+    def draw_survival_ash(self, surface):
         # Летающая пыль и пепел
-        dust_particles = []
         current_time = pygame.time.get_ticks()
-        for i in range(30):
+        count = quality.count("ash", 30)
+        if self.particles is not None and ParticleField.can_draw(surface):
+            # Все частицы пепла сдвигаются и падают одним векторным шагом
+            field = self.particles
+            x = (field.x[:count] + current_time // 50) % SCREEN_WIDTH
+            y = (field.y[:count] + current_time // 80) % SCREEN_HEIGHT
+            final_y = ((y + (current_time * field.speed[:count]) // 100) % SCREEN_HEIGHT).astype(np.int64)
+            gray = field.brightness[:count]
+            field.draw(surface, x, final_y, field.radius[:count], gray, gray, gray)
+            return
+        
+        for i in range(count):
             # Создаем "псевдослучайные" позиции на основе времени
             x = (i * 47 + current_time // 50) % SCREEN_WIDTH
             y = (i * 31 + current_time // 80) % SCREEN_HEIGHT
@@ -4139,241 +6457,288 @@ class Game:
             final_y = (y + (current_time * fall_speed // 100)) % SCREEN_HEIGHT
             
             gray = 120 + (i % 40)
-            pygame.draw.circle(self.screen, (gray, gray, gray), (int(x), int(final_y)), size)
+            draw.circle(surface, (gray, gray, gray), (int(x), int(final_y)), size)
+
+    def draw_survival(self):
+        # Руины, огонь и пепел рисуются слоями в draw()
         
         # ИГРОВЫЕ ОБЪЕКТЫ
         
         # Игрок (выживший) - теперь правильно как survival
         self.player.draw(self.screen, "survival")
         
-        # Зомби с улучшенными эффектами
-        for zombie in self.zombies:
-            zombie.draw(self.screen)
-            
-            # Кровавые следы позади зомби
-            for i in range(3):
-                trail_x = zombie.x - (i + 1) * 8
-                trail_y = zombie.y + 10 + i * 2
-                trail_size = 3 - i
-                if trail_size > 0:
-                    pygame.draw.circle(self.screen, (60, 10, 10), (int(trail_x), int(trail_y)), trail_size)
+        # Зомби с улучшенными эффектами (появляются за краями экрана)
+        zombies = self.zombies
+        rows = self.viewport.visible_rows(zombies, margin=30)
+        # Ширина полосы здоровья; у целых зомби полосы нет (-1)
+        health_width = np.where(zombies.health[rows] < zombies.max_health[rows],
+                                (zombies.health[rows] / zombies.max_health[rows] * ZOMBIE_SIZE).astype(np.int64), -1)
+        # Спрайт общий для зомби одного типа с одной шириной полосы
+        self.batch.add_variants((zombies.kind[rows], health_width),
+                                lambda kind, width: get_zombie_sprite(zombies.kind_names[kind],
+                                                                      width if width >= 0 else None),
+                                zombies.x[rows], zombies.y[rows])
+        # Кровавые следы позади зомби
+        self.batch.add_many(get_zombie_trail_sprite(), zombies.x[rows], zombies.y[rows])
+        self.batch.draw(self.screen)
         
         # Пули игрока с трассерами
-        for bullet in self.player_bullets:
-            bullet.draw(self.screen)
+        projectiles = self.projectiles
+        for bullet in projectiles.rows(projectiles.add_owner(self.player), self.viewport, margin=40):
+            x, y = float(projectiles.x[bullet]), float(projectiles.y[bullet])
+            dx, dy = float(projectiles.dx[bullet]), float(projectiles.dy[bullet])
+            sprites.blit(self.screen, get_player_bullet_sprite(), int(x), int(y))
             
             # Трассирующий след
             trail_length = 15
             for i in range(trail_length):
                 trail_alpha = 255 - (i * 255 // trail_length)
-                trail_x = bullet.x - bullet.dx * i * 0.3
-                trail_y = bullet.y - bullet.dy * i * 0.3
+                trail_x = x - dx * i * 0.3
+                trail_y = y - dy * i * 0.3
                 
                 if 0 <= trail_x <= SCREEN_WIDTH and 0 <= trail_y <= SCREEN_HEIGHT:
                     trail_color = (255, 255 - i*10, 100)
-                    pygame.draw.circle(self.screen, trail_color, (int(trail_x), int(trail_y)), max(1, 3 - i//5))
+                    draw.circle(self.screen, trail_color, (int(trail_x), int(trail_y)), max(1, 3 - i//5))
         
         # UI выживания
         # Панель статуса
-        pygame.draw.rect(self.screen, BLACK, (10, 10, 350, 100))
-        pygame.draw.rect(self.screen, WHITE, (10, 10, 350, 100), 2)
+        draw.rect(self.screen, BLACK, (10, 10, 350, 100))
+        draw.rect(self.screen, WHITE, (10, 10, 350, 100), 2)
         
         # Здоровье игрока
         health_width = int((self.player.health / self.player.max_health) * 150)
-        pygame.draw.rect(self.screen, RED, (15, 15, 150, 15))
-        pygame.draw.rect(self.screen, GREEN, (15, 15, health_width, 15))
-        pygame.draw.rect(self.screen, WHITE, (15, 15, 150, 15), 2)
-        health_text = self.font_small.render(f"HP: {self.player.health}/100", True, WHITE)
+        draw.rect(self.screen, RED, (15, 15, 150, 15))
+        draw.rect(self.screen, GREEN, (15, 15, health_width, 15))
+        draw.rect(self.screen, WHITE, (15, 15, 150, 15), 2)
+        health_text = text_cache.render(self.font_small, f"HP: {self.player.health}/100", True, WHITE)
         self.screen.blit(health_text, (170, 15))
         
         # Патроны
         ammo_width = int((self.ammo / self.max_ammo) * 150)
-        pygame.draw.rect(self.screen, DARK_GRAY, (15, 35, 150, 15))
-        pygame.draw.rect(self.screen, YELLOW, (15, 35, ammo_width, 15))
-        pygame.draw.rect(self.screen, WHITE, (15, 35, 150, 15), 2)
-        ammo_text = self.font_small.render(f"Патроны: {self.ammo}/{self.max_ammo}", True, WHITE)
+        draw.rect(self.screen, DARK_GRAY, (15, 35, 150, 15))
+        draw.rect(self.screen, YELLOW, (15, 35, ammo_width, 15))
+        draw.rect(self.screen, WHITE, (15, 35, 150, 15), 2)
+        ammo_text = text_cache.render(self.font_small, f"Патроны: {self.ammo}/{self.max_ammo}", True, WHITE)
         self.screen.blit(ammo_text, (170, 35))
         
         # Волна и счет
-        wave_text = self.font_small.render(f"Волна: {self.wave}/{self.target_score}", True, WHITE)
+        wave_text = text_cache.render(self.font_small, f"Волна: {self.wave}/{self.target_score}", True, WHITE)
         self.screen.blit(wave_text, (15, 55))
         
         zombies_left = len(self.zombies) + (self.zombies_to_spawn - self.zombies_spawned)
-        zombies_text = self.font_small.render(f"Зомби: {zombies_left}", True, WHITE)
+        zombies_text = text_cache.render(self.font_small, f"Зомби: {zombies_left}", True, WHITE)
         self.screen.blit(zombies_text, (15, 75))
         
-        score_text = self.font_small.render(f"Счет: {self.score}", True, WHITE)
+        score_text = text_cache.render(self.font_small, f"Счет: {self.score}", True, WHITE)
         self.screen.blit(score_text, (170, 75))
         
         # Статус перезарядки
         if self.reload_timer > 0:
-            reload_text = self.font_small.render("ПЕРЕЗАРЯДКА...", True, RED)
+            reload_text = text_cache.render(self.font_small, "ПЕРЕЗАРЯДКА...", True, RED)
             self.screen.blit(reload_text, (SCREEN_WIDTH//2 - 50, SCREEN_HEIGHT//2))
         
         # Инструкции
-        instruction1 = self.font_small.render("WASD - движение, МЫШЬ - прицеливание, ПРОБЕЛ - стрельба, R - перезарядка", True, YELLOW)
+        instruction1 = text_cache.render(self.font_small, "WASD - движение, МЫШЬ - прицеливание, ПРОБЕЛ - стрельба, R - перезарядка", True, YELLOW)
         self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 120))
-        instruction2 = self.font_small.render("Красные - базовые зомби, Желтые - быстрые, Фиолетовые - танки", True, YELLOW)
+        instruction2 = text_cache.render(self.font_small, "Красные - базовые зомби, Желтые - быстрые, Фиолетовые - танки", True, YELLOW)
         self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 100))
-        instruction3 = self.font_small.render("Зеленые - бегуны. Используйте баррикады для укрытия!", True, YELLOW)
+        instruction3 = text_cache.render(self.font_small, "Зеленые - бегуны. Используйте баррикады для укрытия!", True, YELLOW)
         self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 80))
-        instruction4 = self.font_small.render(f"ЦЕЛЬ: Выжить {self.target_score} волн зомби-апокалипсиса!", True, YELLOW)
+        instruction4 = text_cache.render(self.font_small, f"ЦЕЛЬ: Выжить {self.target_score} волн зомби-апокалипсиса!", True, YELLOW)
         self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 60))
     
-    def draw_strategy(self):
+    def draw_strategy_battlefield(self, surface):
         # Мрачное поле боя
         # Темное небо
-        pygame.draw.rect(self.screen, (40, 40, 50), (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT//2))  # Темно-серое небо
+        draw.rect(surface, (40, 40, 50), (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT//2))  # Темно-серое небо
         # Темная земля
-        pygame.draw.rect(self.screen, (60, 50, 40), (0, SCREEN_HEIGHT//2, SCREEN_WIDTH, SCREEN_HEIGHT//2))  # Коричневая земля
+        draw.rect(surface, (60, 50, 40), (0, SCREEN_HEIGHT//2, SCREEN_WIDTH, SCREEN_HEIGHT//2))  # Коричневая земля
         
         # Линия фронта - более заметная
-        pygame.draw.line(self.screen, RED, (SCREEN_WIDTH//2, 0), (SCREEN_WIDTH//2, SCREEN_HEIGHT), 4)
+        draw.line(surface, RED, (SCREEN_WIDTH//2, 0), (SCREEN_WIDTH//2, SCREEN_HEIGHT), 4)
         
         # Добавляем мрачную текстуру земли
         for i in range(0, SCREEN_WIDTH, 40):
             for j in range(SCREEN_HEIGHT//2, SCREEN_HEIGHT, 30):
-                pygame.draw.circle(self.screen, (40, 30, 20), (i, j), 2)  # Темно-коричневые точки
+                draw.circle(surface, (40, 30, 20), (i, j), 2)  # Темно-коричневые точки
         
         # Темные облака на небе
-        pygame.draw.circle(self.screen, (80, 80, 90), (100, 80), 20)
-        pygame.draw.circle(self.screen, (70, 70, 80), (120, 75), 25)
-        pygame.draw.circle(self.screen, (80, 80, 90), (140, 80), 20)
+        draw.circle(surface, (80, 80, 90), (100, 80), 20)
+        draw.circle(surface, (70, 70, 80), (120, 75), 25)
+        draw.circle(surface, (80, 80, 90), (140, 80), 20)
         
-        pygame.draw.circle(self.screen, (80, 80, 90), (600, 60), 15)
-        pygame.draw.circle(self.screen, (70, 70, 80), (615, 55), 20)
-        pygame.draw.circle(self.screen, (80, 80, 90), (630, 60), 15)
+        draw.circle(surface, (80, 80, 90), (600, 60), 15)
+        draw.circle(surface, (70, 70, 80), (615, 55), 20)
+        draw.circle(surface, (80, 80, 90), (630, 60), 15)
+
+    def get_unit_sprite(self, unit_type, carrying):
+        return sprites.get(("unit", unit_type, carrying),
+                           (UNIT_SPRITE_RADIUS * 2, UNIT_SPRITE_RADIUS * 2),
+                           (UNIT_SPRITE_RADIUS, UNIT_SPRITE_RADIUS),
+                           lambda surface, x, y: self.draw_unit_shape(surface, x, y, unit_type, carrying))
+    
+    def draw_unit_shape(self, surface, x, y, unit_type, carrying):
+        if unit_type == "worker":
+            color = YELLOW if carrying else BLUE
+            draw.circle(surface, color, (x, y), 8)
+            draw.circle(surface, WHITE, (x, y), 6, 2)
+        elif unit_type == "marine":
+            draw.rect(surface, GREEN, (x, y, 15, 12))
+            draw.rect(surface, DARK_GRAY, (x + 3, y - 3, 9, 3))  # Винтовка
+        elif unit_type == "tank":
+            draw.rect(surface, DARK_GRAY, (x, y, 20, 15))
+            draw.rect(surface, BLACK, (x + 5, y - 5, 15, 5))  # Пушка
+            draw.circle(surface, GREEN, (x + 10, y + 7), 3)  # Центр
+        elif unit_type == "enemy_marine":
+            draw.rect(surface, RED, (x, y, 15, 12))
+            draw.rect(surface, DARK_GRAY, (x + 3, y - 3, 9, 3))  # Винтовка
+    
+    def draw_strategy(self):
+        # Небо, земля, линия фронта и облака рисуются слоем в draw()
         
         # Минеральные патчи
         for patch in self.mineral_patches:
-            if patch["minerals"] > 0:
-                pygame.draw.circle(self.screen, CYAN, (patch["x"], patch["y"]), 15)
-                pygame.draw.circle(self.screen, BLUE, (patch["x"], patch["y"]), 10)
+            if patch.minerals > 0:
+                draw.circle(self.screen, CYAN, (patch.x, patch.y), 15)
+                draw.circle(self.screen, BLUE, (patch.x, patch.y), 10)
+                self.renderer.mark((patch.x - 15, patch.y - 15, 30, 30), "patch")
                 # Показываем количество минералов
-                minerals_text = self.font_small.render(str(patch["minerals"]), True, WHITE)
-                self.screen.blit(minerals_text, (patch["x"] - 10, patch["y"] - 25))
+                minerals_text = text_cache.render(self.font_small, str(patch.minerals), True, WHITE)
+                self.renderer.blit(self.screen, minerals_text, (patch.x - 10, patch.y - 25))
         
         # Здания
         for building in self.buildings:
-            if building["type"] == "command_center":
-                pygame.draw.rect(self.screen, GREEN, (building["x"], building["y"], 80, 60))
-                pygame.draw.rect(self.screen, DARK_GRAY, (building["x"] + 5, building["y"] + 5, 70, 50), 2)
+            if building.type == "command_center":
+                draw.rect(self.screen, GREEN, (building.x, building.y, 80, 60))
+                draw.rect(self.screen, DARK_GRAY, (building.x + 5, building.y + 5, 70, 50), 2)
                 # Полоса здоровья здания
-                health_width = int((building["health"] / building["max_health"]) * 70)
-                pygame.draw.rect(self.screen, RED, (building["x"] + 5, building["y"] - 10, 70, 5))
-                pygame.draw.rect(self.screen, GREEN, (building["x"] + 5, building["y"] - 10, health_width, 5))
+                health_width = int((building.health / building.max_health) * 70)
+                draw.rect(self.screen, RED, (building.x + 5, building.y - 10, 70, 5))
+                draw.rect(self.screen, GREEN, (building.x + 5, building.y - 10, health_width, 5))
+                self.renderer.mark((building.x, building.y - 10, 80, 70), health_width)
         
         # Вражеские здания
         for building in self.enemy_buildings:
-            if building["type"] == "command_center":
-                pygame.draw.rect(self.screen, RED, (building["x"], building["y"], 80, 60))
-                pygame.draw.rect(self.screen, DARK_GRAY, (building["x"] + 5, building["y"] + 5, 70, 50), 2)
+            if building.type == "command_center":
+                draw.rect(self.screen, RED, (building.x, building.y, 80, 60))
+                draw.rect(self.screen, DARK_GRAY, (building.x + 5, building.y + 5, 70, 50), 2)
                 # Полоса здоровья здания
-                health_width = int((building["health"] / building["max_health"]) * 70)
-                pygame.draw.rect(self.screen, RED, (building["x"] + 5, building["y"] - 10, 70, 5))
-                pygame.draw.rect(self.screen, GREEN, (building["x"] + 5, building["y"] - 10, health_width, 5))
+                health_width = int((building.health / building.max_health) * 70)
+                draw.rect(self.screen, RED, (building.x + 5, building.y - 10, 70, 5))
+                draw.rect(self.screen, GREEN, (building.x + 5, building.y - 10, health_width, 5))
+                self.renderer.mark((building.x, building.y - 10, 80, 70), health_width)
         
         # Игрок (командир)
-        self.player.draw(self.screen, self.level_type)
+        self.renderer.mark(self.player.draw(self.screen, self.level_type), "player")
         
         # Союзные юниты
-        for unit in self.units:
-            if unit["type"] == "worker":
-                color = YELLOW if unit["carrying"] > 0 else BLUE
-                pygame.draw.circle(self.screen, color, (unit["x"], unit["y"]), 8)
-                pygame.draw.circle(self.screen, WHITE, (unit["x"], unit["y"]), 6, 2)
-            elif unit["type"] == "marine":
-                pygame.draw.rect(self.screen, GREEN, (unit["x"], unit["y"], 15, 12))
-                pygame.draw.rect(self.screen, DARK_GRAY, (unit["x"] + 3, unit["y"] - 3, 9, 3))  # Винтовка
-            elif unit["type"] == "tank":
-                pygame.draw.rect(self.screen, DARK_GRAY, (unit["x"], unit["y"], 20, 15))
-                pygame.draw.rect(self.screen, BLACK, (unit["x"] + 5, unit["y"] - 5, 15, 5))  # Пушка
-                pygame.draw.circle(self.screen, GREEN, (unit["x"] + 10, unit["y"] + 7), 3)  # Центр
-            
-            # Показываем выделение
-            if unit in self.selected_units:
-                pygame.draw.circle(self.screen, WHITE, (unit["x"], unit["y"]), 12, 2)
-            
-            # Показываем цель движения
-            if unit.get("move_target"):
-                target = unit["move_target"]
-                pygame.draw.line(self.screen, YELLOW, (unit["x"], unit["y"]), (target["x"], target["y"]), 2)
-                pygame.draw.circle(self.screen, YELLOW, (target["x"], target["y"]), 5, 2)
-        
-        # Вражеские юниты
-        for enemy in self.enemy_units:
-            if enemy["type"] == "marine":
-                pygame.draw.rect(self.screen, RED, (enemy["x"], enemy["y"], 15, 12))
-                pygame.draw.rect(self.screen, DARK_GRAY, (enemy["x"] + 3, enemy["y"] - 3, 9, 3))  # Винтовка
+        units = self.units
+        rows = self.viewport.visible_rows(units, margin=UNIT_SPRITE_RADIUS)
+        carrying = units.get_kinds(rows, "worker") & (units.carrying[rows] > 0)
+        self.batch.add_variants((units.kind[rows], carrying),
+                                lambda kind, carrying: self.get_unit_sprite(units.kind_names[kind], bool(carrying)),
+                                units.x[rows], units.y[rows])
+        self.batch.draw(self.screen)
+        sprite_size = np.full(len(rows), UNIT_SPRITE_RADIUS * 2)
+        self.renderer.mark_boxes(np.trunc(units.x[rows]) - UNIT_SPRITE_RADIUS,
+                                 np.trunc(units.y[rows]) - UNIT_SPRITE_RADIUS, sprite_size, sprite_size)
+        
+        # Показываем выделение
+        rows = units.rows()
+        selected = rows[(units.flags[rows] & ENTITY_SELECTED) != 0]
+        for x, y in zip(units.x[selected].tolist(), units.y[selected].tolist()):
+            draw.circle(self.screen, WHITE, (x, y), 12, 2)
+        
+        # Показываем цель движения
+        ordered = rows[(units.flags[rows] & ENTITY_ORDERED) != 0]
+        for x, y, target_x, target_y in zip(units.x[ordered].tolist(), units.y[ordered].tolist(),
+                                            units.order_x[ordered].tolist(), units.order_y[ordered].tolist()):
+            self.renderer.mark(draw.line(self.screen, YELLOW, (x, y), (target_x, target_y), 2))
+            self.renderer.mark(draw.circle(self.screen, YELLOW, (target_x, target_y), 5, 2))
+        
+        # Вражеские юниты (видны только бойцы)
+        enemies = self.enemy_units
+        rows = self.viewport.visible_rows(enemies, margin=UNIT_SPRITE_RADIUS)
+        rows = rows[enemies.get_kinds(rows, "marine")]
+        self.batch.add_many(self.get_unit_sprite("enemy_marine", False), enemies.x[rows], enemies.y[rows])
+        self.batch.draw(self.screen)
+        sprite_size = np.full(len(rows), UNIT_SPRITE_RADIUS * 2)
+        self.renderer.mark_boxes(np.trunc(enemies.x[rows]) - UNIT_SPRITE_RADIUS,
+                                 np.trunc(enemies.y[rows]) - UNIT_SPRITE_RADIUS, sprite_size, sprite_size)
         
         # UI стратегии в стиле StarCraft
         # Панель ресурсов
-        pygame.draw.rect(self.screen, BLACK, (10, 10, 300, 80))
-        pygame.draw.rect(self.screen, WHITE, (10, 10, 300, 80), 2)
+        draw.rect(self.screen, BLACK, (10, 10, 300, 80))
+        draw.rect(self.screen, WHITE, (10, 10, 300, 80), 2)
         
-        minerals_text = self.font_small.render(f"Минералы: {self.minerals}", True, CYAN)
-        self.screen.blit(minerals_text, (15, 15))
+        minerals_text = text_cache.render(self.font_small, f"Минералы: {self.minerals}", True, CYAN)
+        self.renderer.blit(self.screen, minerals_text, (15, 15))
         
-        supply_text = self.font_small.render(f"Население: {self.supply_used}/{self.supply_max}", True, WHITE)
-        self.screen.blit(supply_text, (15, 35))
+        supply_text = text_cache.render(self.font_small, f"Население: {self.supply_used}/{self.supply_max}", True, WHITE)
+        self.renderer.blit(self.screen, supply_text, (15, 35))
         
-        selected_text = self.font_small.render(f"Выбран: {self.selected_unit_type.upper()}", True, YELLOW)
-        self.screen.blit(selected_text, (15, 55))
+        selected_text = text_cache.render(self.font_small, f"Выбран: {self.selected_unit_type.upper()}", True, YELLOW)
+        self.renderer.blit(self.screen, selected_text, (15, 55))
         
         # Стоимость юнитов
         costs = {"worker": 50, "marine": 100, "tank": 150}
-        cost_text = self.font_small.render(f"Стоимость: {costs[self.selected_unit_type]}", True, WHITE)
-        self.screen.blit(cost_text, (15, 75))
+        cost_text = text_cache.render(self.font_small, f"Стоимость: {costs[self.selected_unit_type]}", True, WHITE)
+        self.renderer.blit(self.screen, cost_text, (15, 75))
         
         # Инструкции - размещаем внизу экрана
-        instruction1 = self.font_small.render("1-Рабочий(50), 2-Морпех(100), 3-Танк(150)", True, YELLOW)
+        instruction1 = text_cache.render(self.font_small, "1-Рабочий(50), 2-Морпех(100), 3-Танк(150)", True, YELLOW)
         self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 120))
-        instruction2 = self.font_small.render("ПРОБЕЛ - создать юнита", True, YELLOW)
+        instruction2 = text_cache.render(self.font_small, "ПРОБЕЛ - создать юнита", True, YELLOW)
         self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 100))
-        instruction3 = self.font_small.render("ЛКМ - выделить, ПКМ - приказ движения", True, YELLOW)
+        instruction3 = text_cache.render(self.font_small, "ЛКМ - выделить, ПКМ - приказ движения", True, YELLOW)
         self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 80))
-        instruction4 = self.font_small.render("ЦЕЛЬ: Уничтожить красную базу!", True, YELLOW)
+        instruction4 = text_cache.render(self.font_small, "ЦЕЛЬ: Уничтожить красную базу!", True, YELLOW)
         self.screen.blit(instruction4, (10, SCREEN_HEIGHT - 60))
     
-    def draw_final_mix(self):
-        # Финальный уровень - комбинация всех жанров
+    def draw_final_mix_space(self, surface):
         # Космический фон как в шутере
+        surface.fill(BLACK)
         for i in range(50):
             x = (i * 37) % SCREEN_WIDTH
             y = (i * 23) % SCREEN_HEIGHT
-            pygame.draw.circle(self.screen, WHITE, (x, y), 1)
+            draw.circle(surface, WHITE, (x, y), 1)
+    
+    def draw_final_mix(self):
+        # Финальный уровень - комбинация всех жанров
+        # Космический фон рисуется слоем в draw()
         
         # Игрок всегда видимый
         self.player.draw(self.screen, "shooter")
         
-        # Если есть ракеты - рисуем их
+        # Если есть ракеты и пули - рисуем их одним пакетом
         if hasattr(self, 'missiles'):
-            for missile in self.missiles:
-                missile.draw(self.screen)
+            missiles = self.missiles
+            rows = self.viewport.visible_rows(missiles, margin=5)
+            self.batch.add_many(get_missile_sprite(), missiles.x[rows], missiles.y[rows])
         
-        # Если есть пули - рисуем их
-        if hasattr(self, 'player_bullets'):
-            for bullet in self.player_bullets:
-                bullet.draw(self.screen)
+        self.projectiles.draw(self.batch, lambda bullet_type: get_player_bullet_sprite(),
+                              self.projectiles.add_owner(self.player), self.viewport)
+        self.batch.draw(self.screen)
         
         # Рисуем босса
         if hasattr(self, 'boss') and self.boss:
-            self.boss.draw(self.screen)
+            self.boss.draw(self.screen, self.batch)
+            self.batch.draw(self.screen)
         
         # Полоса здоровья игрока
         player_health_width = int((self.player.health / self.player.max_health) * 200)
-        pygame.draw.rect(self.screen, RED, (10, 50, 200, 15))
-        pygame.draw.rect(self.screen, GREEN, (10, 50, player_health_width, 15))
-        pygame.draw.rect(self.screen, WHITE, (10, 50, 200, 15), 2)
-        player_text = self.font_small.render("ИГРОК", True, WHITE)
+        draw.rect(self.screen, RED, (10, 50, 200, 15))
+        draw.rect(self.screen, GREEN, (10, 50, player_health_width, 15))
+        draw.rect(self.screen, WHITE, (10, 50, 200, 15), 2)
+        player_text = text_cache.render(self.font_small, "ИГРОК", True, WHITE)
         self.screen.blit(player_text, (10, 30))
         
         # Инструкции для финального уровня
-        instruction1 = self.font_small.render("ФИНАЛЬНЫЙ БОСС - УНИЧТОЖЬТЕ КРАСНЫЙ КОРАБЛЬ!", True, YELLOW)
+        instruction1 = text_cache.render(self.font_small, "ФИНАЛЬНЫЙ БОСС - УНИЧТОЖЬТЕ КРАСНЫЙ КОРАБЛЬ!", True, YELLOW)
         self.screen.blit(instruction1, (10, SCREEN_HEIGHT - 120))
-        instruction2 = self.font_small.render("WASD - движение, ПРОБЕЛ - стрельба", True, YELLOW)
+        instruction2 = text_cache.render(self.font_small, "WASD - движение, ПРОБЕЛ - стрельба", True, YELLOW)
         self.screen.blit(instruction2, (10, SCREEN_HEIGHT - 100))
-        instruction3 = self.font_small.render("Избегайте пуль босса! У него 3 фазы!", True, YELLOW)
+        instruction3 = text_cache.render(self.font_small, "Избегайте пуль босса! У него 3 фазы!", True, YELLOW)
         self.screen.blit(instruction3, (10, SCREEN_HEIGHT - 80))
     
     def draw_help(self):
@@ -4538,10 +6903,11 @@ class Game:
         button_color = (100, 200, 100) if self.help_expanded else (200, 100, 100)
         button_text = "СВЕРНУТЬ" if self.help_expanded else "ПОМОЩЬ"
         
-        pygame.draw.rect(self.screen, button_color, self.help_button_rect)
-        pygame.draw.rect(self.screen, WHITE, self.help_button_rect, 2)
+        draw.rect(self.screen, button_color, self.help_button_rect)
+        draw.rect(self.screen, WHITE, self.help_button_rect, 2)
+        self.renderer.mark(self.help_button_rect, self.help_expanded)
         
-        button_surface = self.font_small.render(button_text, True, WHITE)
+        button_surface = text_cache.render(self.font_small, button_text, True, WHITE)
         button_text_rect = button_surface.get_rect(center=self.help_button_rect.center)
         self.screen.blit(button_surface, button_text_rect)
         
@@ -4550,29 +6916,32 @@ class Game:
             # Тёмный фон для помощи - панель снизу
             help_height = min(350, SCREEN_HEIGHT - 80)
             help_bg_rect = pygame.Rect(140, SCREEN_HEIGHT - help_height - 50, SCREEN_WIDTH - 150, help_height)
-            pygame.draw.rect(self.screen, (0, 0, 0, 200), help_bg_rect)
-            pygame.draw.rect(self.screen, (100, 150, 200), help_bg_rect, 3)
+            self.renderer.mark(help_bg_rect, "help")
+            # Фон непрозрачный: под текстом помощи игра все равно не видна,
+            # а полупрозрачная панель на треть экрана заметно дороже
+            draw.rect(self.screen, BLACK, help_bg_rect)
+            draw.rect(self.screen, (100, 150, 200), help_bg_rect, 3)
             
             y_offset = SCREEN_HEIGHT - help_height - 30
             
             # Заголовок
-            title_surface = self.font.render(instructions["title"], True, (255, 255, 100))
+            title_surface = text_cache.render(self.font, instructions["title"], True, (255, 255, 100))
             self.screen.blit(title_surface, (150, y_offset))
             y_offset += 35
             
             # Цель
-            goal_surface = self.font_small.render(f"ЦЕЛЬ: {instructions['goal']}", True, (100, 255, 100))
+            goal_surface = text_cache.render(self.font_small, f"ЦЕЛЬ: {instructions['goal']}", True, (100, 255, 100))
             self.screen.blit(goal_surface, (150, y_offset))
             y_offset += 25
             
             # Управление
-            controls_title = self.font_small.render("УПРАВЛЕНИЕ:", True, (255, 200, 100))
+            controls_title = text_cache.render(self.font_small, "УПРАВЛЕНИЕ:", True, (255, 200, 100))
             self.screen.blit(controls_title, (150, y_offset))
             y_offset += 20
             
             for control in instructions["controls"]:
                 if y_offset < SCREEN_HEIGHT - 80:  # Проверяем, что не выходим за границы
-                    control_surface = self.font_small.render(f"• {control}", True, WHITE)
+                    control_surface = text_cache.render(self.font_small, f"• {control}", True, WHITE)
                     self.screen.blit(control_surface, (160, y_offset))
                     y_offset += 18
             
@@ -4580,7 +6949,7 @@ class Game:
             
             # Советы
             if y_offset < SCREEN_HEIGHT - 60:
-                tips_title = self.font_small.render("СОВЕТЫ:", True, (255, 200, 100))
+                tips_title = text_cache.render(self.font_small, "СОВЕТЫ:", True, (255, 200, 100))
                 self.screen.blit(tips_title, (150, y_offset))
                 y_offset += 20
                 
@@ -4588,51 +6957,41 @@ class Game:
                     if y_offset >= SCREEN_HEIGHT - 80:  # Не выходим за границы
                         break
                         
-                    # Разбиваем длинные строки
-                    if len(tip) > 65:  # Уменьшаем ширину для нижней панели
-                        words = tip.split(' ')
-                        line = ""
-                        for word in words:
-                            if len(line + word) > 65:
-                                if y_offset < SCREEN_HEIGHT - 80:
-                                    tip_surface = self.font_small.render(f"• {line}", True, (200, 200, 255))
-                                    self.screen.blit(tip_surface, (160, y_offset))
-                                    y_offset += 18
-                                line = word + " "
-                            else:
-                                line += word + " "
-                        if line and y_offset < SCREEN_HEIGHT - 80:
-                            tip_surface = self.font_small.render(f"• {line}", True, (200, 200, 255))
+                    # Разбиваем длинные строки (уменьшаем ширину для нижней панели)
+                    for line in text_cache.wrap(tip, 65):
+                        if y_offset < SCREEN_HEIGHT - 80:
+                            tip_surface = text_cache.render(self.font_small, f"• {line}", True, (200, 200, 255))
                             self.screen.blit(tip_surface, (160, y_offset))
                             y_offset += 18
-                    else:
-                        tip_surface = self.font_small.render(f"• {tip}", True, (200, 200, 255))
-                        self.screen.blit(tip_surface, (160, y_offset))
-                        y_offset += 18
 
     def draw_ui(self):
         # Счет
         if self.level_type == "puzzle":
-            score_text = self.font.render(f"Ходы: {self.player.moves}/{self.player.target_moves}", True, WHITE)
-            self.screen.blit(score_text, (10, 10))
-            keys_text = self.font.render(f"Ключи: {self.keys_collected}/{self.total_keys}", True, WHITE)
-            self.screen.blit(keys_text, (10, 50))
+            score_text = text_cache.render(self.font, f"Ходы: {self.player.moves}/{self.player.target_moves}", True, WHITE)
+            self.renderer.blit(self.screen, score_text, (10, 10))
+            keys_text = text_cache.render(self.font, f"Ключи: {self.keys_collected}/{self.total_keys}", True, WHITE)
+            self.renderer.blit(self.screen, keys_text, (10, 50))
         elif self.level_type == "racing":
             # UI для гонок уже отрисован в draw_racing()
             pass
         elif self.level_type == "rhythm":
-            score_text = self.font.render(f"Счет: {self.score}/500", True, WHITE)
-            self.screen.blit(score_text, (10, 10))
-            combo_text = self.font.render(f"Комбо: {self.combo} x{self.score_multiplier}", True, WHITE)
-            self.screen.blit(combo_text, (10, 50))
+            score_text = text_cache.render(self.font, f"Счет: {self.score}/500", True, WHITE)
+            self.renderer.blit(self.screen, score_text, (10, 10))
+            combo_text = text_cache.render(self.font, f"Комбо: {self.combo} x{self.score_multiplier}", True, WHITE)
+            self.renderer.blit(self.screen, combo_text, (10, 50))
         else:
-            score_text = self.font.render(f"Счет: {self.score}", True, WHITE)
-            self.screen.blit(score_text, (10, 10))
+            score_text = text_cache.render(self.font, f"Счет: {self.score}", True, WHITE)
+            self.renderer.blit(self.screen, score_text, (10, 10))
         
         # Тип уровня
-        level_text = self.font.render(f"Уровень {self.level}: {self.level_type.upper()}", True, WHITE)
+        level_text = text_cache.render(self.font, f"Уровень {self.level}: {self.level_type.upper()}", True, WHITE)
         self.screen.blit(level_text, (10, SCREEN_HEIGHT - 40))
         
+        # Текущее качество декоративной отрисовки
+        quality_text = text_cache.render(self.font_small, f"Качество: {quality.get_name()}", True, GRAY)
+        self.renderer.blit(self.screen, quality_text,
+                           (SCREEN_WIDTH // 2 - quality_text.get_width() // 2, SCREEN_HEIGHT - 22))
+        
         # Обозначение игрока на каждом уровне
         player_indicators = {
             "shooter": "ВЫ - СЕРЕБРИСТЫЙ КОСМИЧЕСКИЙ ИСТРЕБИТЕЛЬ",
@@ -4648,29 +7007,245 @@ class Game:
         }
         
         if self.level_type in player_indicators:
-            indicator_text = self.font_small.render(player_indicators[self.level_type], True, CYAN)
+            indicator_text = text_cache.render(self.font_small, player_indicators[self.level_type], True, CYAN)
             self.screen.blit(indicator_text, (SCREEN_WIDTH - indicator_text.get_width() - 10, 10))
         
         # Сообщения о завершении
         if self.game_over:
-            game_over_text = self.font.render("ПОРАЖЕНИЕ! R - перезапуск, ESC - меню", True, RED)
+            game_over_text = text_cache.render(self.font, "ПОРАЖЕНИЕ! R - перезапуск, ESC - меню", True, RED)
             text_rect = game_over_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
-            self.screen.blit(game_over_text, text_rect)
+            self.renderer.blit(self.screen, game_over_text, text_rect)
         
         if self.level_complete:
-            victory_text = self.font.render("УРОВЕНЬ ПРОЙДЕН! ENTER - продолжить, ESC - меню", True, GREEN)
+            victory_text = text_cache.render(self.font, "УРОВЕНЬ ПРОЙДЕН! ENTER - продолжить, ESC - меню", True, GREEN)
             text_rect = victory_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
-            self.screen.blit(victory_text, text_rect)
+            self.renderer.blit(self.screen, victory_text, text_rect)
+    
+    def run_ticks(self, count, input_source=None):
+        # count тиков подряд без окна и часов. input_source - снимок на все тики,
+        # функция (номер тика, игра) -> снимок или None (без ввода).
+        # Останавливается раньше, если уровень проигран или пройден
+        ticks = 0
+        while ticks < count and not (self.game_over or self.level_complete):
+            if input_source is None:
+                snapshot = InputSnapshot()
+            elif isinstance(input_source, InputSnapshot):
+                snapshot = input_source
+            else:
+                snapshot = input_source(ticks, self)
+            self.step(snapshot)
+            ticks += 1
+        return ticks
+    
+    def save_state(self):
+        # Полное состояние уровня (игрок, объекты, боссы, таймеры, волны, генераторы
+        # случайных чисел) в компактном двоичном виде
+        state = {name: value for name, value in self.__dict__.items() if name not in SNAPSHOT_SKIP}
+        state["rng"] = self.rng
+        return encode_snapshot(self.level, state)
+    
+    def load_state(self, data):
+        # Обратное к save_state(); снимок должен быть сделан на этом же уровне
+        level, state = decode_snapshot(data)
+        if level != self.level:
+            raise ValueError(f"Снимок уровня {level}, а загружен уровень {self.level}")
+        for name in list(self.__dict__):
+            if name not in RESTART_KEEP and name not in state:
+                del self.__dict__[name]
+        self.__dict__.update(state)
+        self.renderer.invalidate()
+    
+    def quicksave(self, path=QUICKSAVE_FILE):
+        data = self.save_state()
+        # Пишем во временный файл и подменяем: прерванная запись не портит прошлое сохранение
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    
+    def quickload(self, path=QUICKSAVE_FILE):
+        with open(path, "rb") as f:
+            self.load_state(f.read())
     
     def restart(self):
-        self.__init__(self.level)
+        # Уровень не собирается заново: состояние копируется из снимка, сделанного
+        # после загрузки, а окно, шрифты и слои фона остаются прежними
+        state = copy.deepcopy(self.pristine, self.get_shared_memo())
+        for name in list(self.__dict__):
+            if name not in RESTART_KEEP and name not in state:
+                del self.__dict__[name]
+        self.__dict__.update(state)
+        self.setup_random()
+        self.renderer.invalidate()
+    
+    def get_moving_entities(self):
+        # Объекты, положение которых сглаживается между тиками симуляции
+        entities = [self.player]
+        for name in INTERPOLATED_LISTS:
+            entities.extend(getattr(self, name, ()))
+        for name in ('boss', 'tower_defense_boss'):
+            boss = getattr(self, name, None)
+            if boss:
+                entities.append(boss)
+        return entities
+    
+    def get_entity_stores(self):
+        return [getattr(self, name) for name in ENTITY_STORES if hasattr(self, name)]
+    
+    def save_positions(self):
+        # Запоминаем положения перед тиком, чтобы рисовать промежуточные кадры
+        self.previous_positions = {}
+        for entity in self.get_moving_entities():
+            x, y = get_position(entity)
+            self.previous_positions[id(entity)] = (entity, x, y)
+        for store in self.get_entity_stores():
+            store.save_positions()
+        self.previous_camera_y = getattr(self, 'camera_y', None)
+    
+    def draw_interpolated(self, alpha):
+        # Рисуем кадр между предыдущим и текущим тиком (alpha от 0 до 1)
+        previous = getattr(self, 'previous_positions', None)
+        if not previous or alpha <= 0:
+            self.draw()
+            return
+        
+        moved = []
+        for entity in self.get_moving_entities():
+            saved = previous.get(id(entity))
+            if saved is None or saved[0] is not entity:
+                continue  # Объект появился на этом тике
+            x, y = get_position(entity)
+            prev_x, prev_y = saved[1], saved[2]
+            if (x == prev_x and y == prev_y) or \
+               abs(x - prev_x) > TELEPORT_DISTANCE or abs(y - prev_y) > TELEPORT_DISTANCE:
+                continue
+            set_position(entity, prev_x + (x - prev_x) * alpha, prev_y + (y - prev_y) * alpha)
+            moved.append((entity, x, y))
+        moved_rows = [(store, store.interpolate(alpha)) for store in self.get_entity_stores()]
+        
+        camera_y = getattr(self, 'camera_y', None)
+        if camera_y is not None and self.previous_camera_y is not None:
+            self.camera_y = self.previous_camera_y + (camera_y - self.previous_camera_y) * alpha
+        
+        try:
+            self.draw()
+        finally:
+            # Возвращаем настоящие положения - логика работает только с ними
+            for entity, x, y in moved:
+                set_position(entity, x, y)
+            for store, rows in moved_rows:
+                store.restore(rows)
+            if camera_y is not None:
+                self.camera_y = camera_y
+    
+    def get_telemetry(self):
+        # Сводка о производительности для отладки и замеров
+        return {
+            "fps": self.clock.get_fps(),
+            "frame_ms": self.clock.get_rawtime(),
+            "quality": quality.get_stats(),
+            "text_cache": text_cache.get_stats(),
+            "sprites": {"hits": sprites.hits, "misses": sprites.misses},
+            "culled": self.viewport.culled,
+            "recorder": recorder.get_stats(),
+        }
+    
+    def handle_event(self, event):
+        # Игровое событие из снимка тика (InputEvent, координаты мыши - холста)
+        if event.type == pygame.KEYDOWN:
+            # Пошаговое движение для головоломки
+            if self.level_type == "puzzle" and not self.game_over and not self.level_complete:
+                moved = False
+                if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                    if self.player.x > 40:
+                        self.player.x -= 40
+                        moved = True
+                elif event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                    if self.player.x < SCREEN_WIDTH - 80:
+                        self.player.x += 40
+                        moved = True
+                elif event.key == pygame.K_UP or event.key == pygame.K_w:
+                    if self.player.y > 40:
+                        self.player.y -= 40
+                        moved = True
+                elif event.key == pygame.K_DOWN or event.key == pygame.K_s:
+                    if self.player.y < SCREEN_HEIGHT - 80:
+                        self.player.y += 40
+                        moved = True
+                
+                if moved:
+                    self.player.moves += 1
+            
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            mouse_x, mouse_y = event.pos
+            
+            # Проверяем клик по кнопке помощи
+            if event.button == 1 and self.help_button_rect.collidepoint(mouse_x, mouse_y):
+                self.help_expanded = not self.help_expanded
+            
+            elif self.level_type == "tower_defense":
+                if event.button == 1:  # Левая кнопка мыши - строительство башни
+                    tower = Tower(0, 0, self.selected_tower_type)
+                    if self.money >= tower.cost:
+                        # Ищем ближайшее валидное место
+                        closest_spot = None
+                        min_distance = float('inf')
+                        
+                        for spot in self.valid_build_spots:
+                            if not spot["occupied"]:
+                                distance = math.sqrt((mouse_x - spot["x"])**2 + (mouse_y - spot["y"])**2)
+                                if distance < min_distance and distance < 50:  # В радиусе 50 пикселей
+                                    min_distance = distance
+                                    closest_spot = spot
+                        
+                        if closest_spot:
+                            new_tower = Tower(closest_spot["x"], closest_spot["y"], self.selected_tower_type,
+                                              self.projectiles)
+                            self.towers.append(new_tower)
+                            self.money -= new_tower.cost
+                            closest_spot["occupied"] = True
+                
+                elif event.button == 3:  # Правая кнопка мыши - улучшение башни
+                    for tower in self.towers:
+                        tower_rect = tower.get_rect()
+                        if tower_rect.collidepoint(mouse_x, mouse_y):
+                            if tower.can_upgrade():
+                                upgrade_cost = 25 + tower.level * 15
+                                if self.money >= upgrade_cost:
+                                    tower.upgrade()
+                                    self.money -= upgrade_cost
+                            break
+            
+            elif self.level_type == "strategy":
+                units = self.units
+                rows = units.rows()
+                if event.button == 1:  # Левая кнопка мыши
+                    # Выделяем юнита под курсором (первого, если их несколько)
+                    units.flags[rows] &= ~ENTITY_SELECTED
+                    clicked = units.hits((mouse_x, mouse_y, 1, 1), rows)
+                    units.flags[clicked[:1]] |= ENTITY_SELECTED
+                
+                elif event.button == 3:  # Правая кнопка мыши
+                    # Командуем выделенным боевым юнитам
+                    ordered = rows[((units.flags[rows] & ENTITY_SELECTED) != 0) & ~units.get_kinds(rows, "worker")]
+                    units.flags[ordered] |= ENTITY_ORDERED
+                    units.order_x[ordered] = mouse_x
+                    units.order_y[ordered] = mouse_y
     
     def run(self):
         running = True
+        # Симуляция идет фиксированными тиками, отрисовка - с любой частотой
+        tick_ms = 1000.0 / settings.tick_rate
+        accumulator = 0.0
+        self.clock.tick()
         while running:
-            for event in pygame.event.get():
+            # Управление сессией обрабатывается сразу, игровые события
+            # попадают в снимок ближайшего тика и разбираются в step()
+            for event in input_state.pump():
                 if event.type == pygame.QUIT:
                     return 'quit'
+                elif event.type == pygame.VIDEOEXPOSE:
+                    # Окно перерисовано системой - выводим кадр целиком
+                    self.renderer.invalidate()
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         return 'menu'
@@ -4678,111 +7253,69 @@ class Game:
                         self.restart()
                     elif event.key == pygame.K_RETURN and self.level_complete:
                         return 'next_level'
-                    
-                    # Пошаговое движение для головоломки
-                    elif self.level_type == "puzzle" and not self.game_over and not self.level_complete:
-                        moved = False
-                        if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                            if self.player.x > 40:
-                                self.player.x -= 40
-                                moved = True
-                        elif event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                            if self.player.x < SCREEN_WIDTH - 80:
-                                self.player.x += 40
-                                moved = True
-                        elif event.key == pygame.K_UP or event.key == pygame.K_w:
-                            if self.player.y > 40:
-                                self.player.y -= 40
-                                moved = True
-                        elif event.key == pygame.K_DOWN or event.key == pygame.K_s:
-                            if self.player.y < SCREEN_HEIGHT - 80:
-                                self.player.y += 40
-                                moved = True
-                        
-                        if moved:
-                            self.player.moves += 1
-                    
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    mouse_x, mouse_y = pygame.mouse.get_pos()
-                    
-                    # Проверяем клик по кнопке помощи
-                    if event.button == 1 and self.help_button_rect.collidepoint(mouse_x, mouse_y):
-                        self.help_expanded = not self.help_expanded
-                    
-                    elif self.level_type == "tower_defense":
-                        mouse_x, mouse_y = pygame.mouse.get_pos()
-                        
-                        if event.button == 1:  # Левая кнопка мыши - строительство башни
-                            tower = Tower(0, 0, self.selected_tower_type)
-                            if self.money >= tower.cost:
-                                # Ищем ближайшее валидное место
-                                closest_spot = None
-                                min_distance = float('inf')
-                                
-                                for spot in self.valid_build_spots:
-                                    if not spot["occupied"]:
-                                        distance = math.sqrt((mouse_x - spot["x"])**2 + (mouse_y - spot["y"])**2)
-                                        if distance < min_distance and distance < 50:  # В радиусе 50 пикселей
-                                            min_distance = distance
-                                            closest_spot = spot
-                                
-                                if closest_spot:
-                                    new_tower = Tower(closest_spot["x"], closest_spot["y"], self.selected_tower_type)
-                                    self.towers.append(new_tower)
-                                    self.money -= new_tower.cost
-                                    closest_spot["occupied"] = True
-                        
-                        elif event.button == 3:  # Правая кнопка мыши - улучшение башни
-                            for tower in self.towers:
-                                tower_rect = tower.get_rect()
-                                if tower_rect.collidepoint(mouse_x, mouse_y):
-                                    if tower.can_upgrade():
-                                        upgrade_cost = 25 + tower.level * 15
-                                        if self.money >= upgrade_cost:
-                                            tower.upgrade()
-                                            self.money -= upgrade_cost
-                                    break
-                    
-                    elif self.level_type == "strategy":
-                        mouse_x, mouse_y = pygame.mouse.get_pos()
-                        
-                        if event.button == 1:  # Левая кнопка мыши
-                            # Выделяем юнитов
-                            self.selected_units = []
-                            for unit in self.units:
-                                unit_rect = pygame.Rect(unit["x"] - 10, unit["y"] - 10, 20, 20)
-                                if unit_rect.collidepoint(mouse_x, mouse_y):
-                                    self.selected_units.append(unit)
-                                    break
-                        
-                        elif event.button == 3:  # Правая кнопка мыши
-                            # Командуем выделенным юнитам
-                            for unit in self.selected_units:
-                                if unit["type"] in ["marine", "tank"]:
-                                    unit["move_target"] = {"x": mouse_x, "y": mouse_y}
-            
-            self.update()
-            self.draw()
-            self.clock.tick(FPS)
+                    elif event.key == pygame.K_F5:
+                        try:
+                            self.quicksave()
+                        except OSError as error:
+                            print(f"Не удалось сохранить уровень: {error}")
+                    elif event.key == pygame.K_F9:
+                        try:
+                            self.quickload()
+                        except (OSError, ValueError) as error:
+                            print(f"Не удалось загрузить уровень: {error}")
+            
+            accumulator += self.clock.tick(settings.render_fps)
+            # Время работы прошлого кадра без ожидания - по нему подбирается качество
+            quality.record(self.clock.get_rawtime())
+            ticks = 0
+            while accumulator >= tick_ms and ticks < MAX_TICKS_PER_FRAME:
+                self.save_positions()
+                self.update()
+                accumulator -= tick_ms
+                ticks += 1
+            if ticks == MAX_TICKS_PER_FRAME:
+                # Не успеваем - отбрасываем отставание, чтобы не уйти в догонялки
+                accumulator = min(accumulator, tick_ms)
+            
+            if settings.interpolate:
+                self.draw_interpolated(accumulator / tick_ms)
+            else:
+                self.draw()
+            recorder.capture(display.canvas)
 
 class GameManager:
     def __init__(self):
+        # Создаем экран только ОДИН раз с правильными флагами!
+        self.screen = display.open()
+        input_state.setup()
+        if settings.record:
+            recorder.start(display.canvas, settings.record, settings.record_format)
+        # Загружаем все шрифты заранее, чтобы не парсить их во время игры
+        fonts.preload(FONT_SIZES)
         self.progress = GameProgress()
         self.menu = Menu(self.progress)
         self.current_state = 'menu'
         self.current_level = 1
-        self.clock = pygame.time.Clock()
-        # Создаем экран только ОДИН раз с правильными флагами!
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.DOUBLEBUF)
+        self.menu_redraw = True
         pygame.display.set_caption("Мульти-жанровая игра")
         
     def run(self):
         running = True
         while running:
             if self.current_state == 'menu':
-                for event in pygame.event.get():
+                # Меню выводится на экран только когда что-то изменилось
+                if self.menu_redraw or self.menu.needs_redraw():
+                    self.menu.draw(self.screen)
+                    display.present()
+                    self.menu_redraw = False
+                
+                # Ждем событий вместо опроса 60 раз в секунду - в простое меню не грузит процессор
+                events = [pygame.event.wait(MENU_IDLE_TIMEOUT)] + pygame.event.get()
+                for event in events:
                     if event.type == pygame.QUIT:
                         running = False
+                    elif event.type == pygame.VIDEOEXPOSE:
+                        self.menu_redraw = True
                     elif event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_ESCAPE:
                             running = False
@@ -4792,15 +7325,13 @@ class GameManager:
                                 self.current_level = selected_level
                                 self.current_state = 'game'
                 
-                # Используем уже созданный экран
-                self.menu.draw(self.screen)
-                pygame.display.update()  # Более стабильная альтернатива flip()
-                self.clock.tick(FPS)
-                
             elif self.current_state == 'game':
                 game = Game(self.current_level)
                 result = game.run()
                 
+                # Игра рисовала поверх меню - после возврата выводим его заново
+                self.menu_redraw = True
+                
                 if result == 'quit':
                     running = False
                 elif result == 'menu':
@@ -4816,9 +7347,77 @@ class GameManager:
                         # Игра пройдена полностью
                         self.current_state = 'menu'
         
+        if recorder.active:
+            recorder.stop()
+            stats = recorder.get_stats()
+            print(f"Записано кадров: {stats['written']}, пропущено: {stats['dropped']}")
         pygame.quit()
         sys.exit()
 
+def run_benchmark(frames, levels=None, frames_dir=None):
+    # Прогоняет уровни без окна и меряет время update() и draw();
+    # последний кадр каждого уровня можно сохранить для сравнения с эталоном
+    if frames_dir:
+        os.makedirs(frames_dir, exist_ok=True)
+    results = []
+    # Без --seed бенчмарк все равно воспроизводим: зерно 0
+    seed = settings.seed if settings.seed is not None else 0
+    for level in levels or range(1, 11):
+        game = Game(level, seed)
+        update_time = 0.0
+        draw_time = 0.0
+        for _ in range(frames):
+            start = time.perf_counter()
+            game.update()
+            middle = time.perf_counter()
+            game.draw()
+            draw_time += time.perf_counter() - middle
+            update_time += middle - start
+        update_ms = update_time * 1000 / frames
+        draw_ms = draw_time * 1000 / frames
+        results.append((level, game.level_type, update_ms, draw_ms))
+        print(f"Уровень {level:2d} {game.level_type:14s} update {update_ms:6.2f} мс  draw {draw_ms:6.2f} мс")
+        if frames_dir:
+            pygame.image.save(display.canvas, os.path.join(frames_dir, f"level_{level:02d}.png"))
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Мульти-жанровая игра")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="обновлять на дисплее только изменившиеся области экрана")
+    parser.add_argument("--fps", type=int, default=FPS,
+                        help="ограничение частоты отрисовки (0 - без ограничения)")
+    parser.add_argument("--no-interpolation", action="store_true",
+                        help="не сглаживать движение между тиками симуляции")
+    parser.add_argument("--window-scale", type=float, default=1.0,
+                        help="размер окна относительно игрового холста 800x600 (например 2 или 1.5)")
+    parser.add_argument("--render-scale", type=float, default=1.0,
+                        help="внутреннее разрешение относительно 800x600 (например 0.5 или 0.75): "
+                             "меньше пикселей на кадр, картинка растягивается до окна")
+    parser.add_argument("--scale-mode", choices=("integer", "smooth"), default="integer",
+                        help="масштабирование холста: integer - целый масштаб без сглаживания, smooth - сглаженное")
+    parser.add_argument("--headless", action="store_true",
+                        help="без окна (SDL dummy): для бенчмарков и сравнения кадров")
+    parser.add_argument("--benchmark", type=int, default=0, metavar="FRAMES",
+                        help="прогнать каждый уровень FRAMES кадров и вывести время update/draw")
+    parser.add_argument("--frames-dir", default=None,
+                        help="куда сохранить последний кадр каждого уровня в режиме --benchmark")
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="записывать игру: каталог для PNG или файл для сырых кадров (- для stdout)")
+    parser.add_argument("--record-format", choices=("png", "raw"), default="png",
+                        help="формат записи: последовательность PNG или сырые кадры в формате пикселей экрана (для ffmpeg -f rawvideo)")
+    parser.add_argument("--quality", choices=("auto",) + tuple(QUALITY_OPTIONS), default="auto",
+                        help="качество декоративной отрисовки (auto - подбирается по времени кадра)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="зерно случайных чисел: с одним зерном уровни проходят одинаково (для бенчмарков и повторов)")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+    settings.apply_args(args)
+    quality.configure(settings.quality)
+    if args.benchmark:
+        run_benchmark(args.benchmark, frames_dir=args.frames_dir)
+        sys.exit()
     game_manager = GameManager()
     game_manager.run()